@@ -1,25 +1,187 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 from datetime import datetime, date, time, timedelta
 import base64
+import hashlib
+import io
+import json
+import os
 from pathlib import Path
 import re
 import pytz
+import streamlit.components.v1 as components
+from PIL import Image, ImageOps
 import html
 import time as time_module
-
-API_BASE = "https://dashboard-backend-qqmi.onrender.com"
+import threading
+import sqlite3
+import uuid
+import random
+import logging
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import cProfile
+import pstats
+from dataclasses import dataclass, replace
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, wait
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+API_BASE = st.secrets.get("api_base", os.environ.get("AMI_API_BASE", "https://dashboard-backend-qqmi.onrender.com"))
 MAKE_WEBHOOK_URL = st.secrets.get("make_webhook_url", "")
 
+# Per-contact HTTP fan-out
+FANOUT_WORKERS = int(st.secrets.get("fanout_workers", 8))
+FANOUT_DEADLINE = float(st.secrets.get("fanout_deadline", 10))   # seconds one fan-out may take
+
+# Keep-alive connection pools (one per upstream)
+HTTP_POOL_SIZE = int(st.secrets.get("http_pool_size", 20))
+WEBHOOK_POOL_SIZE = int(st.secrets.get("webhook_pool_size", 4))
+
+# Circuit breaker: consecutive failures before a host is skipped, and seconds until it is probed again
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# Endpoint discovery: errors before a remembered endpoint is probed again,
+# and seconds before an endpoint found missing is tried again
+API_SHAPE_RECHECK_ERRORS = 3
+API_SHAPE_RECHECK_UNSUPPORTED = 600
+
+# Read cache (shared by all sessions): seconds each backend read stays fresh
+CACHE_TTLS = {
+    "contacts": 60,
+    "conversation": 15,
+    "conversation_poll": 2,     # open-chat sync reads, shared by sessions watching the same chat
+    "follow_up_counts": 30,
+}
+CACHE_SWEEP_INTERVAL = 30    # seconds between sweeps of expired read cache entries
+CACHE_MAX_ENTRIES = 5000     # read cache entries kept per process; the oldest go first past this
+
+# Where cached reads live: "memory" (this process only), "sqlite" (shared by the
+# worker processes of one host) or "redis" (shared by every host; needs redis-py)
+CACHE_BACKEND = st.secrets.get("cache_backend", "memory")
+CACHE_PATH = st.secrets.get("cache_path", "cache.sqlite3")
+REDIS_URL = st.secrets.get("redis_url", "redis://localhost:6379/0")
+CACHE_SCHEMA_VERSION = 1     # part of every shared key; bump when the shape of cached values changes
+CACHE_RETRY_INTERVAL = 30    # seconds an unreachable shared cache is bypassed before it is tried again
+
+# Outbox: local queue of outgoing WhatsApp messages, drained by a background worker
+OUTBOX_PATH = st.secrets.get("outbox_path", "outbox.sqlite3")
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_POLL_INTERVAL = 2     # seconds the worker sleeps when the queue is empty
+# Seconds before a claimed-but-unfinished job may be claimed again. Well past
+# the longest a claim is held: a webhook POST (one attempt, 35 s) or a log
+# batch (three attempts with backoff, about 106 s), plus the token bucket wait.
+OUTBOX_LEASE = 300
+# Webhook throughput shared by all sends of this process (WhatsApp tier / Make plan limits)
+BROADCAST_RATE = float(st.secrets.get("broadcast_rate", 1.0))   # messages per second
+BROADCAST_BURST = int(st.secrets.get("broadcast_burst", 5))
+LOG_BATCH_SIZE = 50          # sent messages written to the backend per /log_messages call
+LOG_FLUSH_INTERVAL = 5       # seconds a sent message may wait for its batch while sends keep coming
+
+# Admin-only debug panel in the Streamlit sidebar
+DEBUG_PANEL = bool(st.secrets.get("debug_panel", False))
+# Request instrumentation: latency histogram bucket bounds (seconds) and script runs kept per session
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HTTP_RERUN_HISTORY = 20
+# Phase profiler: reruns kept per session for the p50/p95 overlay, functions listed by cProfile
+PROFILE_HISTORY = 50
+CPROFILE_TOP = 40
+
 # Define IST timezone
 IST = pytz.timezone('Asia/Kolkata')
 
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a section of the rerun: wall time plus the requests and bytes it made,
+    recorded in this session's current rerun profile. A phase already in the
+    profile means a fragment is rerunning on its own, which starts a new one.
+    """
+    run = st.session_state.get("phase_run")
+    if run is None:
+        yield
+        return
+    if name in run["phases"]:
+        st.session_state.phase_runs.append(run)
+        run = {"started": time_module.time(), "phases": {}, "fragment": True}
+        st.session_state.phase_run = run
+
+    http = st.session_state.get("http_rerun") or {"requests": 0, "bytes": 0}
+    requests_before, bytes_before = http["requests"], http["bytes"]
+    started = time_module.perf_counter()
+    try:
+        yield
+    finally:
+        run["phases"][name] = {
+            "seconds": time_module.perf_counter() - started,
+            "requests": http["requests"] - requests_before,
+            "bytes": http["bytes"] - bytes_before,
+        }
+
+
+def profiled(name: str):
+    """Decorator form of phase() for functions that run as fragments."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_rerun_profile():
+    """Close the previous rerun's request and phase figures and start this one's."""
+    state = st.session_state
+    # Requests made by this script run and the fragment reruns after it (debug panel)
+    if "http_reruns" not in state:
+        state.http_reruns = deque(maxlen=HTTP_RERUN_HISTORY)
+    if "http_rerun" in state:
+        state.http_reruns.append(state.http_rerun)
+    state.http_rerun = {"requests": 0, "bytes": 0, "seconds": 0.0}
+
+    if "phase_runs" not in state:
+        state.phase_runs = deque(maxlen=PROFILE_HISTORY)
+    if state.get("phase_run", {}).get("phases"):
+        state.phase_runs.append(state.phase_run)
+    state.phase_run = {"started": time_module.time(), "phases": {}, "fragment": False}
+
+    # A capture from a rerun that stopped before the end of the page is dropped
+    stale = state.pop("cprofile_active", None)
+    if stale is not None:
+        stale.disable()
+    if DEBUG_PANEL and state.pop("cprofile_next", False):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        state.cprofile_active = profiler
+
+
+def finish_cprofile():
+    """Stop an opt-in cProfile capture of this rerun and keep its report for the overlay."""
+    profiler = st.session_state.pop("cprofile_active", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(CPROFILE_TOP)
+    st.session_state.cprofile_report = out.getvalue()
+
 
 def check_password():
     """Simple password gate using Streamlit secrets"""
 
     def password_entered():
         """Checks whether the password entered by the user is correct."""
+        if "password" not in st.session_state:
+            return  # a rerun straight after login resent the field already cleared below
         if st.session_state["password"] == st.secrets["dashboard_password"]:
             st.session_state["password_correct"] = True
             del st.session_state["password"]
@@ -41,9 +203,11 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="collapsed"
 )
-check_password()
+start_rerun_profile()
+with phase("password gate"):
+    check_password()
 
-# Initialize theme in session state
+# Initialize theme in session state (the default; switching happens in the browser)
 if "theme" not in st.session_state:
     st.session_state.theme = "dark"
 
@@ -78,13 +242,76 @@ def get_base64_logo():
     return None
 
 
-def get_css(theme):
-    if theme == "dark":
-        return """
-        <style>
-            /* WhatsApp Web Dark Theme */
+# Both themes as CSS custom properties; <html data-ami-theme="..."> picks one in the browser
+THEME_VARIABLES = {
+    "dark": {
+        "app-bg": "#0d1418",
+        "panel-bg": "#202c33",
+        "card-bg": "#202c33",
+        "surface": "#111b21",
+        "border": "#2a3942",
+        "divider": "#222d34",
+        "hover-bg": "#2a3942",
+        "text": "#e9edef",
+        "text-muted": "#8696a0",
+        "on-accent": "#111b21",
+        "chat-overlay": "rgba(10, 20, 25, 0.95)",
+        "bubble-out-bg": "#005c4b",
+        "bubble-in-border": "none",
+        "message-text": "#e9edef",
+        "message-meta": "rgba(255, 255, 255, 0.6)",
+        "notes-rule": "rgba(255, 255, 255, 0.1)",
+        "handler-text": "rgba(255, 255, 255, 0.6)",
+        "input-bg": "#2a3942",
+        "input-border": "#3b4a54",
+        "scrollbar-track": "#111b21",
+        "scrollbar-thumb": "#374045",
+        "scrollbar-thumb-hover": "#3b4a54",
+    },
+    "light": {
+        "app-bg": "#eae6df",
+        "panel-bg": "#f0f2f5",
+        "card-bg": "#ffffff",
+        "surface": "#ffffff",
+        "border": "#dddfe2",
+        "divider": "#f0f2f5",
+        "hover-bg": "#e4e6eb",
+        "text": "#3b4a54",
+        "text-muted": "#667781",
+        "on-accent": "white",
+        "chat-overlay": "rgba(234, 230, 223, 0.85)",
+        "bubble-out-bg": "#dcf8c6",
+        "bubble-in-border": "1px solid #e0e0e0",
+        "message-text": "#303030",
+        "message-meta": "rgba(0, 0, 0, 0.45)",
+        "notes-rule": "rgba(0, 0, 0, 0.1)",
+        "handler-text": "#303030",
+        "input-bg": "#ffffff",
+        "input-border": "#dddfe2",
+        "scrollbar-track": "#f0f2f5",
+        "scrollbar-thumb": "#bcc0c4",
+        "scrollbar-thumb-hover": "#a0a4a8",
+    },
+}
+
+
+def get_theme_variables_css() -> str:
+    """Custom property blocks for every theme; dark is also the default."""
+    blocks = []
+    for theme, variables in THEME_VARIABLES.items():
+        selector = f':root[data-ami-theme="{theme}"]'
+        if theme == "dark":
+            selector = f":root, {selector}"
+        body = "\n".join(f"    --ami-{name}: {value};" for name, value in variables.items())
+        blocks.append(f"{selector} {{\n{body}\n}}")
+    return "\n".join(blocks)
+
+
+def get_css():
+    return "<style>\n" + get_theme_variables_css() + """
+            /* WhatsApp Web theme, coloured by the --ami-* custom properties above */
             .main {
-                background: linear-gradient(180deg, #0d1418 0%, #0d1418 100%);
+                background: linear-gradient(180deg, var(--ami-app-bg) 0%, var(--ami-app-bg) 100%);
                 padding: 0 !important;
             }
             
@@ -97,12 +324,12 @@ def get_css(theme):
             
             /* WhatsApp Header */
             .main-header {
-                background: #202c33;
+                background: var(--ami-panel-bg);
                 padding: 10px 16px;
                 display: flex;
                 align-items: center;
                 gap: 15px;
-                border-bottom: 1px solid #2a3942;
+                border-bottom: 1px solid var(--ami-border);
                 position: sticky;
                 top: 0;
                 z-index: 999;
@@ -110,7 +337,7 @@ def get_css(theme):
             }
             
             .main-header h1 {
-                color: #e9edef;
+                color: var(--ami-text);
                 margin: 0;
                 font-size: 16px;
                 font-weight: 500;
@@ -123,13 +350,13 @@ def get_css(theme):
                 height: 40px;
                 border-radius: 50%;
                 object-fit: cover;
-                border: 1px solid #2a3942;
+                border: 1px solid var(--ami-border);
             }
             
             /* Filter section */
             .filter-container {
-                background-color: #111b21;
-                border: 1px solid #2a3942;
+                background-color: var(--ami-surface);
+                border: 1px solid var(--ami-border);
                 border-radius: 8px;
                 padding: 0;
                 margin-bottom: 12px;
@@ -138,17 +365,17 @@ def get_css(theme):
             }
             
             .filter-header {
-                background-color: #202c33;
+                background-color: var(--ami-panel-bg);
                 padding: 12px 16px;
                 display: flex;
                 justify-content: space-between;
                 align-items: center;
                 cursor: pointer;
-                border-bottom: 1px solid #2a3942;
+                border-bottom: 1px solid var(--ami-border);
             }
             
             .filter-header h3 {
-                color: #e9edef;
+                color: var(--ami-text);
                 margin: 0;
                 font-size: 14px;
                 font-weight: 500;
@@ -174,7 +401,7 @@ def get_css(theme):
             }
             
             .filter-group label {
-                color: #8696a0;
+                color: var(--ami-text-muted);
                 font-size: 12px;
                 margin-bottom: 4px;
                 display: block;
@@ -186,7 +413,7 @@ def get_css(theme):
                 background-color: transparent;
                 padding: 12px;
                 cursor: pointer;
-                border-bottom: 1px solid #222d34;
+                border-bottom: 1px solid var(--ami-divider);
                 transition: background-color 0.2s;
                 position: relative;
                 display: flex;
@@ -196,11 +423,11 @@ def get_css(theme):
             }
             
             .contact-card:hover {
-                background-color: #202c33;
+                background-color: var(--ami-panel-bg);
             }
             
             .contact-card.selected {
-                background-color: #2a3942;
+                background-color: var(--ami-hover-bg);
             }
             
             .contact-avatar {
@@ -224,7 +451,7 @@ def get_css(theme):
             }
             
             .contact-name {
-                color: #e9edef;
+                color: var(--ami-text);
                 font-size: 17px;
                 font-weight: 400;
                 margin-bottom: 2px;
@@ -235,7 +462,7 @@ def get_css(theme):
             }
             
             .contact-preview {
-                color: #8696a0;
+                color: var(--ami-text-muted);
                 font-size: 14px;
                 white-space: nowrap;
                 overflow: hidden;
@@ -251,14 +478,14 @@ def get_css(theme):
             }
             
             .contact-time {
-                color: #8696a0;
+                color: var(--ami-text-muted);
                 font-size: 12px;
                 margin-bottom: 4px;
             }
             
             .unread-indicator {
                 background-color: #00a884;
-                color: #111b21;
+                color: var(--ami-on-accent);
                 font-size: 12px;
                 font-weight: 600;
                 min-width: 20px;
@@ -272,10 +499,10 @@ def get_css(theme):
             
             /* WhatsApp Chat Header */
             .chat-header {
-                background: #202c33;
+                background: var(--ami-panel-bg);
                 padding: 10px 16px;
                 margin-bottom: 1px;
-                border-bottom: 1px solid #2a3942;
+                border-bottom: 1px solid var(--ami-border);
                 display: flex;
                 justify-content: space-between;
                 align-items: center;
@@ -303,7 +530,7 @@ def get_css(theme):
             }
             
             .chat-header-info h3 {
-                color: #e9edef;
+                color: var(--ami-text);
                 margin: 0 0 2px 0;
                 font-size: 16px;
                 font-weight: 500;
@@ -311,7 +538,7 @@ def get_css(theme):
             }
             
             .chat-header-info p {
-                color: #8696a0;
+                color: var(--ami-text-muted);
                 margin: 0;
                 font-size: 13px;
                 font-weight: 400;
@@ -342,7 +569,7 @@ def get_css(theme):
                 left: 0;
                 right: 0;
                 bottom: 0;
-                background: rgba(10, 20, 25, 0.95);
+                background: var(--ami-chat-overlay);
                 pointer-events: none;
             }
             
@@ -372,12 +599,13 @@ def get_css(theme):
             }
             
             .message-bubble.user {
-                background-color: #202c33;
+                background-color: var(--ami-card-bg);
+                border: var(--ami-bubble-in-border);
                 border-top-left-radius: 0;
             }
             
             .message-bubble.bot {
-                background-color: #005c4b;
+                background-color: var(--ami-bubble-out-bg);
                 border-top-right-radius: 0;
             }
             
@@ -388,7 +616,9 @@ def get_css(theme):
                 left: -8px;
                 width: 8px;
                 height: 13px;
-                background-color: #202c33;
+                background-color: var(--ami-card-bg);
+                border-left: var(--ami-bubble-in-border);
+                border-bottom: var(--ami-bubble-in-border);
                 border-bottom-right-radius: 10px;
             }
             
@@ -399,12 +629,12 @@ def get_css(theme):
                 right: -8px;
                 width: 8px;
                 height: 13px;
-                background-color: #005c4b;
+                background-color: var(--ami-bubble-out-bg);
                 border-bottom-left-radius: 10px;
             }
             
             .message-text {
-                color: #e9edef;
+                color: var(--ami-message-text);
                 font-size: 14.2px;
                 line-height: 19px;
                 margin-bottom: 4px;
@@ -413,7 +643,7 @@ def get_css(theme):
             }
             
             .message-time {
-                color: rgba(255, 255, 255, 0.6);
+                color: var(--ami-message-meta);
                 font-size: 11px;
                 text-align: right;
                 margin-top: 2px;
@@ -433,15 +663,15 @@ def get_css(theme):
                 font-size: 13px;
             }
             
-            .message-status.sent { color: #8696a0; }
-            .message-status.delivered { color: #8696a0; }
+            .message-status.sent { color: var(--ami-text-muted); }
+            .message-status.delivered { color: var(--ami-text-muted); }
             .message-status.read { color: #53bdeb; }
             
             /* WhatsApp Input Area */
             .input-area {
-                background: #202c33;
+                background: var(--ami-panel-bg);
                 padding: 10px 16px;
-                border-top: 1px solid #2a3942;
+                border-top: 1px solid var(--ami-border);
                 position: sticky;
                 bottom: 0;
                 z-index: 100;
@@ -449,15 +679,15 @@ def get_css(theme):
             
             /* Update section */
             .update-section {
-                background-color: #202c33;
+                background-color: var(--ami-card-bg);
                 border-radius: 8px;
                 padding: 16px;
                 margin-top: 16px;
-                border: 1px solid #2a3942;
+                border: 1px solid var(--ami-border);
             }
             
             .update-section h3 {
-                color: #e9edef !important;
+                color: var(--ami-text) !important;
                 font-size: 16px !important;
                 margin-bottom: 12px !important;
                 font-weight: 500 !important;
@@ -465,26 +695,26 @@ def get_css(theme):
             
             /* Send section */
             .send-section {
-                background-color: #202c33;
+                background-color: var(--ami-card-bg);
                 border-radius: 8px;
                 padding: 16px;
                 margin-top: 16px;
-                border: 1px solid #2a3942;
+                border: 1px solid var(--ami-border);
             }
             
             .send-section h3 {
-                color: #e9edef !important;
+                color: var(--ami-text) !important;
                 font-size: 16px !important;
                 margin-bottom: 12px !important;
                 font-weight: 500 !important;
             }
             
             .pagination-section {
-                background-color: #202c33;
+                background-color: var(--ami-card-bg);
                 border-radius: 8px;
                 padding: 12px 16px;
                 margin-top: 12px;
-                border: 1px solid #2a3942;
+                border: 1px solid var(--ami-border);
                 display: flex;
                 align-items: center;
                 justify-content: space-between;
@@ -492,12 +722,12 @@ def get_css(theme):
 
             .handler-meta {
                 font-size: 11px;
-                color: rgba(255, 255, 255, 0.6);
+                color: var(--ami-handler-text);
                 margin-top: 2px;
             }
 
             .pagination-info {
-                color: #8696a0;
+                color: var(--ami-text-muted);
                 font-size: 14px;
                 margin: 0;
                 text-align: center;
@@ -507,7 +737,7 @@ def get_css(theme):
             /* WhatsApp Buttons */
             .stButton > button {
                 background-color: #00a884 !important;
-                color: #111b21 !important;
+                color: var(--ami-on-accent) !important;
                 border: none !important;
                 font-weight: 600 !important;
                 border-radius: 24px !important;
@@ -537,9 +767,9 @@ def get_css(theme):
             
             /* Input fields */
             .stTextInput input, .stTextArea textarea {
-                background-color: #2a3942 !important;
-                color: #e9edef !important;
-                border: 1px solid #3b4a54 !important;
+                background-color: var(--ami-input-bg) !important;
+                color: var(--ami-text) !important;
+                border: 1px solid var(--ami-input-border) !important;
                 border-radius: 8px !important;
                 font-size: 14px !important;
                 padding: 12px !important;
@@ -552,25 +782,25 @@ def get_css(theme):
             
             /* Checkbox */
             [data-testid="stCheckbox"] label {
-                color: #e9edef !important;
+                color: var(--ami-text) !important;
                 font-size: 14px !important;
             }
             
             /* Selectbox */
             .stSelectbox label {
-                color: #e9edef !important;
+                color: var(--ami-text) !important;
             }
             
             /* Radio buttons */
             .stRadio label {
-                color: #e9edef !important;
+                color: var(--ami-text) !important;
             }
             
             /* Date and time inputs */
             .stDateInput input, .stTimeInput input {
-                background-color: #2a3942 !important;
-                color: #e9edef !important;
-                border: 1px solid #3b4a54 !important;
+                background-color: var(--ami-input-bg) !important;
+                color: var(--ami-text) !important;
+                border: 1px solid var(--ami-input-border) !important;
                 border-radius: 8px !important;
             }
             
@@ -581,16 +811,16 @@ def get_css(theme):
             }
             
             ::-webkit-scrollbar-track {
-                background: #111b21;
+                background: var(--ami-scrollbar-track);
             }
             
             ::-webkit-scrollbar-thumb {
-                background: #374045;
+                background: var(--ami-scrollbar-thumb);
                 border-radius: 3px;
             }
             
             ::-webkit-scrollbar-thumb:hover {
-                background: #3b4a54;
+                background: var(--ami-scrollbar-thumb-hover);
             }
             
             /* Hide streamlit elements */
@@ -627,11 +857,11 @@ def get_css(theme):
             
             /* Search input */
             .search-input {
-                background-color: #202c33;
+                background-color: var(--ami-card-bg);
                 border: none;
-                border-bottom: 1px solid #2a3942;
+                border-bottom: 1px solid var(--ami-border);
                 padding: 8px 12px;
-                color: #e9edef;
+                color: var(--ami-text);
                 font-size: 14px;
                 width: 100%;
             }
@@ -643,7 +873,7 @@ def get_css(theme):
             }
             
             .status-offline {
-                color: #8696a0;
+                color: var(--ami-text-muted);
                 font-size: 11px;
             }
             
@@ -658,598 +888,165 @@ def get_css(theme):
             .avatar-color-7 { background: linear-gradient(135deg, #00d2d3 0%, #01a3a4 100%) !important; }
         </style>
         """
+
+
+LOGO_DISPLAY_SIZE = 96   # px; the header shows the logo at 40px, this keeps it sharp on 2x screens
+
+
+def minify_css(css: str) -> str:
+    """Strip the <style> wrapper, comments and whitespace from a stylesheet."""
+    css = re.sub(r"</?style>", "", css)
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.strip()
+
+
+def _resize_logo(data: bytes) -> bytes:
+    """Center-crop to a square (as object-fit: cover does) and shrink for the header."""
+    with Image.open(io.BytesIO(data)) as img:
+        small = ImageOps.fit(img.convert("RGBA"), (LOGO_DISPLAY_SIZE, LOGO_DISPLAY_SIZE), Image.LANCZOS)
+        out = io.BytesIO()
+        small.save(out, format="PNG", optimize=True)
+        return out.getvalue()
+
+
+@st.cache_resource
+def load_static_assets() -> dict:
+    """
+    The minified stylesheet (both themes) and the encoded logo, built once per
+    process. "sizes" holds the payload sizes in bytes for the debug panel.
+    """
+    css = minify_css(get_css())
+    sizes = {"css_raw": len(get_css().encode()), "css": len(css.encode())}
+
+    logo_b64 = get_base64_logo()
+    logo_small_b64 = None
+    if logo_b64:
+        logo_small = _resize_logo(base64.b64decode(logo_b64))
+        logo_small_b64 = base64.b64encode(logo_small).decode()
+        sizes["logo_b64"] = len(logo_b64)
+        sizes["logo_small_b64"] = len(logo_small_b64)
+
+    version = hashlib.sha1(css.encode()).hexdigest()[:12]
+    return {"css": css, "logo_b64": logo_b64, "logo_small_b64": logo_small_b64,
+            "sizes": sizes, "version": version}
+
+
+def embed_html(html: str, height: int):
+    """
+    Render HTML in a same-origin iframe of the given height. components.v1.html
+    is deprecated (removal after 2026-06-01) in favour of st.iframe; it is only
+    used on Streamlit releases without st.iframe.
+    """
+    if hasattr(st, "iframe"):
+        st.iframe(html, height=height)
     else:
-        return """
-        <style>
-            /* WhatsApp Web Light Theme */
-            .main {
-                background: linear-gradient(180deg, #eae6df 0%, #eae6df 100%);
-                padding: 0 !important;
-            }
-            
-            /* Remove default padding */
-            .block-container {
-                padding-top: 0 !important;
-                padding-bottom: 0 !important;
-                max-width: 100% !important;
-            }
-            
-            /* WhatsApp Header */
-            .main-header {
-                background: #f0f2f5;
-                padding: 10px 16px;
-                display: flex;
-                align-items: center;
-                gap: 15px;
-                border-bottom: 1px solid #dddfe2;
-                position: sticky;
-                top: 0;
-                z-index: 999;
-                height: 60px;
-            }
-            
-            .main-header h1 {
-                color: #3b4a54;
-                margin: 0;
-                font-size: 16px;
-                font-weight: 500;
-                flex: 1;
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            }
+        components.html(html, height=height)
+
+
+STYLESHEET_JS = """
+export default function({ data, setStateValue }) {
+    let style = document.getElementById("ami-theme-css");
+    if (!style) {
+        style = document.createElement("style");
+        style.id = "ami-theme-css";
+        document.head.appendChild(style);
+    }
+    style.textContent = data.css;
+    const root = document.documentElement;
+    root.dataset.amiTheme = root.dataset.amiTheme || localStorage.getItem("ami-theme") || data.theme;
+    setStateValue("injected", data.version);
+}
+"""
+
+
+@st.cache_resource
+def get_stylesheet_component():
+    """The stylesheet writer as a components v2 component, registered once per process."""
+    return st.components.v2.component("ami_stylesheet", js=STYLESHEET_JS)
 
-            .handler-meta {
-                font-size: 11px;
-                color: #303030;   /* BLACK in light mode */
-                margin-top: 2px;
-            }
-            
-            .logo-img {
-                width: 40px;
-                height: 40px;
-                border-radius: 50%;
-                object-fit: cover;
-                border: 1px solid #dddfe2;
-            }
-            
-            /* Filter section */
-            .filter-container {
-                background-color: #ffffff;
-                border: 1px solid #dddfe2;
-                border-radius: 8px;
-                padding: 0;
-                margin-bottom: 12px;
-                overflow: hidden;
-                margin-top: 10px;
-            }
-            
-            .filter-header {
-                background-color: #f0f2f5;
-                padding: 12px 16px;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                cursor: pointer;
-                border-bottom: 1px solid #dddfe2;
-            }
-            
-            .filter-header h3 {
-                color: #3b4a54;
-                margin: 0;
-                font-size: 14px;
-                font-weight: 500;
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }
-            
-            .filter-content {
-                padding: 16px;
-            }
-            
-            .filter-row {
-                display: flex;
-                gap: 12px;
-                margin-bottom: 12px;
-                flex-wrap: wrap;
-            }
-            
-            .filter-group {
-                flex: 1;
-                min-width: 200px;
-            }
-            
-            .filter-group label {
-                color: #667781;
-                font-size: 12px;
-                margin-bottom: 4px;
-                display: block;
-                font-weight: 400;
-            }
-            
-            /* WhatsApp Sidebar Contacts */
-            .contact-card {
-                background-color: transparent;
-                padding: 12px;
-                cursor: pointer;
-                border-bottom: 1px solid #f0f2f5;
-                transition: background-color 0.2s;
-                position: relative;
-                display: flex;
-                align-items: center;
-                gap: 12px;
-                min-height: 72px;
-            }
-            
-            .contact-card:hover {
-                background-color: #f0f2f5;
-            }
-            
-            .contact-card.selected {
-                background-color: #e4e6eb;
-            }
-            
-            .contact-avatar {
-                width: 49px;
-                height: 49px;
-                border-radius: 50%;
-                background: linear-gradient(135deg, #00a884 0%, #008069 100%);
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 20px;
-                color: white;
-                font-weight: 500;
-                flex-shrink: 0;
-            }
-            
-            .contact-info {
-                flex: 1;
-                min-width: 0;
-                padding-right: 40px;
-            }
-            
-            .contact-name {
-                color: #3b4a54;
-                font-size: 17px;
-                font-weight: 400;
-                margin-bottom: 2px;
-                white-space: nowrap;
-                overflow: hidden;
-                text-overflow: ellipsis;
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            }
-            
-            .contact-preview {
-                color: #667781;
-                font-size: 14px;
-                white-space: nowrap;
-                overflow: hidden;
-                text-overflow: ellipsis;
-                font-weight: 400;
-            }
-            
-            .contact-meta {
-                position: absolute;
-                top: 12px;
-                right: 12px;
-                text-align: right;
-            }
-            
-            .contact-time {
-                color: #667781;
-                font-size: 12px;
-                margin-bottom: 4px;
-            }
-            
-            .unread-indicator {
-                background-color: #00a884;
-                color: white;
-                font-size: 12px;
-                font-weight: 600;
-                min-width: 20px;
-                height: 20px;
-                border-radius: 10px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                margin-left: auto;
-            }
-            
-            /* WhatsApp Chat Header */
-            .chat-header {
-                background: #f0f2f5;
-                padding: 10px 16px;
-                margin-bottom: 1px;
-                border-bottom: 1px solid #dddfe2;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                height: 60px;
-            }
-            
-            .chat-header-left {
-                display: flex;
-                align-items: center;
-                gap: 15px;
-                flex: 1;
-            }
-            
-            .chat-avatar {
-                width: 40px;
-                height: 40px;
-                border-radius: 50%;
-                background: linear-gradient(135deg, #00a884 0%, #008069 100%);
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 18px;
-                color: white;
-                font-weight: 500;
-            }
-            
-            .chat-header-info h3 {
-                color: #3b4a54;
-                margin: 0 0 2px 0;
-                font-size: 16px;
-                font-weight: 500;
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            }
-            
-            .chat-header-info p {
-                color: #667781;
-                margin: 0;
-                font-size: 13px;
-                font-weight: 400;
-            }
-            
-            .chat-header-actions {
-                display: flex;
-                gap: 20px;
-                align-items: center;
-            }
-            
-            /* WhatsApp Chat Area */
-            .chat-container {
-                background: url('https://user-images.githubusercontent.com/15075759/28719144-86dc0f70-73b1-11e7-911d-60d70fcded21.png');
-                background-size: contain;
-                background-position: center;
-                padding: 20px 16px;
-                min-height: calc(100vh - 240px);
-                position: relative;
-                overflow-y: auto;
-                max-height: 600px;
-            }
-            
-            .chat-container::before {
-                content: '';
-                position: absolute;
-                top: 0;
-                left: 0;
-                right: 0;
-                bottom: 0;
-                background: rgba(234, 230, 223, 0.85);
-                pointer-events: none;
-            }
-            
-            /* WhatsApp Message Bubbles */
-            .message-row {
-                display: flex;
-                margin-bottom: 8px;
-                position: relative;
-                z-index: 1;
-            }
-            
-            .message-row.user {
-                justify-content: flex-start;
-            }
-            
-            .message-row.bot {
-                justify-content: flex-end;
-            }
-            
-            .message-bubble {
-                max-width: 65%;
-                padding: 8px 9px;
-                border-radius: 7.5px;
-                position: relative;
-                box-shadow: 0 1px 0.5px rgba(0,0,0,0.13);
-                word-wrap: break-word;
-            }
-            
-            .message-bubble.user {
-                background-color: #ffffff;
-                border-top-left-radius: 0;
-                border: 1px solid #e0e0e0;
-            }
-            
-            .message-bubble.bot {
-                background-color: #dcf8c6;
-                border-top-right-radius: 0;
-            }
-            
-            .message-bubble.user::before {
-                content: '';
-                position: absolute;
-                top: 0;
-                left: -8px;
-                width: 8px;
-                height: 13px;
-                background-color: #ffffff;
-                border-bottom-right-radius: 10px;
-                border-left: 1px solid #e0e0e0;
-                border-bottom: 1px solid #e0e0e0;
-            }
-            
-            .message-bubble.bot::before {
-                content: '';
-                position: absolute;
-                top: 0;
-                right: -8px;
-                width: 8px;
-                height: 13px;
-                background-color: #dcf8c6;
-                border-bottom-left-radius: 10px;
-            }
-            
-            .message-text {
-                color: #303030;
-                font-size: 14.2px;
-                line-height: 19px;
-                margin-bottom: 4px;
-                word-wrap: break-word;
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            }
-            
-            .message-time {
-                color: rgba(0, 0, 0, 0.45);
-                font-size: 11px;
-                text-align: right;
-                margin-top: 2px;
-                display: flex;
-                justify-content: flex-end;
-                align-items: center;
-                gap: 4px;
-            }
-            
-            .message-meta {
-                display: flex;
-                align-items: center;
-                gap: 4px;
-            }
-            
-            .message-status {
-                font-size: 13px;
-            }
-            
-            .message-status.sent { color: #667781; }
-            .message-status.delivered { color: #667781; }
-            .message-status.read { color: #53bdeb; }
-            
-            /* WhatsApp Input Area */
-            .input-area {
-                background: #f0f2f5;
-                padding: 10px 16px;
-                border-top: 1px solid #dddfe2;
-                position: sticky;
-                bottom: 0;
-                z-index: 100;
-            }
-            
-            /* Update section */
-            .update-section {
-                background-color: #ffffff;
-                border-radius: 8px;
-                padding: 16px;
-                margin-top: 16px;
-                border: 1px solid #dddfe2;
-            }
-            
-            .update-section h3 {
-                color: #3b4a54 !important;
-                font-size: 16px !important;
-                margin-bottom: 12px !important;
-                font-weight: 500 !important;
-            }
-            
-            /* Send section */
-            .send-section {
-                background-color: #ffffff;
-                border-radius: 8px;
-                padding: 16px;
-                margin-top: 16px;
-                border: 1px solid #dddfe2;
-            }
-            
-            .send-section h3 {
-                color: #3b4a54 !important;
-                font-size: 16px !important;
-                margin-bottom: 12px !important;
-                font-weight: 500 !important;
-            }
-            
-            .pagination-section {
-                background-color: #ffffff;
-                border-radius: 8px;
-                padding: 12px 16px;
-                margin-top: 12px;
-                border: 1px solid #dddfe2;
-                display: flex;
-                align-items: center;
-                justify-content: space-between;
-            }
-            
-            .pagination-info {
-                color: #667781;
-                font-size: 14px;
-                margin: 0;
-                text-align: center;
-                flex: 1;
-            }
-            
-            /* WhatsApp Buttons */
-            .stButton > button {
-                background-color: #00a884 !important;
-                color: white !important;
-                border: none !important;
-                font-weight: 600 !important;
-                border-radius: 24px !important;
-                font-size: 14px !important;
-                padding: 10px 24px !important;
-                height: auto !important;
-                min-height: 40px !important;
-                transition: all 0.2s !important;
-            }
-            
-            .stButton > button:hover {
-                background-color: #06cf9c !important;
-                transform: translateY(-1px);
-                box-shadow: 0 2px 8px rgba(0, 168, 132, 0.3);
-            }
-            
-            .delete-btn {
-                background-color: #dc3545 !important;
-                padding: 4px 8px !important;
-                font-size: 11px !important;
-                border-radius: 4px !important;
-                color: white !important;
-                border: none !important;
-                cursor: pointer;
-                margin-top: 4px;
-            }
-            
-            /* Input fields */
-            .stTextInput input, .stTextArea textarea {
-                background-color: #ffffff !important;
-                color: #3b4a54 !important;
-                border: 1px solid #dddfe2 !important;
-                border-radius: 8px !important;
-                font-size: 14px !important;
-                padding: 12px !important;
-            }
-            
-            .stTextInput input:focus, .stTextArea textarea:focus {
-                border-color: #00a884 !important;
-                box-shadow: 0 0 0 1px #00a884 !important;
-            }
-            
-            /* Checkbox */
-            [data-testid="stCheckbox"] label {
-                color: #3b4a54 !important;
-                font-size: 14px !important;
-            }
-            
-            /* Selectbox */
-            .stSelectbox label {
-                color: #3b4a54 !important;
-            }
-            
-            /* Radio buttons */
-            .stRadio label {
-                color: #3b4a54 !important;
-            }
-            
-            /* Date and time inputs */
-            .stDateInput input, .stTimeInput input {
-                background-color: #ffffff !important;
-                color: #3b4a54 !important;
-                border: 1px solid #dddfe2 !important;
-                border-radius: 8px !important;
-            }
-            
-            /* Scrollbar */
-            ::-webkit-scrollbar {
-                width: 6px;
-                height: 6px;
-            }
-            
-            ::-webkit-scrollbar-track {
-                background: #f0f2f5;
-            }
-            
-            ::-webkit-scrollbar-thumb {
-                background: #bcc0c4;
-                border-radius: 3px;
-            }
-            
-            ::-webkit-scrollbar-thumb:hover {
-                background: #a0a4a8;
-            }
-            
-            /* Hide streamlit elements */
-            #MainMenu {visibility: hidden;}
-            footer {visibility: hidden;}
-            header {visibility: hidden;}
-            
-            /* Override streamlit's default padding */
-            .main .block-container {
-                padding-top: 0rem !important;
-            }
-            
-            /* Header buttons */
-            .header-buttons {
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-            
-            /* Filter actions */
-            .filter-actions {
-                display: flex;
-                gap: 10px;
-                margin-top: 20px;
-                justify-content: flex-end;
-            }
-            
-            /* Top buttons */
-            .top-buttons-row {
-                display: flex;
-                gap: 10px;
-                margin-bottom: 15px;
-            }
-            
-            /* Search input */
-            .search-input {
-                background-color: #ffffff;
-                border: none;
-                border-bottom: 1px solid #dddfe2;
-                padding: 8px 12px;
-                color: #3b4a54;
-                font-size: 14px;
-                width: 100%;
-            }
-            
-            /* Status indicators */
-            .status-online {
-                color: #00a884;
-                font-size: 11px;
-            }
-            
-            .status-offline {
-                color: #667781;
-                font-size: 11px;
-            }
-            
-            /* Avatar colors */
-            .avatar-color-0 { background: linear-gradient(135deg, #ff6b6b 0%, #ee5a52 100%) !important; }
-            .avatar-color-1 { background: linear-gradient(135deg, #48dbfb 0%, #0abde3 100%) !important; }
-            .avatar-color-2 { background: linear-gradient(135deg, #1dd1a1 0%, #00b894 100%) !important; }
-            .avatar-color-3 { background: linear-gradient(135deg, #f368e0 0%, #ff9ff3 100%) !important; }
-            .avatar-color-4 { background: linear-gradient(135deg, #ff9f43 0%, #feca57 100%) !important; }
-            .avatar-color-5 { background: linear-gradient(135deg, #54a0ff 0%, #2e86de 100%) !important; }
-            .avatar-color-6 { background: linear-gradient(135deg, #5f27cd 0%, #341f97 100%) !important; }
-            .avatar-color-7 { background: linear-gradient(135deg, #00d2d3 0%, #01a3a4 100%) !important; }
-        </style>
-        """
 
+def inject_stylesheet(default_theme: str):
+    """
+    Write the stylesheet into the page <head> once per session.
 
-st.markdown(get_css(st.session_state.theme), unsafe_allow_html=True)
+    The <style> tag lives on in the page after the component that wrote it
+    goes away, so later reruns send no CSS at all. The theme itself is the
+    data-ami-theme attribute, remembered by the browser, so switching it
+    never reaches Python.
 
-logo_base64 = get_base64_logo()
-if logo_base64:
-    logo_html = f'<img src="data:image/png;base64,{logo_base64}" class="logo-img">'
-else:
-    logo_url = "https://drive.google.com/uc?export=view&id=1NSTzTZ_gusa-c4Sc5dZelth-Djft0Zca"
-    logo_html = f'<img src="{logo_url}" class="logo-img" onerror="this.style.display=\'none\'">'
+    With components v2 the writer runs in the page itself and reports the
+    version it wrote, which costs one extra rerun per session. The session
+    is only marked once that report arrives, so a snippet that never ran is
+    sent again. Older releases cannot report back and are marked on send.
+    """
+    assets = load_static_assets()
+    if st.session_state.get("css_injected") == assets["version"]:
+        return
+    if hasattr(st.components, "v2"):
+        result = get_stylesheet_component()(
+            data={"css": assets["css"], "version": assets["version"], "theme": default_theme},
+            key="ami_stylesheet", on_injected_change=lambda: None,
+        )
+        if result.injected == assets["version"]:
+            st.session_state.css_injected = assets["version"]
+        return
+    components.html(f"""<script>
+        const doc = window.parent.document;
+        let style = doc.getElementById("ami-theme-css");
+        if (!style) {{
+            style = doc.createElement("style");
+            style.id = "ami-theme-css";
+            doc.head.appendChild(style);
+        }}
+        style.textContent = {json.dumps(assets["css"])};
+        const root = doc.documentElement;
+        root.dataset.amiTheme = root.dataset.amiTheme
+            || window.parent.localStorage.getItem("ami-theme") || {json.dumps(default_theme)};
+    </script>""", height=0)
+    st.session_state.css_injected = assets["version"]
+
+
+def render_theme_toggle(default_theme: str):
+    """Light/dark button that flips data-ami-theme in the browser; it never triggers a rerun."""
+    embed_html(f"""
+    <style>
+        body {{ margin: 0; }}
+        button {{
+            width: 100%; height: 38px; border-radius: 8px; border: 1px solid; cursor: pointer;
+            font: 14px -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+        }}
+    </style>
+    <button id="theme-toggle"></button>
+    <script>
+        const root = window.parent.document.documentElement;
+        const button = document.getElementById("theme-toggle");
+        function apply(theme) {{
+            root.dataset.amiTheme = theme;
+            window.parent.localStorage.setItem("ami-theme", theme);
+            button.textContent = theme === "dark" ? "☀️ Light Mode" : "🌙 Dark Mode";
+            const vars = window.parent.getComputedStyle(root);
+            button.style.background = vars.getPropertyValue("--ami-input-bg");
+            button.style.color = vars.getPropertyValue("--ami-text");
+            button.style.borderColor = vars.getPropertyValue("--ami-border");
+        }}
+        apply(root.dataset.amiTheme || window.parent.localStorage.getItem("ami-theme") || {json.dumps(default_theme)});
+        button.onclick = () => apply(root.dataset.amiTheme === "dark" ? "light" : "dark");
+    </script>
+    """, height=40)
+
+
+with phase("styles"):
+    inject_stylesheet(st.session_state.theme)
+
+    logo_base64 = load_static_assets()["logo_small_b64"]
+    if logo_base64:
+        logo_html = f'<img src="data:image/png;base64,{logo_base64}" class="logo-img">'
+    else:
+        logo_url = "https://drive.google.com/uc?export=view&id=1NSTzTZ_gusa-c4Sc5dZelth-Djft0Zca"
+        logo_html = f'<img src="{logo_url}" class="logo-img" onerror="this.style.display=\'none\'">'
 
 st.markdown(f"""
 <div class="main-header">
@@ -1267,14 +1064,7 @@ with col1:
         st.rerun()
 
 with col2:
-    if st.session_state.theme == "dark":
-        if st.button("☀️ Light Mode", key="theme_toggle", use_container_width=True):
-            st.session_state.theme = "light"
-            st.rerun()
-    else:
-        if st.button("🌙 Dark Mode", key="theme_toggle", use_container_width=True):
-            st.session_state.theme = "dark"
-            st.rerun()
+    render_theme_toggle(st.session_state.theme)
 
 if st.session_state.show_filters:
     st.markdown('<div class="filter-container">', unsafe_allow_html=True)
@@ -1354,8 +1144,7 @@ def convert_to_ist(timestamp_str: str) -> datetime:
         return datetime.now(IST)
 
 
-def format_message_time(timestamp_str: str) -> str:
-    ist_dt = convert_to_ist(timestamp_str)
+def format_message_time(ist_dt: datetime) -> str:
     return ist_dt.strftime("%I:%M %p").lstrip('0')
 
 
@@ -1379,6 +1168,66 @@ def format_contact_time(timestamp_str: str) -> str:
         return ""
 
 
+class Direction(str, Enum):
+    """Which side of the chat a message sits on; the value doubles as its CSS class."""
+    USER = "user"
+    BOT = "bot"
+
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    """A backend message parsed once at ingestion; filters, sorting and rendering read only this."""
+    id: int | None
+    phone: str
+    text: str
+    direction: Direction
+    dt: datetime          # IST
+    day: date
+    timestamp: str        # as sent by the backend, for since= polling
+    follow_up_needed: bool
+    notes: str
+    handled_by: str
+    status: str = ""      # outbox status of a message not yet in the backend
+
+    @property
+    def sort_key(self) -> tuple:
+        return self.dt, self.id or 0
+
+
+def to_message(raw: dict) -> Message:
+    ist_dt = convert_to_ist(raw.get("timestamp"))
+    return Message(
+        id=raw.get("id"),
+        phone=str(raw.get("phone") or ""),
+        text=raw.get("message") or "",
+        direction=Direction.USER if raw.get("direction") in ["user", "incoming"] else Direction.BOT,
+        dt=ist_dt,
+        day=ist_dt.date(),
+        timestamp=str(raw.get("timestamp") or ""),
+        follow_up_needed=bool(raw.get("follow_up_needed")),
+        notes=raw.get("notes") or "",
+        handled_by=raw.get("handled_by") or "",
+    )
+
+
+def to_messages(raw_messages) -> list:
+    return [to_message(raw) for raw in raw_messages]
+
+
+def message_to_raw(msg: Message) -> dict:
+    """The backend JSON a Message was built from, for caches shared between processes."""
+    return {
+        "id": msg.id,
+        "phone": msg.phone,
+        "message": msg.text,
+        "direction": "incoming" if msg.direction == Direction.USER else "outgoing",
+        "timestamp": msg.timestamp,
+        "follow_up_needed": msg.follow_up_needed,
+        "notes": msg.notes,
+        "handled_by": msg.handled_by,
+    }
+
+
 def get_avatar_color(name: str) -> int:
     if not name:
         return 0
@@ -1398,60 +1247,982 @@ def get_avatar_initials(name: str) -> str:
         return name[0].upper() if name else "?"
 
 
-def make_request_with_retry(url, method="GET", params=None, json_data=None, max_retries=3):
-    """Make HTTP request with retry logic"""
-    for attempt in range(max_retries):
+@st.cache_resource
+def get_http_session(pool: str, pool_size: int) -> requests.Session:
+    """
+    Process-wide keep-alive session for one upstream ("backend" or "webhook"),
+    so repeated calls reuse TCP+TLS connections instead of opening new ones.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session_for(url: str) -> requests.Session:
+    """Pick the connection pool for a URL: the Make webhook or the backend."""
+    if MAKE_WEBHOOK_URL and urlsplit(url).netloc == urlsplit(MAKE_WEBHOOK_URL).netloc:
+        return get_http_session("webhook", WEBHOOK_POOL_SIZE)
+    return get_http_session("backend", HTTP_POOL_SIZE)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How make_request_with_retry times out, backs off and decides what to retry."""
+    max_attempts: int = 3
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0    # Render cold starts can take this long
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    retry_statuses: frozenset = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+    @property
+    def timeout(self) -> tuple:
+        return self.connect_timeout, self.read_timeout
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given 0-based attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+# Webhook POSTs send a WhatsApp message and are not idempotent unless the Make
+# scenario drops repeated idempotency keys, so they get a single attempt: a
+# read timeout or 5xx may mean the message went out. The outbox retries them.
+WEBHOOK_RETRY_POLICY = RetryPolicy(max_attempts=1)
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while a host's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker. Opens after `failure_threshold` consecutive failures,
+    then lets a single probe request through every `reset_timeout` seconds
+    until one succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing else "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time_module.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time_module.monotonic()
+            self.probing = False
+
+
+@st.cache_resource
+def get_circuit_breakers() -> dict:
+    """Process-wide {host: CircuitBreaker}, shared by every session."""
+    return {}
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    breakers = get_circuit_breakers()
+    host = urlsplit(url).netloc
+    if host not in breakers:
+        breakers.setdefault(host, CircuitBreaker())
+    return breakers[host]
+
+
+# ---------- Request instrumentation ----------
+
+# Path segments after these are ids; the rest of a numeric segment is a phone
+ENDPOINT_ID_SEGMENTS = {"message"}
+
+
+def endpoint_template(url: str) -> str:
+    """'/conversation/{phone}'-style name of a request URL, so calls group per endpoint."""
+    if MAKE_WEBHOOK_URL and url.startswith(MAKE_WEBHOOK_URL):
+        return "make-webhook"
+    parts = urlsplit(url)
+    segments = parts.path.strip("/").split("/")
+    for i, segment in enumerate(segments):
+        if re.fullmatch(r"\+?\d+", segment):
+            segments[i] = "{id}" if i and segments[i - 1] in ENDPOINT_ID_SEGMENTS else "{phone}"
+    path = "/" + "/".join(segments)
+    return path if url.startswith(API_BASE) else parts.netloc + path
+
+
+class RequestStats:
+    """Per-endpoint request counts, outcomes, bytes and latency histograms for the whole process."""
+
+    def __init__(self):
+        self.endpoints = {}    # (method, template) -> aggregate
+        self.lock = threading.Lock()
+
+    def record(self, method: str, template: str, trace: dict, seconds: float):
+        with self.lock:
+            entry = self.endpoints.setdefault((method, template), {
+                "count": 0, "errors": 0, "attempts": 0, "bytes": 0,
+                "seconds": 0.0, "max": 0.0, "statuses": {},
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            })
+            entry["count"] += 1
+            entry["attempts"] += trace["attempts"]
+            entry["bytes"] += trace["bytes"]
+            entry["seconds"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            outcome = str(trace["status"] or trace["error"])
+            entry["statuses"][outcome] = entry["statuses"].get(outcome, 0) + 1
+            if trace["error"] or (trace["status"] or 0) >= 400:
+                entry["errors"] += 1
+            entry["buckets"][next(
+                (i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS)
+            )] += 1
+
+    @staticmethod
+    def _percentile(buckets: list, count: int, q: float) -> str:
+        """Upper bound of the histogram bucket holding the q-quantile."""
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= q * count:
+                return f"≤{LATENCY_BUCKETS[i] * 1000:.0f}" if i < len(LATENCY_BUCKETS) else ">30000"
+        return "-"
+
+    def snapshot(self) -> list:
+        with self.lock:
+            rows = []
+            for (method, template), e in sorted(self.endpoints.items(), key=lambda kv: -kv[1]["seconds"]):
+                rows.append({
+                    "endpoint": f"{method} {template}",
+                    "calls": e["count"],
+                    "errors": e["errors"],
+                    "retries": e["attempts"] - e["count"],
+                    "avg ms": round(e["seconds"] / e["count"] * 1000),
+                    "p50 ms": self._percentile(e["buckets"], e["count"], 0.5),
+                    "p95 ms": self._percentile(e["buckets"], e["count"], 0.95),
+                    "max ms": round(e["max"] * 1000),
+                    "KB": round(e["bytes"] / 1024, 1),
+                    "statuses": ", ".join(f"{k}×{v}" for k, v in sorted(e["statuses"].items())),
+                })
+            return rows
+
+    def histogram(self, endpoint: str) -> dict:
+        """Latency buckets and call counts (chart columns) for one 'METHOD /template' row of snapshot()."""
+        method, template = endpoint.split(" ", 1)
+        with self.lock:
+            buckets = list(self.endpoints.get((method, template), {}).get("buckets", []))
+        labels = [f"{i:02d} ≤{bound * 1000:.0f} ms" for i, bound in enumerate(LATENCY_BUCKETS)]
+        return {"latency": labels + [f"{len(LATENCY_BUCKETS):02d} >30000 ms"], "calls": buckets}
+
+
+@st.cache_resource
+def get_request_stats() -> RequestStats:
+    return RequestStats()
+
+
+def record_request(method: str, url: str, trace: dict, seconds: float):
+    get_request_stats().record(method, endpoint_template(url), trace, seconds)
+    # Calls from the outbox worker have no session; fan-out workers carry theirs
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return
+    rerun = st.session_state.get("http_rerun")
+    if rerun is not None:
+        with get_request_stats().lock:
+            rerun["requests"] += 1
+            rerun["bytes"] += trace["bytes"]
+            rerun["seconds"] += seconds
+
+
+def make_request_with_retry(url, method="GET", params=None, json_data=None, max_retries=None,
+                            policy: RetryPolicy = DEFAULT_RETRY_POLICY, headers=None):
+    """
+    Make HTTP request with retry logic.
+
+    Only timeouts, connection errors and policy.retry_statuses are retried,
+    with jittered exponential backoff; other 4xx responses raise right away.
+    Raises CircuitOpenError without sending anything while the host is down.
+    Every call is recorded in get_request_stats().
+    """
+    trace = {"attempts": 0, "status": None, "bytes": 0, "error": None}
+    started = time_module.perf_counter()
+    try:
+        return _request_with_retry(url, method, params, json_data, max_retries, policy, headers, trace)
+    except Exception as e:
+        trace["error"] = type(e).__name__
+        raise
+    finally:
+        record_request(method, url, trace, time_module.perf_counter() - started)
+
+
+def _request_with_retry(url, method, params, json_data, max_retries, policy: RetryPolicy, headers,
+                        trace: dict):
+    session = session_for(url)
+    breaker = breaker_for(url)
+    attempts = max_retries or policy.max_attempts
+
+    for attempt in range(attempts):
+        trace["attempts"] = attempt + 1
+        if not breaker.allow():
+            raise CircuitOpenError(f"{urlsplit(url).netloc} is unavailable, retrying in a moment")
+
         try:
             if method == "GET":
-                response = requests.get(url, params=params, timeout=30)
+                response = session.get(url, params=params, headers=headers, timeout=policy.timeout)
             elif method == "POST":
-                response = requests.post(url, json=json_data, timeout=30)
+                response = session.post(url, json=json_data, headers=headers, timeout=policy.timeout)
             elif method == "DELETE":
-                response = requests.delete(url, timeout=30)
+                response = session.delete(url, headers=headers, timeout=policy.timeout)
             elif method == "PATCH":
-                response = requests.patch(url, json=json_data, timeout=30)
+                response = session.patch(url, json=json_data, headers=headers, timeout=policy.timeout)
             else:
-                response = requests.get(url, params=params, timeout=30)
-
-            response.raise_for_status()
-            return response
+                response = session.get(url, params=params, headers=headers, timeout=policy.timeout)
 
         except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                time_module.sleep(2)
+            breaker.record_failure()
+            if attempt < attempts - 1:
+                time_module.sleep(policy.backoff(attempt))
                 continue
             else:
-                raise Exception(f"Request timed out after {max_retries} attempts")
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                time_module.sleep(2)
+                raise Exception(f"Request timed out after {attempts} attempts")
+        except requests.exceptions.ConnectionError:
+            breaker.record_failure()
+            if attempt < attempts - 1:
+                time_module.sleep(policy.backoff(attempt))
                 continue
             else:
-                raise e
+                raise
+        except requests.exceptions.RequestException:
+            breaker.record_failure()
+            raise
+
+        trace["status"] = response.status_code
+        trace["bytes"] = len(response.content)
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if response.status_code in policy.retry_statuses and attempt < attempts - 1:
+            retry_after = response.headers.get("Retry-After", "")
+            delay = policy.backoff(attempt)
+            if retry_after.isdigit():
+                delay = min(float(retry_after), policy.backoff_max)
+            time_module.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response
+    return None
+
+
+@st.cache_resource
+def get_fanout_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Process-wide worker pool shared by every session's fan-out calls."""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+
+
+def submit_with_ctx(executor: ThreadPoolExecutor, fn, *args):
+    """Submit fn(*args), letting st.* calls inside it reach this session from the worker thread."""
+    ctx = get_script_run_ctx()
+
+    def task():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    return executor.submit(task)
+
+
+def run_concurrently(fn, items, max_workers: int = FANOUT_WORKERS, deadline: float | None = None, default=None):
+    """
+    Run fn(item) for every item in parallel and return the results in item order.
+
+    Calls still running at `deadline` (a time.monotonic() value, by default
+    FANOUT_DEADLINE from this call) are abandoned and their slot gets
+    `default`, as do calls that raise. The deadline is taken per call because
+    fragment reruns run only part of the script.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if deadline is None:
+        deadline = time_module.monotonic() + FANOUT_DEADLINE
+
+    executor = get_fanout_executor(max(1, max_workers))
+    futures = [submit_with_ctx(executor, fn, item) for item in items]
+    wait(futures, timeout=max(0.0, deadline - time_module.monotonic()))
+
+    results = []
+    for future in futures:
+        if future.done() and not future.cancelled() and future.exception() is None:
+            results.append(future.result())
+        else:
+            future.cancel()
+            results.append(default)
+    return results
+
+
+# ---------- Endpoint discovery ----------
+
+class ApiShape:
+    """
+    Which endpoint variants the backend answers to, discovered once per process.
+
+    A remembered choice is dropped after API_SHAPE_RECHECK_ERRORS consecutive
+    errors so the next call probes again; an optional endpoint remembered as
+    missing (False) is tried again after API_SHAPE_RECHECK_UNSUPPORTED seconds.
+    """
+
+    def __init__(self):
+        self.records = {}    # name -> {"value", "since", "errors"}
+        self.lock = threading.Lock()
+
+    def get(self, name: str):
+        with self.lock:
+            record = self.records.get(name)
+            if record is None:
+                return None
+            if record["value"] is False and time_module.time() - record["since"] > API_SHAPE_RECHECK_UNSUPPORTED:
+                del self.records[name]
+                return None
+            return record["value"]
+
+    def remember(self, name: str, value):
+        with self.lock:
+            record = self.records.get(name)
+            if record and record["value"] == value:
+                record["errors"] = 0
+            else:
+                self.records[name] = {"value": value, "since": time_module.time(), "errors": 0}
+
+    def record_error(self, name: str):
+        with self.lock:
+            record = self.records.get(name)
+            if record is None:
+                return
+            record["errors"] += 1
+            if record["errors"] >= API_SHAPE_RECHECK_ERRORS:
+                del self.records[name]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                name: {
+                    "value": str(record["value"]),
+                    "since": datetime.fromtimestamp(record["since"], IST).strftime("%d/%m %H:%M:%S"),
+                    "errors": record["errors"],
+                }
+                for name, record in self.records.items()
+            }
+
+
+@st.cache_resource
+def get_api_shape() -> ApiShape:
+    return ApiShape()
+
+
+# ---------- Read cache ----------
+
+class MemoryCacheBackend:
+    """Cache backend living in this process; the default, and the stand-in for the shared ones."""
+
+    shared = False
+
+    def __init__(self):
+        self.values = {}     # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+    def get_many(self, keys: list) -> list:
+        now = time_module.time()
+        with self.lock:
+            entries = [self.values.get(key) for key in keys]
+        return [entry[1] if entry and entry[0] > now else None for entry in entries]
+
+    def set(self, key: str, value: str, ttl: float):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values: dict, ttl: float):
+        now = time_module.time()
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = (now + ttl, value)
+            if len(self.values) > 10000:
+                self.values = {k: v for k, v in self.values.items() if v[0] > now}
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            entry = self.values.get(key)
+            value = int(entry[1]) + 1 if entry else 1
+            self.values[key] = (float("inf"), str(value))
+            return value
+
+
+class SqliteCacheBackend:
+    """Cache backend in a SQLite file, shared by the Streamlit processes of one host."""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get_many(self, keys: list) -> list:
+        db = self._connect()
+        try:
+            rows = dict(db.execute(
+                f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(keys))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (*keys, time_module.time())
+            ))
+        finally:
+            db.close()
+        return [rows.get(key) for key in keys]
+
+    def set(self, key: str, value: str, ttl: float):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values: dict, ttl: float):
+        now = time_module.time()
+        db = self._connect()
+        try:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                               [(key, value, now + ttl) for key, value in values.items()])
+                if random.random() < 0.01:
+                    db.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+        finally:
+            db.close()
+
+    def incr(self, key: str) -> int:
+        db = self._connect()
+        try:
+            with db:
+                db.execute(
+                    "INSERT INTO kv (key, value, expires_at) VALUES (?, '1', NULL)"
+                    " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                    (key,)
+                )
+                return int(db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0])
+        finally:
+            db.close()
+
+
+class RedisCacheBackend:
+    """
+    Cache backend on a Redis-protocol server, shared by every host. Takes any
+    client with redis-py's mget/set(ex=)/incr/pipeline, so a local stand-in
+    can replace the server.
+    """
+
+    shared = True
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_many(self, keys: list) -> list:
+        return [v.decode() if isinstance(v, bytes) else v for v in self.client.mget(keys)]
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(key, value, ex=max(int(ttl), 1))
+
+    def set_many(self, values: dict, ttl: float):
+        pipe = self.client.pipeline()
+        for key, value in values.items():
+            pipe.set(key, value, ex=max(int(ttl), 1))
+        pipe.execute()
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+
+class FallbackCacheBackend:
+    """
+    A shared backend that degrades to this process's memory while it fails:
+    reads and writes go to a MemoryCacheBackend instead (generations start
+    again from "0") and the shared one is retried after CACHE_RETRY_INTERVAL.
+    Outages are logged once, not per call.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.local = MemoryCacheBackend()
+        self.shared = backend.shared
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+    def _call(self, method: str, *args):
+        if time_module.monotonic() >= self.down_until:
+            try:
+                result = getattr(self.backend, method)(*args)
+            except Exception as e:
+                with self.lock:
+                    if not self.down_until:
+                        logger.warning("Shared cache unreachable, using process memory: %s", e)
+                    self.down_until = time_module.monotonic() + CACHE_RETRY_INTERVAL
+            else:
+                if self.down_until:
+                    with self.lock:
+                        self.down_until = 0.0
+                    logger.warning("Shared cache reachable again")
+                return result
+        return getattr(self.local, method)(*args)
+
+    def get_many(self, keys: list) -> list:
+        return self._call("get_many", keys)
+
+    def set(self, key: str, value: str, ttl: float):
+        self._call("set", key, value, ttl)
+
+    def set_many(self, values: dict, ttl: float):
+        self._call("set_many", values, ttl)
+
+    def incr(self, key: str) -> int:
+        return self._call("incr", key)
+
+
+def make_cache_backend(kind: str, client=None):
+    """
+    Build the configured cache backend; `client` injects a Redis-protocol
+    client. Shared backends are wrapped in FallbackCacheBackend.
+    """
+    try:
+        if kind == "sqlite":
+            return FallbackCacheBackend(SqliteCacheBackend(CACHE_PATH))
+        if kind == "redis":
+            if client is None:
+                import redis  # optional dependency, only needed for cache_backend = "redis"
+                client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+            return FallbackCacheBackend(RedisCacheBackend(client))
+    except Exception as e:
+        logger.warning("Cache backend %r unavailable, using process memory: %s", kind, e)
+    return MemoryCacheBackend()
+
+
+@st.cache_resource
+def get_cache_backend():
+    return make_cache_backend(CACHE_BACKEND)
+
+
+def cache_key(*parts) -> str:
+    """Versioned key in the shared cache, so processes running different code never mix values."""
+    return f"ami:v{CACHE_SCHEMA_VERSION}:" + ":".join(str(p) for p in parts)
+
+
+class _Flight:
+    """One loader call in progress; sessions asking for the same key wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False   # invalidated while loading: hand out the value, don't cache it
+        self.abandoned = False   # the leader was interrupted (e.g. its script run stopped)
+
+
+class TTLCache:
+    """
+    Backend reads keyed on (endpoint, params), each endpoint with its own TTL,
+    shared by every session of the process. Concurrent misses on one key are
+    coalesced: the first caller loads, the others wait for its result.
+    Cached values are shared, so callers copy before changing them.
+
+    Keys carry generation counters kept in the cache backend, one per
+    endpoint and one per endpoint+phone. invalidate() bumps a counter, so a
+    write in any worker process retires the affected keys in all of them.
+    With a shared backend, reads given a `codec` (encode to JSON-able,
+    decode back) are also stored there for the other processes.
+    """
+
+    def __init__(self, ttls: dict, backend):
+        self.ttls = ttls
+        self.backend = backend
+        self.entries = {}    # (endpoint, generations, params) -> (expires_at, value)
+        self.inflight = {}   # same keys -> _Flight
+        self.lock = threading.Lock()
+        self.next_sweep = 0.0
+        self.hits = {}
+        self.misses = {}
+        self.coalesced = {}
+        self.shared_hits = {}
+
+    @staticmethod
+    def _generation_keys(endpoint: str, phone=None) -> list:
+        keys = [cache_key("gen", endpoint)]
+        if phone is not None:
+            keys.append(cache_key("gen", endpoint, "phone", phone))
+        return keys
+
+    def make_key(self, endpoint: str, params: dict | None) -> tuple:
+        params = tuple(sorted((params or {}).items()))
+        generations = tuple(g or "0" for g in self.backend.get_many(
+            self._generation_keys(endpoint, dict(params).get("phone"))
+        ))
+        return endpoint, generations, params
+
+    @staticmethod
+    def _count(counter: dict, endpoint: str):
+        counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    def get_or_load(self, endpoint: str, params: dict | None, loader, codec=None):
+        """
+        Return the cached value or call loader(); None results are not cached.
+        codec is an (encode, decode) pair for storing the value in a shared backend.
+        """
+        key = self.make_key(endpoint, params)
+        shared_key = cache_key(endpoint, ".".join(key[1]), json.dumps(key[2], default=str))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time_module.monotonic():
+                self._count(self.hits, endpoint)
+                return entry[1]
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = _Flight()
+                self._count(self.misses, endpoint)
+            else:
+                self._count(self.coalesced, endpoint)
+
+        if not leader:
+            flight.done.wait()
+            if flight.abandoned:
+                return self.get_or_load(endpoint, params, loader, codec)
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self._load_shared(endpoint, shared_key, loader, codec)
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            # StopException/RerunException belong to the leader's session only:
+            # wake the waiters so they load for themselves
+            flight.abandoned = True
+            raise
+        finally:
+            with self.lock:
+                if flight.error is None and flight.value is not None and not flight.stale:
+                    self._store(key, flight.value)
+                del self.inflight[key]
+            flight.done.set()
+        return flight.value
+
+    def _store(self, key: tuple, value):
+        """
+        Insert under self.lock. Keys carry since_id, filters and generations,
+        so they keep changing: expired entries are swept every
+        CACHE_SWEEP_INTERVAL and the oldest dropped past CACHE_MAX_ENTRIES.
+        """
+        now = time_module.monotonic()
+        self.entries.pop(key, None)   # re-insert at the end, keeping the dict in insertion order
+        self.entries[key] = (now + self.ttls.get(key[0], 0), value)
+        if now >= self.next_sweep:
+            self.entries = {k: entry for k, entry in self.entries.items() if entry[0] > now}
+            self.next_sweep = now + CACHE_SWEEP_INTERVAL
+        while len(self.entries) > CACHE_MAX_ENTRIES:
+            del self.entries[next(iter(self.entries))]
+
+    def _load_shared(self, endpoint: str, shared_key: str, loader, codec):
+        """Value from the shared backend if another process has loaded it, else from loader()."""
+        if codec is None or not self.backend.shared:
+            return loader()
+        encode, decode = codec
+        raw = self.backend.get_many([shared_key])[0]
+        if raw is not None:
+            with self.lock:
+                self._count(self.shared_hits, endpoint)
+            return decode(json.loads(raw))
+        value = loader()
+        if value is not None:
+            self.backend.set(shared_key, json.dumps(encode(value)), self.ttls.get(endpoint, 0))
+        return value
+
+    @staticmethod
+    def _matches(key: tuple, endpoint: str, match: dict) -> bool:
+        key_endpoint, _, key_params = key
+        if key_endpoint != endpoint:
+            return False
+        params = dict(key_params)
+        return all(params.get(name) == value for name, value in match.items())
+
+    def invalidate(self, endpoint: str, **match):
+        """
+        Retire the endpoint's keys whose params contain every given name=value,
+        in every process. Only phone is versioned on its own; other names
+        retire the whole endpoint.
+        """
+        phone = match.get("phone") if set(match) == {"phone"} else None
+        self.backend.incr(self._generation_keys(endpoint, phone)[-1])
+        with self.lock:
+            for key in list(self.entries):
+                if self._matches(key, endpoint, match):
+                    del self.entries[key]
+            for key, flight in self.inflight.items():
+                if self._matches(key, endpoint, match):
+                    flight.stale = True
+
+    def stats(self) -> dict:
+        with self.lock:
+            endpoints = sorted(set(self.hits) | set(self.misses) | set(self.coalesced))
+            return {
+                ep: {
+                    "hits": self.hits.get(ep, 0),
+                    "misses": self.misses.get(ep, 0),
+                    "coalesced": self.coalesced.get(ep, 0),
+                    "shared hits": self.shared_hits.get(ep, 0),
+                    "entries": sum(1 for key in self.entries if key[0] == ep),
+                }
+                for ep in endpoints
+            }
+
+
+@st.cache_resource
+def get_read_cache() -> TTLCache:
+    return TTLCache(CACHE_TTLS, get_cache_backend())
+
+
+# (encode, decode) pairs for TTLCache.get_or_load values kept in a shared backend
+JSON_CODEC = (lambda value: value, lambda value: value)
+MESSAGES_CODEC = (lambda messages: [message_to_raw(m) for m in messages], to_messages)
+
+
+@st.cache_resource
+def get_summary_cache() -> dict:
+    """Contact summaries per phone (see fetch_contact_summaries), shared by every session."""
+    return {}
+
+
+def invalidate_phone(phone: str, contacts: bool = False):
+    """Forget cached reads for one phone after a write; optionally the contact list too."""
+    cache = get_read_cache()
+    stores = st.session_state.get("conv_stores", {})
+    if phone:
+        cache.invalidate("conversation", phone=phone)
+        cache.invalidate("conversation_poll", phone=phone)
+        get_summary_cache().pop(phone, None)
+        if phone in stores:
+            stores[phone].synced_at = 0  # poll on the next rerun
+    else:
+        cache.invalidate("conversation")
+        cache.invalidate("conversation_poll")
+        get_summary_cache().clear()
+        for store in stores.values():
+            store.synced_at = 0
+    if contacts:
+        cache.invalidate("contacts")
+        cache.invalidate("follow_up_counts")
+
+
+# -------------------------------------------
+
+# ---------- Contact index ----------
+
+NGRAM_SIZE = 3   # queries this long or longer are answered from the n-gram index
+
+
+def _ngrams(text: str) -> set:
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class ContactStore:
+    """
+    Contacts indexed once per /contacts refresh: sorted once, a phone dict for
+    O(1) lookup, pre-normalized keys and n-gram posting sets for substring search.
+    """
+
+    def __init__(self, contacts: list):
+        self.contacts = sorted(
+            contacts,
+            key=lambda c: (str(c.get("client_name") or "").lower(), str(c.get("phone") or ""))
+        )
+        self.by_phone = {}
+        self.names = []
+        self.phones = []
+        self.name_index = {}     # n-gram -> positions in self.contacts
+        self.phone_index = {}
+        for i, contact in enumerate(self.contacts):
+            name = str(contact.get("client_name") or "").lower()
+            phone = str(contact.get("phone") or "")
+            self.by_phone.setdefault(phone, contact)
+            self.names.append(name)
+            self.phones.append(phone.lower())
+            for gram in _ngrams(name):
+                self.name_index.setdefault(gram, set()).add(i)
+            for gram in _ngrams(phone.lower()):
+                self.phone_index.setdefault(gram, set()).add(i)
+
+    def __len__(self):
+        return len(self.contacts)
+
+    def get(self, phone: str) -> dict | None:
+        return self.by_phone.get(phone)
+
+    def _matches(self, query: str, keys: list, index: dict) -> set:
+        """Positions whose key contains query."""
+        if len(query) < NGRAM_SIZE:
+            return {i for i, key in enumerate(keys) if query in key}
+        postings = sorted((index.get(gram, set()) for gram in _ngrams(query)), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+        # Sharing every n-gram doesn't guarantee a contiguous match, so confirm it
+        return {i for i in candidates if query in keys[i]}
+
+    def search(self, query: str = "", phone_query: str = "", name_query: str = "") -> list:
+        """
+        Contacts (in sorted order) whose name or phone contains query, whose
+        phone contains phone_query and whose name contains name_query.
+        Empty queries don't filter; matching is case-insensitive.
+        """
+        query, phone_query, name_query = (q.strip().lower() for q in (query, phone_query, name_query))
+        if not (query or phone_query or name_query):
+            return list(self.contacts)
+
+        positions = None
+        if phone_query:
+            positions = self._matches(phone_query, self.phones, self.phone_index)
+        if name_query:
+            found = self._matches(name_query, self.names, self.name_index)
+            positions = found if positions is None else positions & found
+        if query:
+            found = (self._matches(query, self.names, self.name_index)
+                     | self._matches(query, self.phones, self.phone_index))
+            positions = found if positions is None else positions & found
+        return [self.contacts[i] for i in sorted(positions)]
+
+
+# -------------------------------------------
+
+def _load_contacts(only_follow_up: bool):
+    response = make_request_with_retry(
+        f"{API_BASE}/contacts",
+        params={"only_follow_up": only_follow_up}
+    )
+    if response and response.status_code == 200:
+        return response.json()
     return None
 
 
-def fetch_contacts(only_follow_up: bool):
-    """Fetch contacts from backend API with retry logic"""
+def fetch_contacts(only_follow_up: bool) -> ContactStore:
+    """Fetch contacts from backend API with retry logic, indexed into a ContactStore"""
     try:
-        response = make_request_with_retry(
-            f"{API_BASE}/contacts",
-            params={"only_follow_up": only_follow_up}
+        def load():
+            contacts = _load_contacts(only_follow_up)
+            if contacts is None:
+                return None
+            # Backends that return the chatbot flag with the contact save the per-phone lookups
+            get_automation_flags().put_many({
+                c["phone"]: c["automation_enabled"]
+                for c in contacts if c.get("phone") and "automation_enabled" in c
+            })
+            return ContactStore(contacts)
+
+        store = get_read_cache().get_or_load(
+            "contacts", {"only_follow_up": only_follow_up}, load,
+            codec=(lambda store: store.contacts, ContactStore)
         )
 
-        if response and response.status_code == 200:
-            return response.json()
+        if store is not None:
+            return store
         else:
             st.warning("Failed to fetch contacts. Please try again.")
-            return []
+            return ContactStore([])
 
     except Exception as e:
         st.warning(f"Could not fetch contacts: {str(e)}")
-        return [
+        return ContactStore([
             {"phone": "1234567890", "client_name": "John Doe", "follow_up_open": False},
             {"phone": "9876543210", "client_name": "Jane Smith", "follow_up_open": True},
             {"phone": "5555555555", "client_name": "Test Client", "follow_up_open": False}
-        ]
+        ])
+
+
+CONVERSATION_SHAPES = ("path", "query")   # /conversation/{phone} or /conversation?phone=
+
+
+def conversation_url(shape: str, phone: str) -> str:
+    if shape == "path":
+        return f"{API_BASE}/conversation/{phone}"
+    return f"{API_BASE}/conversation"
+
+
+def _load_conversation(phone: str, limit: int, offset: int, **extra):
+    """
+    Fetch one conversation page through the endpoint shape remembered in
+    get_api_shape(); the shapes are only probed when none is remembered.
+    """
+    api_shape = get_api_shape()
+    params = {"phone": phone, "limit": limit, "offset": offset, **extra}
+
+    known = api_shape.get("conversation")
+    if known:
+        try:
+            response = make_request_with_retry(conversation_url(known, phone), params=params)
+        except CircuitOpenError:
+            return None
+        except Exception:
+            api_shape.record_error("conversation")
+            return None
+        api_shape.remember("conversation", known)
+        return response.json()
+
+    for shape in CONVERSATION_SHAPES:
+        try:
+            response = make_request_with_retry(conversation_url(shape, phone), params=params, max_retries=1)
+        except Exception:
+            continue
+
+        if response and response.status_code == 200:
+            api_shape.remember("conversation", shape)
+            return response.json()
+
+    return None
+
+
+def cached_conversation(phone: str, limit: int, offset: int = 0):
+    """
+    One conversation page as Message records through the read cache, or None
+    when it could not be loaded. Makes no Streamlit UI calls, so it is safe
+    to run on the fan-out pool.
+    """
+    def load():
+        page = _load_conversation(phone, limit, offset)
+        return to_messages(page) if page is not None else None
+
+    return get_read_cache().get_or_load(
+        "conversation",
+        {"phone": phone, "limit": limit, "offset": offset},
+        load,
+        codec=MESSAGES_CODEC
+    )
 
 
 def fetch_conversation(phone: str, limit: int = 50, offset: int = 0):
@@ -1460,33 +2231,15 @@ def fetch_conversation(phone: str, limit: int = 50, offset: int = 0):
         if not phone:
             return []
 
-        endpoints_to_try = [
-            f"{API_BASE}/conversation/{phone}",
-            f"{API_BASE}/conversation"
-        ]
-
-        for endpoint in endpoints_to_try:
-            try:
-                response = make_request_with_retry(
-                    endpoint,
-                    params={"phone": phone, "limit": limit, "offset": offset}
-                )
-
-                if response and response.status_code == 200:
-                    return response.json()
-                elif response and response.status_code == 404:
-                    continue
-
-            except Exception:
-                continue
-
-        return []
+        conv = cached_conversation(phone, limit, offset)
+        # Callers filter and sort in place; keep the cached list intact
+        return list(conv) if conv is not None else []
 
     except Exception as e:
         st.warning(f"Could not fetch conversation: {str(e)}")
         if phone:
             current_time = datetime.now(IST)
-            return [
+            return to_messages([
                 {
                     "id": 1,
                     "phone": phone,
@@ -1517,159 +2270,1444 @@ def fetch_conversation(phone: str, limit: int = 50, offset: int = 0):
                     "notes": "",
                     "handled_by": ""
                 }
-            ]
+            ])
         return []
 
 
-def delete_conversation(phone: str):
-    try:
-        response = make_request_with_retry(f"{API_BASE}/conversation/{phone}", method="DELETE")
-        return response and response.status_code == 200
-    except:
-        return False
+def delete_conversation(phone: str):
+    try:
+        response = make_request_with_retry(f"{API_BASE}/conversation/{phone}", method="DELETE")
+        ok = response and response.status_code == 200
+        if ok:
+            invalidate_phone(phone, contacts=True)
+            st.session_state.get("conv_stores", {}).pop(phone, None)
+        return ok
+    except:
+        return False
+
+
+def delete_message(msg_id: int, phone: str = ""):
+    """Delete one message; without a phone every cached conversation is dropped."""
+    try:
+        response = make_request_with_retry(f"{API_BASE}/message/{msg_id}", method="DELETE")
+        ok = response and response.status_code == 200
+        if ok:
+            invalidate_phone(phone)
+            for store in st.session_state.get("conv_stores", {}).values():
+                store.drop(msg_id)
+        return ok
+    except:
+        return False
+
+
+def update_follow_up(phone: str, msg_id: int, follow_up_needed: bool, notes: str, handled_by: str) -> bool:
+    """PATCH follow-up fields of a message. Raises on request errors."""
+    response = make_request_with_retry(
+        f"{API_BASE}/message/{msg_id}",
+        method="PATCH",
+        json_data={"follow_up_needed": follow_up_needed, "notes": notes, "handled_by": handled_by}
+    )
+    ok = response and response.status_code == 200
+    if ok:
+        invalidate_phone(phone, contacts=True)
+        store = st.session_state.get("conv_stores", {}).get(phone)
+        if store:
+            store.apply_update(msg_id, follow_up_needed=follow_up_needed, notes=notes, handled_by=handled_by)
+    return ok
+
+
+# ---------- NEW: automation helpers ----------
+
+AUTOMATION_TTL = 60             # seconds a chatbot flag stays fresh
+AUTOMATION_BATCH_SIZE = 100     # phones per bulk /automation call
+AUTOMATION_FALLBACK_MAX = 25    # per-phone fetches allowed per rerun without a bulk endpoint
+AUTOMATION_KEEP = 24 * 3600     # seconds a flag is kept in the cache backend (shown while refreshing)
+
+
+class AutomationFlags:
+    """
+    automation_enabled per phone, kept in the cache backend so every session
+    (and, with a shared backend, every worker process) sees the same flags.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def lookup(self, phones) -> tuple[dict, list]:
+        """(flags known for the phones, phones whose flag is missing or older than AUTOMATION_TTL)."""
+        phones = list(phones)
+        if not phones:
+            return {}, []
+        now = time_module.time()
+        known, stale = {}, []
+        entries = self.backend.get_many([cache_key("automation", phone) for phone in phones])
+        for phone, raw in zip(phones, entries):
+            entry = json.loads(raw) if raw else None   # [enabled, fetched_at]
+            if entry is not None:
+                known[phone] = entry[0]
+            if entry is None or now - entry[1] > AUTOMATION_TTL:
+                stale.append(phone)
+        return known, stale
+
+    def put(self, phone: str, enabled: bool):
+        self.put_many({phone: enabled})
+
+    def put_many(self, flags: dict):
+        now = time_module.time()
+        self.backend.set_many(
+            {cache_key("automation", phone): json.dumps([bool(enabled), now]) for phone, enabled in flags.items()},
+            AUTOMATION_KEEP
+        )
+
+
+@st.cache_resource
+def get_automation_flags() -> AutomationFlags:
+    return AutomationFlags(get_cache_backend())
+
+
+def _load_automation(phone: str) -> bool | None:
+    try:
+        response = make_request_with_retry(f"{API_BASE}/automation/{phone}", method="GET")
+        if response and response.status_code == 200:
+            return bool(response.json().get("automation_enabled", True))
+    except Exception:
+        pass
+    return None
+
+
+def _fetch_automation_batch(phones: list) -> dict | None:
+    """
+    Ask the backend for the flags of many phones at once.
+    Returns None when the backend has no bulk endpoint.
+    """
+    try:
+        response = make_request_with_retry(f"{API_BASE}/automation", params={"phones": ",".join(phones)})
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 405):
+            return None
+        raise
+    if not response or response.status_code != 200:
+        return None
+
+    data = response.json()
+    if isinstance(data, dict):   # {phone: flag} or {phone: {"automation_enabled": flag}}
+        return {
+            str(p): bool(v.get("automation_enabled", True) if isinstance(v, dict) else v)
+            for p, v in data.items()
+        }
+    return {
+        str(row.get("phone")): bool(row.get("automation_enabled", True))
+        for row in data if row.get("phone")
+    }
+
+
+def fetch_automation_flags(phones: list) -> dict:
+    """
+    Chatbot flags for the given phones from the shared map, refreshing the
+    stale ones. Uses the bulk /automation?phones= endpoint when the backend
+    has one, else up to AUTOMATION_FALLBACK_MAX concurrent per-phone GETs per
+    rerun. Phones without a known flag are left out.
+    """
+    flags = get_automation_flags()
+    api_shape = get_api_shape()
+    _, stale = flags.lookup([p for p in phones if p])
+
+    if stale and api_shape.get("automation_batch") is not False:
+        for i in range(0, len(stale), AUTOMATION_BATCH_SIZE):
+            chunk = stale[i:i + AUTOMATION_BATCH_SIZE]
+            try:
+                batch = _fetch_automation_batch(chunk)
+            except Exception:
+                break  # backend trouble, keep what we have for now
+            if batch is None:
+                api_shape.remember("automation_batch", False)
+                break
+            api_shape.remember("automation_batch", True)
+            # The chatbot is ON for phones the backend has no row for
+            flags.put_many({p: batch.get(p, True) for p in chunk})
+        _, stale = flags.lookup(stale)
+
+    if stale and api_shape.get("automation_batch") is False:
+        targets = stale[:AUTOMATION_FALLBACK_MAX]
+        results = run_concurrently(_load_automation, targets)
+        flags.put_many({p: enabled for p, enabled in zip(targets, results) if enabled is not None})
+
+    known, _ = flags.lookup(phones)
+    return known
+
+
+def fetch_automation_status(phone: str) -> bool:
+    """
+    Get automation_enabled flag for a specific phone.
+    Default: True (chatbot ON) if anything fails.
+    """
+    return fetch_automation_flags([phone]).get(phone, True)
+
+
+def set_automation_status(phone: str, enabled: bool) -> bool:
+    """
+    Update automation_enabled flag for a specific phone. The shared map is
+    updated first so every session shows the new state at once, and put
+    back if the backend refuses.
+    """
+    flags = get_automation_flags()
+    previous, _ = flags.lookup([phone])
+    flags.put(phone, enabled)
+    try:
+        response = make_request_with_retry(
+            f"{API_BASE}/automation/{phone}",
+            method="PATCH",
+            json_data={"automation_enabled": enabled}
+        )
+        ok = bool(response and response.status_code == 200)
+    except Exception:
+        ok = False
+    if not ok:
+        flags.put(phone, previous.get(phone, not enabled))
+    return ok
+
+
+# -------------------------------------------
+
+@dataclass(frozen=True)
+class ConversationQuery:
+    """The date/time filter panel as a backend query (IST day and time-of-day window)."""
+    day: date | None = None
+    time_from: time | None = None
+    time_to: time | None = None
+
+    @classmethod
+    def from_session(cls) -> "ConversationQuery":
+        by_time = st.session_state.filter_by_time
+        return cls(
+            day=st.session_state.filter_date if st.session_state.filter_by_date else None,
+            time_from=st.session_state.filter_time_from if by_time else None,
+            time_to=st.session_state.filter_time_to if by_time else None,
+        )
+
+    @property
+    def active(self) -> bool:
+        return bool(self.day or (self.time_from and self.time_to))
+
+    def to_params(self) -> dict:
+        """Backend query params; datetimes carry the IST offset."""
+        params = {}
+        if self.day:
+            start = IST.localize(datetime.combine(self.day, time(0, 0)))
+            params["date_from"] = start.isoformat()
+            params["date_to"] = (start + timedelta(days=1)).isoformat()
+        if self.time_from and self.time_to:
+            params["time_from"] = self.time_from.strftime("%H:%M:%S")
+            params["time_to"] = self.time_to.strftime("%H:%M:%S")
+        return params
+
+    def matches(self, msg: Message) -> bool:
+        if self.day and msg.day != self.day:
+            return False
+        if self.time_from and self.time_to and not (self.time_from <= msg.dt.time() <= self.time_to):
+            return False
+        return True
+
+    def passed(self, msg: Message) -> bool:
+        """True once a newest-first scan has gone past the start of the range."""
+        return bool(self.day and msg.day < self.day)
+
+
+# ---------- Conversation rendering ----------
+
+def _highlight(escaped_text: str, search_query: str) -> str:
+    pattern = re.escape(search_query.strip())
+
+    def repl(m):
+        return (
+            '<span style="background-color: #ffd700; padding: 0 1px; '
+            'border-radius: 2px;">'
+            f'{html.escape(m.group(0))}</span>'
+        )
+
+    try:
+        return re.sub(pattern, repl, escaped_text, flags=re.IGNORECASE)
+    except:
+        return escaped_text
+
+
+@st.cache_data(max_entries=5000, show_spinner=False)
+def render_message_html(msg_id, text: str, direction: str, notes: str, handled_by: str,
+                        time_label: str, search_query: str, status: str = "") -> str:
+    """
+    One message bubble as HTML, memoized across reruns and sessions.
+    Content fields are part of the key so edited notes/handlers re-render;
+    colours come from CSS custom properties, so the HTML is the same in both themes.
+    """
+    display_text = html.escape(text)
+    if search_query and search_query.strip():
+        display_text = _highlight(display_text, search_query)
+    display_text = display_text.replace("\n", "<br>")
+
+    # No blank lines or indentation: the bubbles are joined into one markdown block
+    parts = [
+        f'<div class="message-row {direction}">',
+        f'<div class="message-bubble {direction}">',
+        f'<div class="message-text">{display_text}</div>',
+    ]
+    if notes:
+        parts.append(
+            '<div style="font-size: 11px; color: var(--ami-message-meta); '
+            'margin-top: 4px; border-top: 1px solid var(--ami-notes-rule); '
+            f'padding-top: 2px;">📝 {html.escape(notes)}</div>'
+        )
+    if handled_by:
+        parts.append(f'<div class="handler-meta">👤 {html.escape(handled_by)}</div>')
+    status_html = ""
+    if status:
+        icon, title = OUTBOX_STATUS_ICONS.get(status, ("🕓", status))
+        status_html = f' <span class="message-status sent" title="{title}">{icon}</span>'
+    parts.append(f'<div class="message-time">{time_label}{status_html}</div>')
+    parts.append("</div></div>")
+    return "".join(parts)
+
+
+def _date_label(day: date, today: date) -> str:
+    if day == today:
+        return "Today"
+    elif day == today - timedelta(days=1):
+        return "Yesterday"
+    return day.strftime("%B %d, %Y")
+
+
+def render_conversation_html(messages, search_query: str) -> str:
+    """
+    The whole conversation (date separators, bubbles, notes, handlers) as one
+    HTML payload, so a page of messages is a single Streamlit element.
+    """
+    today = datetime.now(IST).date()
+    parts = []
+    current_date = None
+    for msg in messages:
+        if current_date != msg.day:
+            current_date = msg.day
+            parts.append(
+                '<div style="text-align: center; margin: 16px 0; color: var(--ami-text-muted); font-size: 12px;">'
+                f'{_date_label(msg.day, today)}</div>'
+            )
+        parts.append(render_message_html(
+            msg.id, msg.text, msg.direction.value, msg.notes, msg.handled_by,
+            format_message_time(msg.dt), search_query or "", msg.status
+        ))
+    return "".join(parts)
+
+
+def send_whatsapp_message(phone: str, message_text: str,
+                          msg_type: str = "text",
+                          template_name: str | None = None) -> bool:
+    """
+    Queue a message for the Make.com webhook (which handles the WhatsApp API).
+    Returns as soon as it is in the outbox; the outbox worker delivers and logs it.
+    """
+    if not MAKE_WEBHOOK_URL:
+        st.error("Make webhook URL not configured (set 'make_webhook_url' in Streamlit secrets).")
+        return False
+
+    try:
+        get_outbox().enqueue(phone, message_text, msg_type, template_name)
+        get_outbox_worker().wake()
+        return True
+    except Exception as e:
+        st.error(f"Send error: {e}")
+        return False
+
+
+def post_to_webhook(phone: str, message_text: str, msg_type: str, template_name: str | None,
+                    idempotency_key: str) -> bool:
+    """
+    POST one message to the Make webhook, once (WEBHOOK_RETRY_POLICY). The
+    idempotency key goes in the payload and the Idempotency-Key header, so a
+    scenario that checks it can drop a POST the outbox sends again.
+    """
+    payload = {
+        "phone": phone,
+        "message": message_text,
+        "type": msg_type,
+        "idempotency_key": idempotency_key,
+    }
+    if msg_type == "template" and template_name:
+        payload["template_name"] = template_name
+
+    response = make_request_with_retry(
+        MAKE_WEBHOOK_URL, method="POST", json_data=payload,
+        headers={"Idempotency-Key": idempotency_key}, policy=WEBHOOK_RETRY_POLICY
+    )
+    return bool(response and response.status_code in (200, 201, 202))
+
+
+def log_sent_message(phone: str, message: str, msg_type: str = "text",
+                     sent_at: datetime | None = None, idempotency_key: str | None = None) -> bool:
+    """
+    Log sent message to backend database with IST timestamp.
+    Called from the outbox worker, so it raises instead of touching the page.
+    """
+    payload = _log_payload(phone, message, msg_type, sent_at or datetime.now(IST), idempotency_key)
+    response = make_request_with_retry(f"{API_BASE}/log_message", method="POST", json_data=payload)
+    return bool(response and response.status_code == 200)
+
+
+def _log_payload(phone: str, message: str, msg_type: str, sent_at: datetime,
+                 idempotency_key: str | None) -> dict:
+    payload = {
+        "phone": phone,
+        "message": message,
+        "direction": "Dashboard User",   # not used by backend, it forces 'dashboard'
+        "message_type": msg_type,
+        "timestamp": sent_at.isoformat(),
+        "follow_up_needed": False,
+        "notes": "",
+        "handled_by": "Dashboard User"
+    }
+    if idempotency_key:
+        payload["client_msg_id"] = idempotency_key
+    return payload
+
+
+def log_sent_messages(jobs: list) -> dict:
+    """
+    Log many sent outbox rows. Uses the batch /log_messages endpoint when the
+    backend has one (remembered in get_api_shape()), else one /log_message
+    call per row. Returns idempotency key -> error message or None if logged.
+    """
+    api_shape = get_api_shape()
+    if len(jobs) > 1 and api_shape.get("log_batch") is not False:
+        try:
+            response = make_request_with_retry(
+                f"{API_BASE}/log_messages", method="POST",
+                json_data={"messages": [
+                    _log_payload(job["phone"], job["message"], job["msg_type"],
+                                 datetime.fromtimestamp(job["created_at"], IST), job["idempotency_key"])
+                    for job in jobs
+                ]}
+            )
+            if response and response.status_code in (200, 201):
+                api_shape.remember("log_batch", True)
+                return {job["idempotency_key"]: None for job in jobs}
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code in (404, 405):
+                api_shape.remember("log_batch", False)
+            else:
+                api_shape.record_error("log_batch")
+                return {job["idempotency_key"]: str(e) for job in jobs}
+        except Exception as e:
+            api_shape.record_error("log_batch")
+            return {job["idempotency_key"]: str(e) for job in jobs}
+
+    results = {}
+    for job in jobs:
+        try:
+            ok = log_sent_message(job["phone"], job["message"], job["msg_type"],
+                                  datetime.fromtimestamp(job["created_at"], IST), job["idempotency_key"])
+            results[job["idempotency_key"]] = None if ok else "log_message did not accept the message"
+        except Exception as e:
+            results[job["idempotency_key"]] = str(e)
+    return results
+
+
+def queue_broadcast(phones: list, message_text: str, template_name: str, audience: str) -> int | None:
+    """Queue one template message per phone as a broadcast run; the outbox worker paces it."""
+    if not MAKE_WEBHOOK_URL:
+        st.error("Make webhook URL not configured (set 'make_webhook_url' in Streamlit secrets).")
+        return None
+
+    try:
+        broadcast_id = get_outbox().start_broadcast(phones, message_text, "template", template_name, audience)
+        get_outbox_worker().wake()
+        return broadcast_id
+    except Exception as e:
+        st.error(f"Broadcast error: {e}")
+        return None
+
+
+# ---------- Outbox ----------
+
+# status -> (icon, tooltip) shown in the optimistic bubble
+OUTBOX_STATUS_ICONS = {
+    "queued": ("🕓", "Waiting to send"),
+    "sending": ("🕓", "Sending"),
+    "sent": ("✓", "Sent, saving to history"),
+    "logging": ("✓", "Sent, saving to history"),
+    "log_failed": ("✓", "Sent, but not saved to history"),
+    "failed": ("⚠️", "Not sent"),
+    "paused": ("⏸️", "Broadcast paused"),
+}
+
+
+class TokenBucket:
+    """
+    Blocking token bucket: `rate` tokens per second, at most `capacity` saved
+    up. The state lives in a SQLite file (the outbox's), so every worker
+    process draining that outbox shares one rate instead of each sending at it.
+    """
+
+    def __init__(self, path: str, name: str, rate: float, capacity: int):
+        self.path = path
+        self.name = name
+        self.rate = max(rate, 0.01)
+        self.capacity = max(capacity, 1)
+        with sqlite3.connect(self.path, timeout=10) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    def _take(self) -> float:
+        """Take a token if one is available; returns 0, or the seconds until one will be."""
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")   # read-modify-write under the file's write lock
+            now = time_module.time()
+            row = db.execute("SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + max(now - row[1], 0) * self.rate)
+            wait_for = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if tokens >= 1:
+                tokens -= 1
+            db.execute("INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)",
+                       (self.name, tokens, now))
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        return wait_for
+
+    def acquire(self):
+        while True:
+            wait_for = self._take()
+            if not wait_for:
+                return
+            time_module.sleep(wait_for)
+
+
+class Outbox:
+    """
+    Outgoing messages persisted in SQLite so they survive reruns and restarts.
+
+    queued -> sending -> sent -> logging -> logged, with failed/log_failed
+    once OUTBOX_MAX_ATTEMPTS is used up. Webhook and log attempts are counted
+    separately (attempts, log_attempts). Each row has an idempotency key that
+    goes with the webhook POST and the /log_message write. A row is only
+    POSTed again if it never reached "sent" or its claim lease ran out.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE NOT NULL,
+                    phone TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    msg_type TEXT NOT NULL,
+                    template_name TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    claimed_at REAL
+                )
+            """)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(outbox)")}
+            if "broadcast_id" not in columns:
+                db.execute("ALTER TABLE outbox ADD COLUMN broadcast_id INTEGER")
+            if "log_attempts" not in columns:
+                db.execute("ALTER TABLE outbox ADD COLUMN log_attempts INTEGER NOT NULL DEFAULT 0")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    template_name TEXT,
+                    message TEXT NOT NULL,
+                    audience TEXT,
+                    total INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_phone ON outbox (phone, status)")
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, next_attempt_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_broadcast ON outbox (broadcast_id, status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _query(self, sql: str, params=()) -> list:
+        db = self._connect()
+        try:
+            with db:
+                return [dict(row) for row in db.execute(sql, params)]
+        finally:
+            db.close()
+
+    def _update(self, sql: str, params=()) -> int:
+        db = self._connect()
+        try:
+            with db:
+                return db.execute(sql, params).rowcount
+        finally:
+            db.close()
+
+    def enqueue(self, phone: str, message: str, msg_type: str = "text", template_name: str | None = None) -> str:
+        key = uuid.uuid4().hex
+        now = time_module.time()
+        self._update(
+            "INSERT INTO outbox (idempotency_key, phone, message, msg_type, template_name, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, phone, message, msg_type, template_name, now, now)
+        )
+        return key
+
+    def _claim(self, source: str, target: str, limit: int) -> list:
+        """
+        Atomically move up to `limit` due rows from `source` to `target`, also
+        taking back rows stuck in `target` past their lease. Single messages
+        go before broadcast rows so an agent's reply never waits on a campaign.
+        The update only wins if the row is still as it was read, so two
+        processes reclaiming the same expired row cannot both get it.
+        """
+        now = time_module.time()
+        rows = self._query(
+            "SELECT * FROM outbox WHERE next_attempt_at <= ? AND ("
+            " status = ? OR (status = ? AND claimed_at < ?)"
+            ") ORDER BY broadcast_id IS NOT NULL, id LIMIT ?",
+            (now, source, target, now - OUTBOX_LEASE, limit)
+        )
+        claimed = []
+        for row in rows:
+            if self._update(
+                "UPDATE outbox SET status = ?, claimed_at = ?, updated_at = ?"
+                " WHERE id = ? AND status = ? AND claimed_at IS ?",
+                (target, now, now, row["id"], row["status"], row["claimed_at"])
+            ):
+                claimed.append({**row, "status": target})
+        return claimed
+
+    def claim_send(self) -> dict | None:
+        """The next message due for the webhook."""
+        jobs = self._claim("queued", "sending", 1)
+        return jobs[0] if jobs else None
+
+    def claim_logs(self, limit: int) -> list:
+        """Sent messages due for writing to the backend."""
+        return self._claim("sent", "logging", limit)
+
+    def mark(self, key: str, status: str, error: str | None = None):
+        now = time_module.time()
+        self._update(
+            "UPDATE outbox SET status = ?, last_error = ?, next_attempt_at = 0, updated_at = ?"
+            " WHERE idempotency_key = ?",
+            (status, error, now, key)
+        )
+
+    def retry_later(self, job: dict, error: str, exhausted_status: str):
+        """Put a job back (sending -> queued, logging -> sent) with backoff, or give up."""
+        sending = job["status"] == "sending"
+        column = "attempts" if sending else "log_attempts"
+        attempts = job[column] + 1
+        now = time_module.time()
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            status, next_at = exhausted_status, 0
+        else:
+            status = "queued" if sending else "sent"
+            next_at = now + DEFAULT_RETRY_POLICY.backoff(attempts) + 2 ** attempts
+        self._update(
+            f"UPDATE outbox SET status = ?, {column} = ?, last_error = ?, next_attempt_at = ?, updated_at = ?"
+            " WHERE idempotency_key = ?",
+            (status, attempts, error, next_at, now, job["idempotency_key"])
+        )
+
+    def requeue_failed(self, phone: str | None = None, broadcast_id: int | None = None) -> int:
+        """Give failed sends of a phone or of a broadcast run a fresh set of attempts."""
+        column, value = ("broadcast_id", broadcast_id) if broadcast_id is not None else ("phone", phone)
+        now = time_module.time()
+        return self._update(
+            "UPDATE outbox SET status = 'queued', attempts = 0, next_attempt_at = 0, updated_at = ?"
+            f" WHERE {column} = ? AND status = 'failed'",
+            (now, value)
+        )
+
+    def requeue_log_failed(self, phone: str) -> int:
+        """Give a phone's sent-but-unlogged messages a fresh set of log attempts."""
+        now = time_module.time()
+        return self._update(
+            "UPDATE outbox SET status = 'sent', log_attempts = 0, next_attempt_at = 0, updated_at = ?"
+            " WHERE phone = ? AND status = 'log_failed'",
+            (now, phone)
+        )
+
+    def start_broadcast(self, phones: list, message: str, msg_type: str, template_name: str | None,
+                        audience: str) -> int:
+        """Queue one row per distinct phone under a new broadcast run, in one transaction."""
+        phones = list(dict.fromkeys(p for p in phones if p))
+        now = time_module.time()
+        db = self._connect()
+        try:
+            with db:
+                broadcast_id = db.execute(
+                    "INSERT INTO broadcasts (template_name, message, audience, total, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (template_name, message, audience, len(phones), now)
+                ).lastrowid
+                db.executemany(
+                    "INSERT INTO outbox (idempotency_key, phone, message, msg_type, template_name,"
+                    " created_at, updated_at, broadcast_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(uuid.uuid4().hex, phone, message, msg_type, template_name, now, now, broadcast_id)
+                     for phone in phones]
+                )
+        finally:
+            db.close()
+        return broadcast_id
+
+    def set_broadcast_paused(self, broadcast_id: int, paused: bool) -> int:
+        """Hold back (or release) the rows of a run that have not been claimed yet."""
+        source, target = ("queued", "paused") if paused else ("paused", "queued")
+        now = time_module.time()
+        return self._update(
+            "UPDATE outbox SET status = ?, updated_at = ? WHERE broadcast_id = ? AND status = ?",
+            (target, now, broadcast_id, source)
+        )
+
+    def broadcasts(self, limit: int = 5) -> list:
+        """Most recent runs, newest first, each with a status -> count map."""
+        runs = self._query("SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,))
+        for run in runs:
+            counts = self._query(
+                "SELECT status, COUNT(*) AS n FROM outbox WHERE broadcast_id = ? GROUP BY status",
+                (run["id"],)
+            )
+            run["counts"] = {row["status"]: row["n"] for row in counts}
+        return runs
+
+    def broadcast_recipients(self, broadcast_id: int) -> list:
+        return self._query(
+            "SELECT phone, status, attempts, last_error, updated_at FROM outbox"
+            " WHERE broadcast_id = ? ORDER BY id",
+            (broadcast_id,)
+        )
+
+    def pending_for(self, phone: str) -> list:
+        """
+        Rows of the phone that are not in the backend's history yet, oldest
+        first. log_failed rows stay until a retry logs them: they were sent.
+        """
+        return self._query(
+            "SELECT * FROM outbox WHERE phone = ? AND status != 'logged' ORDER BY id",
+            (phone,)
+        )
+
+    def changed_since(self, phone: str, since: float) -> list:
+        return self._query(
+            "SELECT * FROM outbox WHERE phone = ? AND updated_at > ? ORDER BY id",
+            (phone, since)
+        )
+
+
+@st.cache_resource
+def get_outbox() -> Outbox:
+    return Outbox(OUTBOX_PATH)
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Daemon thread that delivers outbox jobs to the webhook and logs them to
+    the backend. Webhook POSTs go through a token bucket, shared with the
+    other processes draining the same outbox, so broadcasts stay within
+    WhatsApp/Make throughput; sent rows are logged in batches.
+    """
+
+    def __init__(self, outbox: Outbox):
+        super().__init__(name="outbox-worker", daemon=True)
+        self.outbox = outbox
+        self.wakeup = threading.Event()
+        self.bucket = TokenBucket(outbox.path, "webhook", BROADCAST_RATE, BROADCAST_BURST)
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run(self):
+        sent_since_flush, last_flush = 0, time_module.monotonic()
+        while True:
+            logs = []
+            try:
+                job = self.outbox.claim_send()
+                if job:
+                    self.send(job)
+                    sent_since_flush += 1
+                # Sent rows are logged once the queue is drained, a batch is
+                # full, or the oldest has waited LOG_FLUSH_INTERVAL
+                if (job is None or sent_since_flush >= LOG_BATCH_SIZE
+                        or time_module.monotonic() - last_flush >= LOG_FLUSH_INTERVAL):
+                    logs = self.outbox.claim_logs(LOG_BATCH_SIZE)
+                    if logs:
+                        self.log(logs)
+                    sent_since_flush, last_flush = 0, time_module.monotonic()
+            except Exception:
+                job = None
+            if job is None and not logs:
+                self.wakeup.wait(OUTBOX_POLL_INTERVAL)
+                self.wakeup.clear()
+
+    def send(self, job: dict):
+        key = job["idempotency_key"]
+        self.bucket.acquire()
+        try:
+            if not post_to_webhook(job["phone"], job["message"], job["msg_type"], job["template_name"], key):
+                raise Exception("webhook did not accept the message")
+        except Exception as e:
+            self.outbox.retry_later(job, str(e), "failed")
+            return
+        self.outbox.mark(key, "sent")
+
+    def log(self, jobs: list):
+        results = log_sent_messages(jobs)
+        for job in jobs:
+            error = results.get(job["idempotency_key"], "not logged")
+            if error is None:
+                self.outbox.mark(job["idempotency_key"], "logged")
+            else:
+                self.outbox.retry_later(job, error, "log_failed")
+
+
+@st.cache_resource
+def get_outbox_worker() -> OutboxWorker:
+    worker = OutboxWorker(get_outbox())
+    worker.start()
+    return worker
+
+
+def outbox_messages(phone: str) -> list:
+    """
+    Optimistic bubbles for the phone's undelivered messages. Also drops the
+    phone's cached reads once any of its messages has been logged, so the
+    real message replaces the bubble on this rerun.
+    """
+    outbox = get_outbox()
+    get_outbox_worker()  # make sure this process drains the outbox
+
+    checked = st.session_state.setdefault("outbox_checked_at", {})
+    since = checked.get(phone, 0.0)
+    checked[phone] = time_module.time()
+    if since and any(row["status"] == "logged" for row in outbox.changed_since(phone, since)):
+        invalidate_phone(phone)
+
+    bubbles = []
+    for row in outbox.pending_for(phone):
+        sent_at = datetime.fromtimestamp(row["created_at"], IST)
+        bubbles.append(Message(
+            id=None, phone=phone, text=row["message"], direction=Direction.BOT,
+            dt=sent_at, day=sent_at.date(), timestamp=sent_at.isoformat(),
+            follow_up_needed=False, notes="", handled_by="Dashboard User", status=row["status"],
+        ))
+    return bubbles
+
+
+# ---------- Contact summaries (sidebar) ----------
+
+SUMMARY_TTL = 30             # seconds a contact summary stays fresh
+SUMMARY_BATCH_SIZE = 100     # phones per /contacts/summary call
+SUMMARY_FALLBACK_MAX = 25    # per-contact fetches allowed per rerun without a batch endpoint
 
 
-def delete_message(msg_id: int):
-    try:
-        response = make_request_with_retry(f"{API_BASE}/message/{msg_id}", method="DELETE")
-        return response and response.status_code == 200
-    except:
-        return False
+def _summary_from_conversation(conv, limit: int) -> dict:
+    """
+    Build a contact summary from a newest-first conversation page. The
+    follow-up count is only exact when the page held the whole history.
+    """
+    last = conv[0] if conv else None
+    return {
+        "last_message": last.text if last else "",
+        "last_timestamp": last.timestamp if last else None,
+        "follow_up_count": sum(1 for msg in conv if msg.follow_up_needed),
+        "follow_up_exact": len(conv) < limit,
+    }
 
 
-# ---------- NEW: automation helpers ----------
+def _load_follow_up_counts() -> dict | None:
+    try:
+        response = make_request_with_retry(f"{API_BASE}/follow_up/counts")
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 405):
+            get_api_shape().remember("follow_up_counts", False)
+            return None
+        raise
+    if not response or response.status_code != 200:
+        return None
+    get_api_shape().remember("follow_up_counts", True)
+
+    data = response.json()
+    counts = data.get("counts", data) if isinstance(data, dict) else {
+        row.get("phone"): row.get("follow_up_count") for row in data
+    }
+    return {str(p): int(n or 0) for p, n in counts.items() if p}
 
-def fetch_automation_status(phone: str) -> bool:
+
+def fetch_follow_up_counts() -> dict | None:
     """
-    Get automation_enabled flag for a specific phone.
-    Default: True (chatbot ON) if anything fails.
+    Open follow-up messages per phone for every contact, from one
+    GET /follow_up/counts call (cached for CACHE_TTLS["follow_up_counts"]).
+    None when the backend has no counts endpoint.
     """
+    if get_api_shape().get("follow_up_counts") is False:
+        return None
     try:
-        response = make_request_with_retry(f"{API_BASE}/automation/{phone}", method="GET")
-        if response and response.status_code == 200:
-            data = response.json()
-            return bool(data.get("automation_enabled", True))
+        return get_read_cache().get_or_load("follow_up_counts", {}, _load_follow_up_counts, codec=JSON_CODEC)
     except Exception:
-        pass
-    return True
+        return None
 
 
-def set_automation_status(phone: str, enabled: bool) -> bool:
-    """Update automation_enabled flag for a specific phone."""
+def follow_up_overview(contact_store) -> tuple[int, int | None]:
+    """
+    (clients needing follow-up, open follow-up messages or None if unknown).
+    Uses the server counts when available, else the follow_up_open flag the
+    contact list already carries, so it costs no extra per-contact request.
+    """
+    counts = fetch_follow_up_counts()
+    if counts is not None:
+        return sum(1 for n in counts.values() if n > 0), sum(counts.values())
+    return sum(1 for c in contact_store.contacts if c.get("follow_up_open")), None
+
+
+def _fetch_summary_batch(phones: list) -> dict | None:
+    """
+    Ask the backend for summaries of many phones at once.
+    Returns None when the backend has no batch endpoint.
+    """
     try:
         response = make_request_with_retry(
-            f"{API_BASE}/automation/{phone}",
-            method="PATCH",
-            json_data={"automation_enabled": enabled}
+            f"{API_BASE}/contacts/summary",
+            params={"phones": ",".join(phones)}
         )
-        return response and response.status_code == 200
-    except Exception:
-        return False
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 405):
+            return None
+        raise
+    if not response or response.status_code != 200:
+        return None
+
+    data = response.json()
+    rows = data.values() if isinstance(data, dict) else data
+    summaries = {}
+    for row in rows:
+        row_phone = str(row.get("phone") or "")
+        if row_phone:
+            summaries[row_phone] = {
+                "last_message": row.get("last_message") or "",
+                "last_timestamp": row.get("last_timestamp"),
+                "follow_up_count": int(row.get("follow_up_count") or 0),
+            }
+    return summaries
+
+
+def fetch_contact_summaries(phones: list) -> dict:
+    """
+    Last message preview, last timestamp and follow-up count for the given phones.
 
+    Uses the batch /contacts/summary endpoint when the backend has one, so the
+    sidebar costs a handful of requests per TTL instead of several per contact.
+    Without it, falls back to one conversation fetch per stale contact, capped
+    at SUMMARY_FALLBACK_MAX per rerun and run concurrently; the rest fill in
+    on following reruns.
+    """
+    api_shape = get_api_shape()
+    cache = get_summary_cache()
+    now = time_module.time()
+    stale = [p for p in phones if p and now - cache.get(p, {}).get("fetched_at", 0) > SUMMARY_TTL]
+
+    if stale and api_shape.get("contacts_summary") is not False:
+        for i in range(0, len(stale), SUMMARY_BATCH_SIZE):
+            chunk = stale[i:i + SUMMARY_BATCH_SIZE]
+            try:
+                batch = _fetch_summary_batch(chunk)
+            except Exception:
+                break  # backend trouble, keep what we have for now
+            if batch is None:
+                api_shape.remember("contacts_summary", False)
+                break
+            api_shape.remember("contacts_summary", True)
+            for p in chunk:
+                summary = batch.get(p, {"last_message": "", "last_timestamp": None, "follow_up_count": 0})
+                cache[p] = {**summary, "follow_up_exact": True, "fetched_at": now}
+        stale = [p for p in stale if now - cache.get(p, {}).get("fetched_at", 0) > SUMMARY_TTL]
+
+    if stale and api_shape.get("contacts_summary") is False:
+        targets = stale[:SUMMARY_FALLBACK_MAX]
+        convs = run_concurrently(lambda p: cached_conversation(p, 50), targets)
+        for p, conv in zip(targets, convs):
+            if conv is not None:  # None: failed or missed the deadline, retry next rerun
+                cache[p] = {**_summary_from_conversation(conv, 50), "fetched_at": now}
+
+    summaries = {p: cache[p] for p in phones if p in cache}
+
+    # Exact counts replace sampled ones: the server's counters first, else a
+    # fully synced local conversation store
+    counts = fetch_follow_up_counts() if stale or any(
+        not s.get("follow_up_exact") for s in summaries.values()
+    ) else None
+    stores = st.session_state.get("conv_stores", {})
+    for p, summary in summaries.items():
+        if summary.get("follow_up_exact"):
+            continue
+        if counts is not None:
+            summaries[p] = {**summary, "follow_up_count": counts.get(p, 0), "follow_up_exact": True}
+        elif p in stores and stores[p].complete:
+            summaries[p] = {**summary, "follow_up_count": stores[p].follow_up_count(), "follow_up_exact": True}
+    return summaries
 
-# -------------------------------------------
 
-def filter_messages(messages, date_filter, time_from, time_to):
-    if not date_filter and not time_from:
-        return messages
-    filtered = []
-    for msg in messages:
-        try:
-            msg_dt = convert_to_ist(msg["timestamp"])
-            if date_filter and msg_dt.date() != date_filter:
-                continue
-            if time_from and time_to:
-                msg_time = msg_dt.time()
-                if not (time_from <= msg_time <= time_to):
-                    continue
-            filtered.append(msg)
-        except:
-            continue
-    return filtered
+# ---------- Incremental conversation sync ----------
 
+SYNC_MIN_INTERVAL = 2        # seconds between polls of the open chat
+SYNC_PAGE_LIMIT = 50         # new messages asked for per poll
+SYNC_MAX_PAGES = 5           # polls chained in one rerun when a backlog of new messages arrives
+SYNC_FULL_RESYNC = 300       # seconds between re-reads of the latest page to pick up edits/deletes
+SYNC_GAP_MAX_PAGES = 10      # older pages read to join a full poll or resync page to the stored messages
 
-def send_whatsapp_message(phone: str, message_text: str,
-                          msg_type: str = "text",
-                          template_name: str | None = None) -> bool:
-    """Send message to Make.com webhook which will handle WhatsApp API."""
-    if not MAKE_WEBHOOK_URL:
-        st.error("Make webhook URL not configured (set 'make_webhook_url' in Streamlit secrets).")
-        return False
 
-    payload = {
-        "phone": phone,
-        "message": message_text,
-        "type": msg_type,
-    }
-    if msg_type == "template" and template_name:
-        payload["template_name"] = template_name
+class ConversationStore:
+    """
+    Local copy of one phone's messages keyed by message id. Polls only ask
+    the backend for messages newer than the last one seen.
+    """
 
+    def __init__(self):
+        self.messages = {}       # id -> Message
+        self.last_id = None
+        self.last_ts = None
+        self.synced_at = 0.0
+        self.full_synced_at = 0.0
+        self.complete = False    # the oldest message of the conversation is in the store
+        self.prefetch = None     # (oldest key when started, Future of the next older page)
+        self.follow_ups = set()  # ids of messages with follow_up_needed, kept in step with messages
+
+    def _track(self, msg: Message):
+        if msg.follow_up_needed:
+            self.follow_ups.add(msg.id)
+        else:
+            self.follow_ups.discard(msg.id)
+
+    def merge(self, messages) -> int:
+        """Add or replace Message records; returns how many ids were new."""
+        added = 0
+        for msg in messages:
+            if msg.id is None:
+                continue
+            if msg.id not in self.messages:
+                added += 1
+            self.messages[msg.id] = msg
+            self._track(msg)
+        if self.messages:
+            newest = max(self.messages.values(), key=lambda m: m.sort_key)
+            self.last_id = newest.id
+            self.last_ts = newest.timestamp
+        return added
+
+    def drop(self, msg_id):
+        self.messages.pop(msg_id, None)
+        self.follow_ups.discard(msg_id)
+
+    def apply_update(self, msg_id, **fields):
+        if msg_id in self.messages:
+            self.messages[msg_id] = replace(self.messages[msg_id], **fields)
+            self._track(self.messages[msg_id])
+
+    def truncate(self, oldest: tuple):
+        """Forget messages older than the sort key `oldest`; history before it is paged in again."""
+        for msg_id, msg in list(self.messages.items()):
+            if msg.sort_key < oldest:
+                self.drop(msg_id)
+        self.complete = False
+        self.prefetch = None
+
+    def follow_up_count(self) -> int:
+        """Open follow-ups among the stored messages; the phone's exact total once `complete`."""
+        return len(self.follow_ups)
+
+    def reconcile_latest(self, page: list):
+        """Replace everything from the page's oldest message onward with the page itself."""
+        if not page:
+            self.messages.clear()
+            self.follow_ups.clear()
+            return
+        oldest = min(m.sort_key for m in page)
+        page_ids = {m.id for m in page}
+        for msg_id, msg in list(self.messages.items()):
+            if msg_id not in page_ids and msg.sort_key >= oldest:
+                del self.messages[msg_id]
+                self.follow_ups.discard(msg_id)
+        self.merge(page)
+
+    def latest(self, n: int | None = None) -> list:
+        """The n newest messages (all by default), newest first (the backend's page order)."""
+        return sorted(self.messages.values(), key=lambda m: m.sort_key, reverse=True)[:n]
+
+    def oldest(self) -> Message | None:
+        return min(self.messages.values(), key=lambda m: m.sort_key, default=None)
+
+    def count_older(self, cursor: tuple | None) -> int:
+        if cursor is None:
+            return len(self.messages)
+        return sum(1 for m in self.messages.values() if m.sort_key < cursor)
+
+
+def get_conversation_store(phone: str) -> ConversationStore:
+    if "conv_stores" not in st.session_state:
+        st.session_state.conv_stores = {}
+    if phone not in st.session_state.conv_stores:
+        st.session_state.conv_stores[phone] = ConversationStore()
+    return st.session_state.conv_stores[phone]
+
+
+def _is_newer_id(msg_id, last_id) -> bool:
     try:
-        response = make_request_with_retry(MAKE_WEBHOOK_URL, method="POST", json_data=payload)
-        if response and response.status_code in (200, 201, 202):
-            log_sent_message(phone, message_text, msg_type)
-            return True
+        return int(msg_id) > int(last_id)
+    except (TypeError, ValueError):
+        return True
+
+
+def _poll_conversation(phone: str, limit: int, **extra):
+    """
+    One sync read of the newest messages. Goes through the shared read cache
+    for CACHE_TTLS["conversation_poll"], so sessions watching the same chat
+    from the same point share a request instead of each polling.
+    """
+    return get_read_cache().get_or_load(
+        "conversation_poll", {"phone": phone, "limit": limit, **extra},
+        lambda: _load_conversation(phone, limit, 0, **extra),
+        codec=JSON_CODEC
+    )
+
+
+def _join_stored(store: ConversationStore, phone: str, page: list, limit: int) -> list:
+    """
+    Newest-first poll and resync pages hold only the newest `limit` messages,
+    so a full one may stop short of the stored messages and leave a gap that
+    paging back never fills. Read older pages until they reach the store's
+    newest message; if they can't (SYNC_GAP_MAX_PAGES, or a failed read),
+    truncate the store to what was read. Returns the messages read.
+    """
+    newest = store.latest(1)
+    if not newest or len(page) < limit:
+        return page
+    anchor = newest[0].sort_key
+    messages = list(page)
+    for _ in range(SYNC_GAP_MAX_PAGES):
+        oldest = min(messages, key=lambda m: m.sort_key)
+        if oldest.sort_key <= anchor:
+            return messages
+        older = _fetch_older(phone, oldest, len(messages))
+        if older is None:
+            break
+        messages.extend(older)
+        if len(older) < OLDER_PAGE_SIZE:
+            return messages   # reached the start of the conversation
+    oldest = min(messages, key=lambda m: m.sort_key)
+    if oldest.sort_key > anchor:
+        store.truncate(oldest.sort_key)
+    return messages
+
+
+def sync_conversation(phone: str, page_size: int) -> ConversationStore:
+    """
+    Bring the phone's local store up to date and return it.
+
+    The first call (and one every SYNC_FULL_RESYNC seconds) reads the latest
+    page in full; other polls send since_id/since and merge only what is new.
+    Backends that ignore those params are detected and remembered in
+    get_api_shape(), after which polls fall back to re-reading the latest page.
+    Pages that come back full are joined to the stored messages by
+    _join_stored(), so a burst of new messages never leaves a gap.
+    """
+    store = get_conversation_store(phone)
+    now = time_module.monotonic()
+    api_shape = get_api_shape()
+
+    if not store.full_synced_at or now - store.full_synced_at > SYNC_FULL_RESYNC:
+        limit = max(page_size, SYNC_PAGE_LIMIT)
+        page = _poll_conversation(phone, limit)
+        if page is not None:
+            store.reconcile_latest(_join_stored(store, phone, to_messages(page), limit))
+            store.full_synced_at = store.synced_at = now
+        return store
+
+    if now - store.synced_at < SYNC_MIN_INTERVAL:
+        return store
+
+    if api_shape.get("conversation_since") is False:
+        page = _poll_conversation(phone, SYNC_PAGE_LIMIT)
+        if page is not None:
+            store.merge(_join_stored(store, phone, to_messages(page), SYNC_PAGE_LIMIT))
+            store.synced_at = now
+        return store
+
+    for _ in range(SYNC_MAX_PAGES):
+        last_id = store.last_id
+        page = _poll_conversation(phone, SYNC_PAGE_LIMIT, since_id=last_id, since=store.last_ts)
+        if page is None:
+            return store
+        store.synced_at = now
+
+        if last_id is not None and any(not _is_newer_id(m.get("id"), last_id) for m in page):
+            api_shape.remember("conversation_since", False)
+            store.merge(_join_stored(store, phone, to_messages(page), SYNC_PAGE_LIMIT))
+            return store
+        if page and last_id is not None:
+            api_shape.remember("conversation_since", True)
+
+        store.merge(_join_stored(store, phone, to_messages(page), SYNC_PAGE_LIMIT))
+        if len(page) < SYNC_PAGE_LIMIT:
+            break
+    return store
+
+
+# ---------- Keyset paging ----------
+
+OLDER_PAGE_SIZE = 50         # messages fetched per request when paging back into history
+
+
+def keyset_page(messages: list, cursor: tuple | None, n: int) -> tuple:
+    """
+    Page of newest-first messages strictly older than cursor, a (datetime, id)
+    sort key. Returns (page, how many messages are newer, whether older ones remain).
+    """
+    older = messages if cursor is None else [m for m in messages if m.sort_key < cursor]
+    return older[:n], len(messages) - len(older), len(older) > n
+
+
+def _fetch_older(phone: str, oldest: Message, offset: int) -> list | None:
+    """
+    Messages older than `oldest`, newest first. Uses before/before_id keyset
+    params; backends that ignore them are remembered in get_api_shape() and
+    paged by offset instead (offset = messages already held locally).
+    """
+    api_shape = get_api_shape()
+    if api_shape.get("conversation_keyset") is not False:
+        raw = _load_conversation(phone, OLDER_PAGE_SIZE, 0, before=oldest.timestamp, before_id=oldest.id)
+        if raw is None:
+            return None
+        page = to_messages(raw)
+        if all(m.sort_key < oldest.sort_key for m in page):
+            if page:
+                api_shape.remember("conversation_keyset", True)
+            return page
+        api_shape.remember("conversation_keyset", False)
+
+    raw = _load_conversation(phone, OLDER_PAGE_SIZE, offset)
+    return to_messages(raw) if raw is not None else None
+
+
+def _merge_older(store: ConversationStore, page: list | None):
+    if page is None:
+        return
+    store.merge(page)
+    if len(page) < OLDER_PAGE_SIZE:
+        store.complete = True
+
+
+def ensure_older(store: ConversationStore, phone: str, cursor: tuple, n: int):
+    """
+    Make sure the store holds n messages older than cursor, or the whole
+    history. A prefetch still running after FANOUT_DEADLINE is left for a
+    later rerun to collect; the page shows what the store has meanwhile.
+    """
+    deadline = time_module.monotonic() + FANOUT_DEADLINE
+    for _ in range(3):
+        if store.complete or store.count_older(cursor) >= n:
+            return
+        oldest = store.oldest()
+        if oldest is None:
+            return
+        pending = store.prefetch
+        if pending and pending[0] == oldest.sort_key:
+            # Usually already done: the flip costs no round-trip
+            done, _running = wait([pending[1]], timeout=max(0.0, deadline - time_module.monotonic()))
+            if not done:
+                return
+        store.prefetch = None
+        if pending and pending[0] == oldest.sort_key and pending[1].exception() is None:
+            page = pending[1].result()
         else:
-            st.error("Send failed")
-            return False
-    except Exception as e:
-        st.error(f"Send error: {e}")
-        return False
+            page = _fetch_older(phone, oldest, len(store.messages))
+        _merge_older(store, page)
+
+
+def prefetch_older(store: ConversationStore, phone: str, cursor: tuple, n: int):
+    """
+    Collect a finished background fetch, then start the next one if the page
+    after `cursor` isn't fully in the store yet.
+    """
+    pending = store.prefetch
+    if pending and pending[1].done():
+        store.prefetch = None
+        oldest = store.oldest()
+        if oldest and pending[0] == oldest.sort_key and pending[1].exception() is None:
+            _merge_older(store, pending[1].result())
+    if store.complete or store.prefetch or store.count_older(cursor) >= n:
+        return
+    oldest = store.oldest()
+    if oldest is not None:
+        future = submit_with_ctx(get_fanout_executor(FANOUT_WORKERS), _fetch_older, phone, oldest, len(store.messages))
+        store.prefetch = (oldest.sort_key, future)
+
+
+# ---------- Filtered conversation queries ----------
+
+FILTER_PAGE_SIZE = 100       # messages per request while answering a filter
+FILTER_SCAN_MAX_PAGES = 20   # requests allowed for one filter when the range has no lower bound
+FILTER_MAX_RESULTS = 500
+
+
+def _scan_filtered(phone: str, query: ConversationQuery) -> list | None:
+    api_shape = get_api_shape()
+    pushdown = api_shape.get("conversation_filters") is not False
+    results = []
+
+    for page_number in range(FILTER_SCAN_MAX_PAGES):
+        extra = query.to_params() if pushdown else {}
+        raw = _load_conversation(phone, FILTER_PAGE_SIZE, page_number * FILTER_PAGE_SIZE, **extra)
+        if raw is None:
+            return None if page_number == 0 else results
+        page = to_messages(raw)
+
+        if pushdown and page:
+            honoured = all(query.matches(m) for m in page)
+            api_shape.remember("conversation_filters", honoured)
+            # An ignored filter means this is plain newest-first history;
+            # the next offsets continue the same stream without params.
+            pushdown = honoured
+
+        results.extend(m for m in page if query.matches(m))
+        if len(page) < FILTER_PAGE_SIZE or len(results) >= FILTER_MAX_RESULTS:
+            break
+        if any(query.passed(m) for m in page):
+            break
+
+    return results[:FILTER_MAX_RESULTS]
+
+
+def query_conversation(phone: str, query: ConversationQuery) -> list:
+    """
+    Every message of the phone matching the filter panel, newest first.
+
+    The filter goes to the backend as date_from/date_to/time_from/time_to.
+    If the backend ignores them (it returns messages outside the range),
+    that is remembered in get_api_shape() and the query falls back to
+    scanning newest-first pages, stopping once the requested day has been
+    passed. Only as many requests are made as the result needs.
+    """
+    results = get_read_cache().get_or_load(
+        "conversation",
+        {"phone": phone, "query": tuple(sorted(query.to_params().items()))},
+        lambda: _scan_filtered(phone, query),
+        codec=MESSAGES_CODEC
+    )
+    return list(results) if results is not None else []
 
 
-def log_sent_message(phone: str, message: str, msg_type: str = "text"):
-    """Log sent message to backend database with IST timestamp"""
+# -------------------------------------------
+
+def rerun_fragment():
+    """
+    Rerun just the fragment this is called from. A fragment's widget events
+    can also be handled in a full script run (AppTest only does those), where
+    scope="fragment" is refused; the whole script is rerun then.
+    """
     try:
-        ist_now = datetime.now(IST)
-
-        payload = {
-            "phone": phone,
-            "message": message,
-            "direction": "Dashboard User",   # not used by backend, it forces 'dashboard'
-            "message_type": msg_type,
-            "timestamp": ist_now.isoformat(),
-            "follow_up_needed": False,
-            "notes": "",
-            "handled_by": "Dashboard User"
-        }
-        response = make_request_with_retry(f"{API_BASE}/log_message", method="POST", json_data=payload)
-        return response and response.status_code == 200
-    except Exception as e:
-        st.warning(f"Message sent but not logged in database: {e}")
-        return False
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def render_profile_overlay():
+    """p50/p95 wall time, requests and bytes per phase over the recent reruns, plus cProfile opt-in."""
+    runs = list(st.session_state.phase_runs) + [st.session_state.phase_run]
+    per_phase = {}
+    for run in runs:
+        for name, figures in run["phases"].items():
+            per_phase.setdefault(name, []).append(figures)
+
+    with st.expander("⏱️ Rerun profile", expanded=False):
+        st.caption(f"{len(runs)} recent reruns (fragment reruns counted separately)")
+        st.table([
+            {
+                "phase": name,
+                "runs": len(samples),
+                "p50 ms": round(_percentile([f["seconds"] for f in samples], 0.5) * 1000),
+                "p95 ms": round(_percentile([f["seconds"] for f in samples], 0.95) * 1000),
+                "last ms": round(samples[-1]["seconds"] * 1000),
+                "avg requests": round(sum(f["requests"] for f in samples) / len(samples), 1),
+                "avg KB": round(sum(f["bytes"] for f in samples) / len(samples) / 1024, 1),
+            }
+            for name, samples in per_phase.items()
+        ])
+        if st.button("Capture next rerun with cProfile", key="cprofile_request"):
+            st.session_state.cprofile_next = True
+            st.rerun()
+        if st.session_state.get("cprofile_report"):
+            st.code(st.session_state.cprofile_report, language="text")
+
+
+def render_debug_panel():
+    """Admin-only diagnostics in the Streamlit sidebar (debug_panel secret)."""
+    if not DEBUG_PANEL:
+        return
+    finish_cprofile()
+    with st.sidebar:
+        render_profile_overlay()
+        st.markdown("### 🛠️ Debug")
+        st.markdown(f"**Read cache (shared, {CACHE_BACKEND} backend)**")
+        st.table(get_read_cache().stats())
+        st.markdown("**API shape**")
+        st.table(get_api_shape().snapshot())
+        st.markdown("**Static assets (bytes)**")
+        st.table(load_static_assets()["sizes"])
+
+        st.markdown("**HTTP requests (process)**")
+        request_rows = get_request_stats().snapshot()
+        if request_rows:
+            st.dataframe(request_rows, use_container_width=True, hide_index=True)
+            endpoint = st.selectbox("Latency histogram", [row["endpoint"] for row in request_rows],
+                                    key="debug_histogram_endpoint")
+            st.bar_chart(get_request_stats().histogram(endpoint), x="latency", y="calls")
+        st.markdown("**Requests per script run (this session)**")
+        reruns = list(st.session_state.http_reruns)
+        if reruns:
+            st.line_chart([rerun["requests"] for rerun in reruns])
+            st.table([
+                {"requests": r["requests"], "KB": round(r["bytes"] / 1024, 1), "ms": round(r["seconds"] * 1000)}
+                for r in reruns[-5:]
+            ])
 
 
 # Fetch contacts with improved error handling
-try:
-    contacts = fetch_contacts(st.session_state.filter_only_fu)
-
-    if st.session_state.filter_phone.strip():
-        phone_query = st.session_state.filter_phone.strip().lower()
-        contacts = [
-            c for c in contacts
-            if phone_query in str(c.get("phone") or "").lower()
-        ]
-    if st.session_state.filter_name.strip():
-        name_query = st.session_state.filter_name.strip().lower()
-        contacts = [
-            c for c in contacts
-            if name_query in str(c.get("client_name") or "").lower()
-        ]
-
-    def get_contact_sort_key(contact):
-        name = str(contact.get("client_name") or "").lower()
-        phone = str(contact.get("phone") or "")
-        return (name, phone)
-
-    contacts.sort(key=get_contact_sort_key)
-
-except Exception as e:
-    st.warning(f"Could not load contacts: {str(e)}")
-    contacts = [
-        {"phone": "1234567890", "client_name": "John Doe", "follow_up_open": False},
-        {"phone": "9876543210", "client_name": "Jane Smith", "follow_up_open": True},
-        {"phone": "5555555555", "client_name": "Test Client", "follow_up_open": False}
-    ]
+with phase("contacts"):
+    try:
+        contact_store = fetch_contacts(st.session_state.filter_only_fu)
+        contacts = contact_store.search(
+            phone_query=st.session_state.filter_phone,
+            name_query=st.session_state.filter_name
+        )
+
+    except Exception as e:
+        st.warning(f"Could not load contacts: {str(e)}")
+        contact_store = ContactStore([
+            {"phone": "1234567890", "client_name": "John Doe", "follow_up_open": False},
+            {"phone": "9876543210", "client_name": "Jane Smith", "follow_up_open": True},
+            {"phone": "5555555555", "client_name": "Test Client", "follow_up_open": False}
+        ])
+        contacts = contact_store.contacts
+
+    follow_up_clients, follow_up_messages = follow_up_overview(contact_store)
+if follow_up_clients:
+    open_messages = f" · {follow_up_messages} open messages" if follow_up_messages is not None else ""
+    st.markdown(f"🔴 **{follow_up_clients} clients need follow-up**{open_messages}")
 
 if not contacts:
     st.info("🔍 No contacts found")
@@ -1681,8 +3719,8 @@ if "selected_phone" not in st.session_state:
     else:
         st.session_state.selected_phone = ""
 
-if "conv_offset" not in st.session_state:
-    st.session_state.conv_offset = 0
+if "conv_cursors" not in st.session_state:
+    st.session_state.conv_cursors = []   # (datetime, id) of the oldest message on each newer page
 
 if "last_message_count" not in st.session_state:
     st.session_state.last_message_count = {}
@@ -1691,11 +3729,12 @@ if "auto_refresh" not in st.session_state:
     st.session_state.auto_refresh = True
 
 CONV_LIMIT = 20
+AUTO_REFRESH_INTERVAL = 5   # seconds between timer-driven reruns of the contact list and chat
 
-col1, col2 = st.columns([1, 2.5])
 
-# ---------------- LEFT SIDEBAR (CONTACTS) -----------------
-with col1:
+@profiled("sidebar")
+def render_contact_list(contact_store: ContactStore, contacts: list):
+    """Contact search and list; runs as a fragment so its timer leaves the rest of the page alone."""
     st.markdown("### 💬 Contacts")
 
     search_query_contacts = st.text_input(
@@ -1706,46 +3745,36 @@ with col1:
     )
 
     if search_query_contacts:
-        sq = search_query_contacts.lower()
-        filtered_contacts = [
-            c for c in contacts
-            if sq in str(c.get("client_name") or "").lower()
-            or sq in str(c.get("phone") or "")
-        ]
+        filtered_contacts = contact_store.search(
+            search_query_contacts,
+            phone_query=st.session_state.filter_phone,
+            name_query=st.session_state.filter_name
+        )
     else:
         filtered_contacts = contacts
 
+    phones = [c.get("phone", "") for c in filtered_contacts]
+    summaries = fetch_contact_summaries(phones)
+    automation = fetch_automation_flags(phones)
+
     for c in filtered_contacts:
         client_name = c.get("client_name") or "Unknown"
         phone = c.get("phone", "")
         is_selected = st.session_state.selected_phone == phone
+        summary = summaries.get(phone, {})
 
         last_message_preview = "No messages yet"
-        try:
-            conv = fetch_conversation(phone, limit=1)
-            if conv and len(conv) > 0:
-                last_msg = conv[0].get("message", "")
-                if last_msg:
-                    last_message_preview = html.escape(last_msg[:30]) + ("..." if len(last_msg) > 30 else "")
-        except:
-            pass
+        last_msg = summary.get("last_message", "")
+        if last_msg:
+            last_message_preview = html.escape(last_msg[:30]) + ("..." if len(last_msg) > 30 else "")
 
-        try:
-            conv = fetch_conversation(phone, limit=50)
-            unread_count = sum(1 for msg in conv if msg.get("follow_up_needed"))
-        except:
-            unread_count = 0
+        unread_count = summary.get("follow_up_count", 0)
+        unread_label = f"{unread_count}" if summary.get("follow_up_exact", True) else f"{unread_count}+"
 
         color_index = get_avatar_color(client_name)
         initials = get_avatar_initials(client_name)
 
-        last_time = ""
-        try:
-            conv = fetch_conversation(phone, limit=1)
-            if conv and len(conv) > 0:
-                last_time = format_contact_time(conv[0].get("timestamp"))
-        except:
-            pass
+        last_time = format_contact_time(summary.get("last_timestamp"))
 
         _ = f"""
         <div class="contact-card {'selected' if is_selected else ''}">
@@ -1761,19 +3790,323 @@ with col1:
         </div>
         """
 
+        badge = f" · 🔴 {unread_label}" if unread_count > 0 else ""
+        if phone in automation:
+            badge += " · 🤖 ON" if automation[phone] else " · 🤖 OFF"
         if st.button(
-            f"📱 {client_name} ({phone})",
+            f"📱 {client_name} ({phone}){badge}",
             key=f"contact_{phone}",
             type="primary" if is_selected else "secondary",
             use_container_width=True
         ):
             st.session_state.selected_phone = phone
-            st.session_state.conv_offset = 0
+            st.session_state.conv_cursors = []
             draft_key = f"new_msg_{phone}"
             if draft_key in st.session_state:
                 del st.session_state[draft_key]
             st.rerun()
 
+
+@profiled("conversation")
+def render_conversation(phone: str):
+    """Messages, paging, send and follow-up forms of the open chat; runs as a fragment."""
+    # Search in conversation
+    search_query = st.text_input(
+        "Search in this chat",
+        placeholder="Type to search messages...",
+        key="search_conv",
+        label_visibility="collapsed"
+    )
+
+    # Fetch conversation: filters are answered by the backend query, everything
+    # else by the incrementally synced store, paged by (timestamp, id) cursors
+    with phase("conversation fetch"):
+        query = ConversationQuery.from_session()
+        cursor = st.session_state.conv_cursors[-1] if st.session_state.conv_cursors else None
+        # Messages still in the outbox show up optimistically on the newest page;
+        # read before syncing so a just-logged message is fetched on this rerun
+        pending = outbox_messages(phone) if cursor is None and not query.active else []
+        if query.active:
+            matches = query_conversation(phone, query)
+            conv, newer_count, has_older = keyset_page(matches, cursor, CONV_LIMIT)
+            if len(matches) >= FILTER_MAX_RESULTS:
+                st.caption(f"Showing the newest {FILTER_MAX_RESULTS} matching messages")
+        else:
+            store = sync_conversation(phone, CONV_LIMIT)
+            if cursor is not None:
+                ensure_older(store, phone, cursor, CONV_LIMIT)
+            conv, newer_count, has_older = keyset_page(store.latest(), cursor, CONV_LIMIT)
+            has_older = has_older or (bool(conv) and not store.complete)
+            if conv:
+                prefetch_older(store, phone, conv[-1].sort_key, CONV_LIMIT)
+
+            seen = st.session_state.last_message_count.get(phone)
+            if seen is not None and len(store.messages) > seen:
+                new_count = len(store.messages) - seen
+                st.toast(f"💬 {new_count} new message{'s' if new_count > 1 else ''}")
+            st.session_state.last_message_count[phone] = len(store.messages)
+
+    with phase("render"):
+        page_cursor = conv[-1].sort_key if conv else None
+
+        # Correct chronological order (oldest first)
+        conv.sort(key=lambda m: m.sort_key, reverse=False)
+        update_msg = conv[0] if conv else None
+        conv += pending
+
+        unread_count = sum(1 for m in conv if m.follow_up_needed)
+
+        if unread_count > 0:
+            st.markdown(
+                '<div style="color: #ff3b30; font-size: 13px; margin: 0 0 10px 20px;">'
+                f'🔴 {unread_count} unread messages</div>',
+                unsafe_allow_html=True
+            )
+
+        chat_container = st.container()
+
+        with chat_container:
+            if any(m.status == "failed" for m in pending):
+                col_fail, col_retry = st.columns([3, 1])
+                with col_fail:
+                    st.warning("Some messages could not be sent.")
+                with col_retry:
+                    if st.button("🔁 Retry", key=f"retry_outbox_{phone}", use_container_width=True):
+                        get_outbox().requeue_failed(phone)
+                        get_outbox_worker().wake()
+                        rerun_fragment()
+
+            if any(m.status == "log_failed" for m in pending):
+                col_fail, col_retry = st.columns([3, 1])
+                with col_fail:
+                    st.info("Some sent messages could not be saved to history.")
+                with col_retry:
+                    if st.button("💾 Save", key=f"retry_log_{phone}", use_container_width=True):
+                        get_outbox().requeue_log_failed(phone)
+                        get_outbox_worker().wake()
+                        rerun_fragment()
+
+            if not conv:
+                st.info("📭 No messages yet")
+            else:
+                st.markdown(
+                    render_conversation_html(conv, search_query),
+                    unsafe_allow_html=True
+                )
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    # Pagination
+    st.markdown('<div class="pagination-section">', unsafe_allow_html=True)
+    col_p1, col_p2, col_p3 = st.columns([1, 2, 1])
+
+    with col_p1:
+        prev_disabled = not st.session_state.conv_cursors
+        if st.button("⬅️ Prev", disabled=prev_disabled):
+            st.session_state.conv_cursors.pop()
+            rerun_fragment()
+
+    with col_p2:
+        start_idx = newer_count + 1 if conv else 0
+        end_idx = newer_count + len(conv)
+        st.markdown(
+            f'<p class="pagination-info">Showing messages {start_idx}–{end_idx}</p>',
+            unsafe_allow_html=True
+        )
+
+    with col_p3:
+        if st.button("Next ➡️", disabled=not has_older):
+            st.session_state.conv_cursors.append(page_cursor)
+            rerun_fragment()
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    with phase("forms"):
+        # Send message section
+        st.markdown('<div class="send-section">', unsafe_allow_html=True)
+        st.markdown("### ✉️ Send Message")
+        col_s1, col_s2 = st.columns([3, 1])
+
+        draft_key = f"new_msg_{phone}"
+        type_key = f"msg_type_{phone}"
+        tmpl_key = f"tmpl_{phone}"
+
+        with col_s1:
+            new_msg = st.text_area(
+                "Message",
+                value=st.session_state.get(draft_key, ""),
+                placeholder="Type a WhatsApp message to send...",
+                key=draft_key,
+                height=100
+            )
+
+        with col_s2:
+            msg_type_label = st.radio(
+                "Type",
+                ["Text", "Template"],
+                key=type_key
+            )
+            template_name = None
+            if msg_type_label == "Template":
+                template_name = st.text_input(
+                    "Template name",
+                    placeholder="e.g. sip_followup_1",
+                    key=tmpl_key
+                )
+
+        if st.button("📨 Send via WhatsApp", use_container_width=True, key=f"send_{phone}"):
+            msg_clean = (new_msg or "").strip()
+            if not msg_clean:
+                st.warning("Message cannot be empty.")
+            else:
+                msg_type = "template" if msg_type_label == "Template" else "text"
+                ok = send_whatsapp_message(phone, msg_clean, msg_type, template_name)
+                if ok:
+                    if draft_key in st.session_state:
+                        del st.session_state[draft_key]  # auto-clear after send
+                    rerun_fragment()
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Update follow-up status section
+
+        if update_msg:
+            st.markdown('<div class="update-section">', unsafe_allow_html=True)
+            st.markdown("### 📝 Update Follow-up Status")
+
+            col_u1, col_u2 = st.columns(2)
+            with col_u1:
+                fu_flag = st.checkbox("🔴 Follow-up needed", value=update_msg.follow_up_needed)
+            with col_u2:
+                handler = st.text_input("👤 Handled by", value=update_msg.handled_by)
+
+            notes = st.text_area("📝 Notes", value=update_msg.notes)
+
+            if st.button("💾 Save Follow-up", use_container_width=True):
+                try:
+                    if update_follow_up(phone, update_msg.id, fu_flag, notes, handler):
+                        st.success("✅ Saved!")
+                        st.rerun()
+                    else:
+                        st.error("Error saving follow-up status")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+
+def on_automation_toggle(phone: str, key: str):
+    """Push a click on the chatbot checkbox to the backend before the rerun."""
+    enabled = st.session_state[key]
+    st.session_state.automation_result = (enabled, set_automation_status(phone, enabled))
+
+
+BROADCAST_REFRESH_INTERVAL = 2   # seconds between progress updates while a run is going
+
+
+def _broadcast_active(run: dict) -> bool:
+    return any(run["counts"].get(s) for s in ("queued", "sending", "sent", "logging"))
+
+
+@profiled("broadcast")
+def render_broadcast_panel(contact_store, contacts, refreshing: bool):
+    """
+    Start a template broadcast and follow the recent runs; runs as a fragment.
+    `refreshing` says whether the fragment was registered with the progress
+    timer; a full rerun re-registers it when runs start or finish.
+    """
+    outbox = get_outbox()
+    follow_up = [c for c in contact_store.contacts if c.get("follow_up_open")]
+    audiences = {
+        f"Clients needing follow-up ({len(follow_up)})": follow_up,
+        f"Current contact list ({len(contacts)})": contacts,
+    }
+
+    audience = st.radio("Recipients", list(audiences), key="broadcast_audience", horizontal=True)
+    recipients = audiences[audience]
+    col_b1, col_b2 = st.columns([1, 2])
+    with col_b1:
+        template_name = st.text_input("Template name", placeholder="e.g. sip_followup_1",
+                                      key="broadcast_template")
+    with col_b2:
+        message_text = st.text_input("Message (as saved in chat history)", key="broadcast_message")
+
+    eta_minutes = len(recipients) / BROADCAST_RATE / 60
+    st.caption(f"Sent at up to {BROADCAST_RATE:g} messages/second, about {eta_minutes:.0f} min for "
+               f"{len(recipients)} recipients.")
+    ready = bool(recipients and (template_name or "").strip() and (message_text or "").strip())
+    if st.button("📣 Start broadcast", disabled=not ready, key="broadcast_start"):
+        broadcast_id = queue_broadcast(
+            [c.get("phone", "") for c in recipients], message_text.strip(), template_name.strip(),
+            audience.split(" (")[0]
+        )
+        if broadcast_id is not None:
+            st.rerun()   # full rerun: start the progress timer
+
+    runs = outbox.broadcasts()
+    for run in runs:
+        counts = run["counts"]
+        done = sum(counts.get(s, 0) for s in ("sent", "logging", "logged", "log_failed"))
+        failed = counts.get("failed", 0)
+        paused = counts.get("paused", 0)
+        started = datetime.fromtimestamp(run["created_at"], IST).strftime("%d/%m %H:%M")
+
+        st.markdown(f"**#{run['id']} · {run['template_name']}** · {run['audience']} · {started}")
+        st.progress(min(done / run["total"], 1.0) if run["total"] else 1.0,
+                    text=f"{done}/{run['total']} sent · {failed} failed · {paused} paused")
+
+        col_r1, col_r2, col_r3 = st.columns(3)
+        with col_r1:
+            if _broadcast_active(run) and st.button("⏸️ Pause", key=f"broadcast_pause_{run['id']}"):
+                outbox.set_broadcast_paused(run["id"], True)
+                rerun_fragment()
+            if paused and st.button("▶️ Resume", key=f"broadcast_resume_{run['id']}"):
+                outbox.set_broadcast_paused(run["id"], False)
+                get_outbox_worker().wake()
+                rerun_fragment()
+        with col_r2:
+            if failed and st.button("🔁 Retry failed", key=f"broadcast_retry_{run['id']}"):
+                outbox.requeue_failed(broadcast_id=run["id"])
+                get_outbox_worker().wake()
+                rerun_fragment()
+        with col_r3:
+            show = st.checkbox("Recipients", key=f"broadcast_show_{run['id']}")
+        if show:
+            st.dataframe(
+                [
+                    {
+                        "phone": row["phone"],
+                        "status": row["status"],
+                        "attempts": row["attempts"],
+                        "error": row["last_error"] or "",
+                        "updated": datetime.fromtimestamp(row["updated_at"], IST).strftime("%H:%M:%S"),
+                    }
+                    for row in outbox.broadcast_recipients(run["id"])
+                ],
+                use_container_width=True, hide_index=True
+            )
+
+    if any(_broadcast_active(run) for run in runs) != refreshing:
+        st.rerun()   # start or stop the progress timer
+
+
+# Timer-driven refreshes rerun only these fragments, never the whole page
+refresh_every = AUTO_REFRESH_INTERVAL if st.session_state.get("auto_refresh_toggle", st.session_state.auto_refresh) else None
+
+# Broadcast runs live in the outbox, so they keep going (and resume after a
+# restart) whether or not this panel is open
+get_outbox_worker()
+with st.expander("📣 Broadcast"):
+    broadcast_refresh = (BROADCAST_REFRESH_INTERVAL
+                         if any(_broadcast_active(run) for run in get_outbox().broadcasts()) else None)
+    st.fragment(run_every=broadcast_refresh)(render_broadcast_panel)(contact_store, contacts, bool(broadcast_refresh))
+
+col1, col2 = st.columns([1, 2.5])
+
+# ---------------- LEFT SIDEBAR (CONTACTS) -----------------
+with col1:
+    st.fragment(run_every=refresh_every)(render_contact_list)(contact_store, contacts)
+
 # ---------------- RIGHT SIDE (CHAT + CONTROLS) -----------------
 with col2:
     phone = st.session_state.selected_phone
@@ -1781,7 +4114,7 @@ with col2:
         phone = contacts[0].get("phone", "")
         st.session_state.selected_phone = phone
 
-    selected = next((c for c in contacts if c.get("phone") == phone), None) if phone else None
+    selected = contact_store.get(phone) if phone else None
 
     if not selected:
         st.info("📭 Select a contact to view messages")
@@ -1793,43 +4126,35 @@ with col2:
     initials = get_avatar_initials(client_name)
 
     # ---------- Automation + auto-refresh toggles ----------
-    auto_state_key = f"automation_enabled_{phone}"
-    if auto_state_key not in st.session_state:
-        st.session_state[auto_state_key] = fetch_automation_status(phone)
-    current_auto_enabled = st.session_state[auto_state_key]
+    # The checkbox always shows the shared flag, so a change made by another
+    # agent shows up here too; a click is pushed by its on_change callback
+    auto_toggle_key = f"auto_toggle_{phone}"
+    with phase("automation"):
+        st.session_state[auto_toggle_key] = fetch_automation_status(phone)
 
     col_toggle1, col_toggle2, col_toggle3 = st.columns([2, 1, 1])
     with col_toggle1:
         pass
 
     with col_toggle2:
-        new_auto_enabled = st.checkbox(
+        st.checkbox(
             "🤖 Chatbot ON",
-            value=current_auto_enabled,
-            key=f"auto_toggle_{phone}"
+            key=auto_toggle_key,
+            on_change=on_automation_toggle,
+            args=(phone, auto_toggle_key)
         )
 
     with col_toggle3:
         auto_refresh = st.checkbox("🔄 Auto-refresh", value=st.session_state.auto_refresh, key="auto_refresh_toggle")
         st.session_state.auto_refresh = auto_refresh
 
-    # Detect automation toggle change and push to backend
-    if new_auto_enabled != current_auto_enabled:
-        if set_automation_status(phone, new_auto_enabled):
-            st.session_state[auto_state_key] = new_auto_enabled
-            st.success("Automation turned " + ("ON ✅" if new_auto_enabled else "OFF ⏸️"))
+    automation_result = st.session_state.pop("automation_result", None)
+    if automation_result is not None:
+        enabled, ok = automation_result
+        if ok:
+            st.success("Automation turned " + ("ON ✅" if enabled else "OFF ⏸️"))
         else:
             st.error("Failed to update automation status.")
-            st.session_state[auto_state_key] = current_auto_enabled
-
-    if st.session_state.auto_refresh:
-        st.markdown("""
-        <script>
-            setTimeout(function() {
-                window.parent.location.reload();
-            }, 5000);
-        </script>
-        """, unsafe_allow_html=True)
 
     # Chat header + delete button
     col_header_content, col_header_delete = st.columns([4, 1])
@@ -1854,224 +4179,13 @@ with col2:
                 if delete_conversation(phone):
                     st.success("Deleted!")
                     st.session_state.pop('confirm_del', None)
+                    st.session_state.conv_cursors = []
                     st.rerun()
             else:
                 st.session_state.confirm_del = True
                 st.warning("Click again to confirm deletion")
 
-    # Search in conversation
-    search_query = st.text_input(
-        "Search in this chat",
-        placeholder="Type to search messages...",
-        key="search_conv",
-        label_visibility="collapsed"
-    )
-
-    # Fetch conversation
-    conv = fetch_conversation(phone, limit=CONV_LIMIT, offset=st.session_state.conv_offset)
-
-    # Apply filters
-    date_filter = st.session_state.filter_date if st.session_state.filter_by_date else None
-    time_from = st.session_state.filter_time_from if st.session_state.filter_by_time else None
-    time_to = st.session_state.filter_time_to if st.session_state.filter_by_time else None
-    conv = filter_messages(conv, date_filter, time_from, time_to)
-
-    # Correct chronological order (oldest first)
-    conv.sort(
-        key=lambda x: (
-            convert_to_ist(x.get("timestamp")),
-            x.get("id", 0)
-        ),
-        reverse=False
-    )
-
-    unread_count = sum(1 for m in conv if m.get("follow_up_needed"))
-
-    if unread_count > 0:
-        st.markdown(
-            '<div style="color: #ff3b30; font-size: 13px; margin: 0 0 10px 20px;">'
-            f'🔴 {unread_count} unread messages</div>',
-            unsafe_allow_html=True
-        )
-
-    chat_container = st.container()
-
-    with chat_container:
-        if not conv:
-            st.info("📭 No messages yet")
-        else:
-            current_date = None
-            for msg in conv:
-                msg_dt = convert_to_ist(msg["timestamp"])
-                msg_date = msg_dt.date()
-
-                if current_date != msg_date:
-                    current_date = msg_date
-                    today = datetime.now(IST).date()
-
-                    if msg_date == today:
-                        date_label = "Today"
-                    elif msg_date == today - timedelta(days=1):
-                        date_label = "Yesterday"
-                    else:
-                        date_label = msg_dt.strftime("%B %d, %Y")
-
-                    st.markdown(
-                        f'<div style="text-align: center; margin: 16px 0; color: #8696a0; font-size: 12px;">{date_label}</div>',
-                        unsafe_allow_html=True
-                    )
-
-                direction = "user" if msg.get("direction") in ["user", "incoming"] else "bot"
-
-                raw_text = msg.get("message", "")
-                raw_text = html.escape(raw_text)
-                display_text = raw_text
-
-                if search_query and search_query.strip():
-                    pattern = re.escape(search_query.strip())
-
-                    def repl(m):
-                        return (
-                            '<span style="background-color: #ffd700; padding: 0 1px; '
-                            'border-radius: 2px;">'
-                            f'{html.escape(m.group(0))}</span>'
-                        )
-
-                    try:
-                        display_text = re.sub(pattern, repl, display_text, flags=re.IGNORECASE)
-                    except:
-                        pass
-
-                display_text = display_text.replace("\n", "<br>")
-
-                msg_time = format_message_time(msg["timestamp"])
-
-                message_html = f"""
-                <div class="message-row {direction}">
-                    <div class="message-bubble {direction}">
-                        <div class="message-text">{display_text}</div>
-                """
-
-                if msg.get("notes"):
-                    notes_text = html.escape(msg["notes"])
-                    message_html += (
-                        '<div style="font-size: 11px; color: rgba(255, 255, 255, 0.6); '
-                        'margin-top: 4px; border-top: 1px solid rgba(255, 255, 255, 0.1); '
-                        'padding-top: 2px;">📝 '
-                        f'{notes_text}</div>'
-                    )
-                if msg.get("handled_by"):
-                    handler_text = html.escape(msg["handled_by"])
-                    message_html += f'<div class="handler-meta">👤 {handler_text}</div>'
-
-                message_html += f'<div class="message-time">{msg_time}</div>'
-                message_html += "</div></div>"
-                st.markdown(message_html, unsafe_allow_html=True)
-
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    # Pagination
-    st.markdown('<div class="pagination-section">', unsafe_allow_html=True)
-    col_p1, col_p2, col_p3 = st.columns([1, 2, 1])
-
-    with col_p1:
-        prev_disabled = st.session_state.conv_offset == 0
-        if st.button("⬅️ Prev", disabled=prev_disabled):
-            st.session_state.conv_offset = max(0, st.session_state.conv_offset - CONV_LIMIT)
-            st.rerun()
-
-    with col_p2:
-        start_idx = st.session_state.conv_offset + 1 if conv else 0
-        end_idx = st.session_state.conv_offset + len(conv)
-        st.markdown(
-            f'<p class="pagination-info">Showing messages {start_idx}–{end_idx}</p>',
-            unsafe_allow_html=True
-        )
-
-    with col_p3:
-        if st.button("Next ➡️"):
-            st.session_state.conv_offset += CONV_LIMIT
-            st.rerun()
-
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    # Send message section
-    st.markdown('<div class="send-section">', unsafe_allow_html=True)
-    st.markdown("### ✉️ Send Message")
-    col_s1, col_s2 = st.columns([3, 1])
-
-    draft_key = f"new_msg_{phone}"
-    type_key = f"msg_type_{phone}"
-    tmpl_key = f"tmpl_{phone}"
-
-    with col_s1:
-        new_msg = st.text_area(
-            "Message",
-            value=st.session_state.get(draft_key, ""),
-            placeholder="Type a WhatsApp message to send...",
-            key=draft_key,
-            height=100
-        )
-
-    with col_s2:
-        msg_type_label = st.radio(
-            "Type",
-            ["Text", "Template"],
-            key=type_key
-        )
-        template_name = None
-        if msg_type_label == "Template":
-            template_name = st.text_input(
-                "Template name",
-                placeholder="e.g. sip_followup_1",
-                key=tmpl_key
-            )
-
-    if st.button("📨 Send via WhatsApp", use_container_width=True, key=f"send_{phone}"):
-        msg_clean = (new_msg or "").strip()
-        if not msg_clean:
-            st.warning("Message cannot be empty.")
-        else:
-            msg_type = "template" if msg_type_label == "Template" else "text"
-            ok = send_whatsapp_message(phone, msg_clean, msg_type, template_name)
-            if ok:
-                st.success("Message sent ✅")
-                if draft_key in st.session_state:
-                    del st.session_state[draft_key]  # auto-clear after send
-                time_module.sleep(0.5)
-                st.rerun()
-
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    # Update follow-up status section
-    update_msg = conv[0] if conv else None
-
-    if update_msg:
-        st.markdown('<div class="update-section">', unsafe_allow_html=True)
-        st.markdown("### 📝 Update Follow-up Status")
+    st.fragment(run_every=refresh_every)(render_conversation)(phone)
 
-        col_u1, col_u2 = st.columns(2)
-        with col_u1:
-            fu_flag = st.checkbox("🔴 Follow-up needed", value=update_msg.get("follow_up_needed", False))
-        with col_u2:
-            handler = st.text_input("👤 Handled by", value=update_msg.get("handled_by") or "")
-
-        notes = st.text_area("📝 Notes", value=update_msg.get("notes") or "")
-
-        if st.button("💾 Save Follow-up", use_container_width=True):
-            try:
-                response = make_request_with_retry(
-                    f"{API_BASE}/message/{update_msg['id']}",
-                    method="PATCH",
-                    json_data={"follow_up_needed": fu_flag, "notes": notes, "handled_by": handler}
-                )
-                if response and response.status_code == 200:
-                    st.success("✅ Saved!")
-                    st.rerun()
-                else:
-                    st.error("Error saving follow-up status")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-
-        st.markdown('</div>', unsafe_allow_html=True)
 
+render_debug_panel()
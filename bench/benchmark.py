@@ -0,0 +1,197 @@
+"""
+Headless benchmark of app.py against the local fake backend.
+
+    python bench/benchmark.py --sizes 20x50,200x200,1000x100 --reruns 10 --latency 30
+
+Each dataset size (contacts x messages per contact) runs in a fresh Python
+process, so process-wide caches and peak memory start clean. The app is
+driven through Streamlit's app-testing API (streamlit.testing.v1.AppTest):
+a cold first load, warm reruns, opening other contacts, searching the chat,
+paging back, toggling the chatbot and sending a message. For each action
+the report gives rerun latency percentiles and backend requests per rerun,
+plus the peak traced and resident memory of the run.
+
+AppTest only does full script runs: it can't run a fragment on its own, so
+actions that rerun just the contact list or the chat in a browser (paging,
+sending, the refresh timer) are measured as full reruns here, an upper
+bound for what the browser waits. The app falls back to a full rerun
+where it asks for a fragment rerun during one (rerun_fragment()).
+
+Backend options (--latency, --jitter, --error-rate, --legacy) are passed to
+bench/fake_backend.py. Sends are delivered by the app's outbox worker in the
+background, so their webhook and /log_message calls land in later reruns.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from fake_backend import add_backend_arguments, backend_options, serve
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Recorder:
+    """Wall time and backend requests of each rerun, grouped by action."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.samples = {}      # action -> [(seconds, requests)]
+        self.exceptions = []
+
+    def run(self, action: str, at, step):
+        before = self.backend.stats()["total"]
+        started = time.perf_counter()
+        step()
+        seconds = time.perf_counter() - started
+        self.samples.setdefault(action, []).append((seconds, self.backend.stats()["total"] - before))
+        for exc in at.exception:
+            self.exceptions.append(f"{action}: {exc.message}")
+
+    def summary(self) -> dict:
+        return {
+            action: {
+                "runs": len(samples),
+                "p50_ms": round(percentile([s for s, _ in samples], 0.5) * 1000, 1),
+                "p95_ms": round(percentile([s for s, _ in samples], 0.95) * 1000, 1),
+                "max_ms": round(max(s for s, _ in samples) * 1000, 1),
+                "requests": round(sum(r for _, r in samples) / len(samples), 1),
+            }
+            for action, samples in self.samples.items()
+        }
+
+
+def new_app(servers, outbox_path: str, timeout: float):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP), default_timeout=timeout)
+    at.secrets["api_base"] = servers.api_url
+    at.secrets["make_webhook_url"] = servers.webhook_url
+    at.secrets["dashboard_password"] = "bench"
+    at.secrets["outbox_path"] = outbox_path
+    at.session_state["password_correct"] = True
+    return at
+
+
+def contact_buttons(at) -> list:
+    return [b for b in at.button if b.key and b.key.startswith("contact_")]
+
+
+def run_size(contacts: int, messages: int, args) -> dict:
+    os.chdir(APP.parent)   # Logo.png and the outbox are resolved from the app's directory
+    tracemalloc.start()
+    with serve(contacts, messages, **backend_options(args)) as servers, \
+            tempfile.TemporaryDirectory() as tmp:
+        at = new_app(servers, os.path.join(tmp, "outbox.sqlite3"), args.timeout)
+        rec = Recorder(servers.backend)
+
+        rec.run("cold load", at, at.run)
+        for _ in range(args.reruns):
+            rec.run("warm rerun", at, at.run)
+
+        # Element handles belong to one run's tree: look the button up again after every rerun
+        for i in range(1, args.contact_switches + 1):
+            buttons = contact_buttons(at)
+            if i >= len(buttons):
+                break
+            rec.run("open contact", at, buttons[i].click().run)
+        phone = at.session_state["selected_phone"]
+
+        for word in ("sip", "kyc", ""):
+            rec.run("search chat", at, at.text_input(key="search_conv").input(word).run)
+
+        for _ in range(args.pages):
+            older = [b for b in at.button if b.label.startswith("Next")]
+            if not older or older[0].disabled:
+                break
+            rec.run("older page", at, older[0].click().run)
+
+        toggle = at.checkbox(key=f"auto_toggle_{phone}")
+        rec.run("toggle chatbot", at, toggle.set_value(not toggle.value).run)
+
+        for i in range(args.sends):
+            at.text_area(key=f"new_msg_{phone}").input(f"benchmark message {i}")
+            rec.run("send", at, at.button(key=f"send_{phone}").click().run)
+
+        for _ in range(args.reruns):
+            rec.run("warm rerun", at, at.run)
+
+        _, peak = tracemalloc.get_traced_memory()
+        return {
+            "size": f"{contacts}x{messages}",
+            "actions": rec.summary(),
+            "peak_traced_mb": round(peak / 2 ** 20, 1),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "backend": servers.backend.stats(),
+            "exceptions": rec.exceptions[:10],
+        }
+
+
+def print_report(results: list):
+    print(f"{'size':>11} {'action':<15} {'runs':>4} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'req/rerun':>9}")
+    for result in results:
+        for action, row in result["actions"].items():
+            print(f"{result['size']:>11} {action:<15} {row['runs']:>4} {row['p50_ms']:>8} "
+                  f"{row['p95_ms']:>8} {row['max_ms']:>8} {row['requests']:>9}")
+        print(f"{result['size']:>11} peak traced {result['peak_traced_mb']} MB, "
+              f"max RSS {result['max_rss_mb']} MB, {result['backend']['total']} backend requests")
+        for line in result["exceptions"]:
+            print(f"{result['size']:>11} ! {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app.py against the local fake backend.")
+    parser.add_argument("--sizes", default="20x50,200x200,1000x100",
+                        help="comma-separated contacts x messages-per-contact datasets")
+    parser.add_argument("--reruns", type=int, default=10, help="warm reruns before and after the actions")
+    parser.add_argument("--contact-switches", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=3, help="older pages to open")
+    parser.add_argument("--sends", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per rerun")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--one", help=argparse.SUPPRESS)   # internal: run a single size in this process
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    if args.one:
+        contacts, messages = (int(n) for n in args.one.split("x"))
+        print(json.dumps(run_size(contacts, messages, args)))
+        return
+
+    results = []
+    passthrough = [
+        "--reruns", str(args.reruns), "--contact-switches", str(args.contact_switches),
+        "--pages", str(args.pages), "--sends", str(args.sends), "--timeout", str(args.timeout),
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+        *(["--legacy"] if args.legacy else []),
+    ]
+    for size in args.sizes.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--one", size, *passthrough],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{size}: benchmark failed\n{proc.stderr}", file=sys.stderr)
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
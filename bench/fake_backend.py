@@ -0,0 +1,435 @@
+"""
+Local stand-in for the dashboard backend and the Make webhook.
+
+Serves the endpoints app.py calls from an in-memory synthetic dataset, with
+configurable latency and error injection, so the dashboard can be measured
+without touching the production Render backend:
+
+    python bench/fake_backend.py --contacts 200 --messages 500 --latency 40 --error-rate 0.01
+
+then point the app at it (.streamlit/secrets.toml):
+
+    api_base = "http://127.0.0.1:8765"
+    make_webhook_url = "http://127.0.0.1:8766/webhook"
+
+The optional endpoints the app probes for (batch summaries, bulk automation
+flags, follow-up counts, batched logging, since/before and date/time
+filters) can be switched off with --legacy to measure the fallback paths.
+
+GET /__stats returns the request count per endpoint; POST /__reset clears it.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+OPTIONAL_FEATURES = (
+    "summary",             # GET /contacts/summary?phones=
+    "automation_batch",    # GET /automation?phones=
+    "follow_up_counts",    # GET /follow_up/counts
+    "log_batch",           # POST /log_messages
+    "keyset",              # since_id/since and before/before_id on /conversation
+    "filters",             # date_from/date_to/time_from/time_to on /conversation
+)
+
+FIRST_NAMES = ("Aarav", "Diya", "Ishaan", "Kavya", "Rohan", "Saanvi", "Vihaan", "Anaya", "Arjun", "Meera")
+LAST_NAMES = ("Sharma", "Iyer", "Patel", "Reddy", "Nair", "Gupta", "Menon", "Rao", "Das", "Khan")
+WORDS = ("sip", "portfolio", "mutual", "fund", "returns", "kyc", "statement", "nav", "redeem",
+         "invest", "monthly", "amount", "date", "please", "update", "thanks", "call", "tomorrow")
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class Dataset:
+    """N contacts with M messages each, deterministic for a given seed."""
+
+    def __init__(self, contacts: int, messages: int, seed: int = 7, follow_up_rate: float = 0.05):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.next_id = 1
+        self.contacts = []
+        self.conversations = {}     # phone -> messages, oldest first
+        self.automation = {}
+        for i in range(contacts):
+            phone = f"91{9000000000 + i}"
+            self.contacts.append({
+                "phone": phone,
+                "client_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            })
+            self.automation[phone] = rng.random() > 0.2
+            start = now - timedelta(days=30)
+            step = timedelta(days=30) / max(messages, 1)
+            conv = []
+            for j in range(messages):
+                conv.append(self._message(
+                    phone,
+                    " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20))),
+                    "incoming" if rng.random() < 0.5 else "outgoing",
+                    start + step * j + timedelta(seconds=rng.randint(0, 59)),
+                    follow_up_needed=rng.random() < follow_up_rate,
+                ))
+            self.conversations[phone] = conv
+
+    def _message(self, phone, text, direction, ts: datetime, follow_up_needed=False,
+                 handled_by="", notes="") -> dict:
+        msg = {
+            "id": self.next_id,
+            "phone": phone,
+            "message": text,
+            "direction": direction,
+            "timestamp": ts.isoformat(),
+            "follow_up_needed": follow_up_needed,
+            "notes": notes,
+            "handled_by": handled_by,
+        }
+        self.next_id += 1
+        return msg
+
+    def find_message(self, msg_id: int):
+        for conv in self.conversations.values():
+            for i, msg in enumerate(conv):
+                if msg["id"] == msg_id:
+                    return conv, i
+        return None, None
+
+
+class FakeBackend:
+    """Request routing, latency, error injection and per-endpoint counters."""
+
+    def __init__(self, dataset: Dataset, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, features=OPTIONAL_FEATURES, include_automation: bool = True,
+                 seed: int = 7):
+        self.data = dataset
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.features = set(features)
+        self.include_automation = include_automation
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.webhook_keys = set()
+        self.webhook_duplicates = 0
+        self.logged_keys = set()
+
+    # ---------- bookkeeping ----------
+
+    @staticmethod
+    def template(method: str, path: str) -> str:
+        segments = path.strip("/").split("/")
+        for i, segment in enumerate(segments):
+            if re.fullmatch(r"\+?\d+", segment):
+                segments[i] = "{id}" if i and segments[i - 1] == "message" else "{phone}"
+        return f"{method} /" + "/".join(segments)
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": dict(self.counts),
+                "total": sum(self.counts.values()),
+                "webhook_duplicates": self.webhook_duplicates,
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.webhook_duplicates = 0
+
+    def delay(self):
+        seconds = (self.latency_ms + self.rng.uniform(0, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def inject_error(self) -> bool:
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    # ---------- routing ----------
+
+    def handle(self, method: str, path: str, query: dict, body) -> tuple:
+        if path == "/__stats":
+            return 200, self.stats()
+        if path == "/__reset":
+            self.reset()
+            return 200, {"ok": True}
+
+        self.count(self.template(method, path))
+        self.delay()
+        if self.inject_error():
+            return 503, {"detail": "injected error"}
+
+        parts = path.strip("/").split("/")
+        with self.lock:
+            if parts == ["contacts"] and method == "GET":
+                return self.contacts(query.get("only_follow_up", "false").lower() == "true")
+            if parts == ["contacts", "summary"] and method == "GET" and "summary" in self.features:
+                return self.summaries(query.get("phones", ""))
+            if parts[0] == "conversation":
+                phone = parts[1] if len(parts) > 1 else query.get("phone", "")
+                if method == "GET":
+                    return self.conversation(phone, query)
+                if method == "DELETE" and len(parts) > 1:
+                    self.data.conversations[phone] = []
+                    return 200, {"deleted": True}
+            if parts[0] == "message" and len(parts) == 2:
+                return self.message(method, int(parts[1]), body or {})
+            if parts[0] == "automation":
+                if len(parts) == 2:
+                    return self.automation(method, parts[1], body or {})
+                if method == "GET" and "automation_batch" in self.features:
+                    phones = [p for p in query.get("phones", "").split(",") if p]
+                    return 200, {p: self.data.automation.get(p, True) for p in phones}
+            if parts == ["follow_up", "counts"] and method == "GET" and "follow_up_counts" in self.features:
+                return 200, {"counts": {
+                    phone: sum(1 for m in conv if m["follow_up_needed"])
+                    for phone, conv in self.data.conversations.items()
+                }}
+            if parts == ["log_message"] and method == "POST":
+                return self.log_message(body or {})
+            if parts == ["log_messages"] and method == "POST" and "log_batch" in self.features:
+                for payload in (body or {}).get("messages", []):
+                    self.log_message(payload)
+                return 200, {"logged": len((body or {}).get("messages", []))}
+        return 404, {"detail": "Not Found"}
+
+    def handle_webhook(self, body) -> tuple:
+        self.count("POST make-webhook")
+        self.delay()
+        if self.inject_error():
+            return 503, {"detail": "injected error"}
+        key = (body or {}).get("idempotency_key")
+        with self.lock:
+            if key and key in self.webhook_keys:
+                self.webhook_duplicates += 1
+            elif key:
+                self.webhook_keys.add(key)
+        return 200, {"accepted": True}
+
+    # ---------- endpoints ----------
+
+    def _follow_up_count(self, phone: str) -> int:
+        return sum(1 for m in self.data.conversations.get(phone, []) if m["follow_up_needed"])
+
+    def contacts(self, only_follow_up: bool) -> tuple:
+        rows = []
+        for contact in self.data.contacts:
+            follow_up_open = self._follow_up_count(contact["phone"]) > 0
+            if only_follow_up and not follow_up_open:
+                continue
+            row = {**contact, "follow_up_open": follow_up_open}
+            if self.include_automation:
+                row["automation_enabled"] = self.data.automation.get(contact["phone"], True)
+            rows.append(row)
+        return 200, rows
+
+    def summaries(self, phones: str) -> tuple:
+        rows = []
+        for phone in (p for p in phones.split(",") if p):
+            conv = self.data.conversations.get(phone, [])
+            last = conv[-1] if conv else None
+            rows.append({
+                "phone": phone,
+                "last_message": last["message"] if last else "",
+                "last_timestamp": last["timestamp"] if last else None,
+                "follow_up_count": self._follow_up_count(phone),
+            })
+        return 200, rows
+
+    def conversation(self, phone: str, query: dict) -> tuple:
+        if phone not in self.data.conversations:
+            return 200, []
+        messages = self.data.conversations[phone]
+
+        if "keyset" in self.features:
+            if query.get("since_id"):
+                since_id = int(query["since_id"])
+                messages = [m for m in messages if m["id"] > since_id]
+            elif query.get("since"):
+                since = _parse_ts(query["since"])
+                messages = [m for m in messages if _parse_ts(m["timestamp"]) > since]
+            if query.get("before"):
+                before = (_parse_ts(query["before"]), int(query.get("before_id") or 0))
+                messages = [m for m in messages if (_parse_ts(m["timestamp"]), m["id"]) < before]
+
+        if "filters" in self.features:
+            if query.get("date_from") and query.get("date_to"):
+                start, end = _parse_ts(query["date_from"]), _parse_ts(query["date_to"])
+                messages = [m for m in messages if start <= _parse_ts(m["timestamp"]) < end]
+            if query.get("time_from") and query.get("time_to"):
+                lo, hi = query["time_from"], query["time_to"]
+                messages = [
+                    m for m in messages
+                    if lo <= _parse_ts(m["timestamp"]).astimezone(IST).strftime("%H:%M:%S") <= hi
+                ]
+
+        limit = int(query.get("limit") or 50)
+        offset = int(query.get("offset") or 0)
+        newest_first = messages[::-1]
+        return 200, newest_first[offset:offset + limit]
+
+    def message(self, method: str, msg_id: int, body: dict) -> tuple:
+        conv, index = self.data.find_message(msg_id)
+        if conv is None:
+            return 404, {"detail": "message not found"}
+        if method == "DELETE":
+            del conv[index]
+            return 200, {"deleted": True}
+        if method == "PATCH":
+            for field in ("follow_up_needed", "notes", "handled_by"):
+                if field in body:
+                    conv[index][field] = body[field]
+            return 200, conv[index]
+        return 405, {"detail": "Method Not Allowed"}
+
+    def automation(self, method: str, phone: str, body: dict) -> tuple:
+        if method == "PATCH":
+            self.data.automation[phone] = bool(body.get("automation_enabled", True))
+        return 200, {"phone": phone, "automation_enabled": self.data.automation.get(phone, True)}
+
+    def log_message(self, payload: dict) -> tuple:
+        key = payload.get("client_msg_id")
+        if key and key in self.logged_keys:
+            return 200, {"duplicate": True}
+        if key:
+            self.logged_keys.add(key)
+        phone = payload.get("phone", "")
+        msg = self.data._message(
+            phone, payload.get("message", ""), "dashboard",
+            _parse_ts(payload["timestamp"]) if payload.get("timestamp") else datetime.now(timezone.utc),
+            handled_by=payload.get("handled_by", ""),
+        )
+        self.data.conversations.setdefault(phone, []).append(msg)
+        return 200, {"id": msg["id"]}
+
+
+def _handler(backend: FakeBackend, webhook: bool):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, like the real upstreams
+
+        def _dispatch(self, method: str):
+            parts = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"null") if length else None
+            try:
+                if webhook:
+                    status, payload = backend.handle_webhook(body) if method == "POST" else (405, {})
+                else:
+                    status, payload = backend.handle(method, parts.path, query, body)
+            except (ValueError, KeyError) as e:
+                status, payload = 422, {"detail": str(e)}
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeServers:
+    """The backend API and the Make webhook on two local ports, served from threads."""
+
+    def __init__(self, backend: FakeBackend, host: str = "127.0.0.1", port: int = 0, webhook_port: int = 0):
+        self.backend = backend
+        self.api = ThreadingHTTPServer((host, port), _handler(backend, webhook=False))
+        self.webhook = ThreadingHTTPServer((host, webhook_port), _handler(backend, webhook=True))
+        self.api.daemon_threads = self.webhook.daemon_threads = True
+        self.api_url = f"http://{host}:{self.api.server_address[1]}"
+        self.webhook_url = f"http://{host}:{self.webhook.server_address[1]}/webhook"
+
+    def start(self):
+        for server in (self.api, self.webhook):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in (self.api, self.webhook):
+            server.shutdown()
+            server.server_close()
+
+
+@contextmanager
+def serve(contacts: int = 50, messages: int = 100, **options):
+    """Run a fake backend for the duration of a with-block; yields the FakeServers."""
+    dataset = Dataset(contacts, messages, seed=options.pop("seed", 7))
+    servers = FakeServers(FakeBackend(dataset, **options)).start()
+    try:
+        yield servers
+    finally:
+        servers.stop()
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0, help="base latency per request, ms")
+    parser.add_argument("--jitter", type=float, default=0, help="extra random latency up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--legacy", action="store_true",
+                        help="serve only the endpoints the production backend has today")
+
+
+def backend_options(args) -> dict:
+    return {
+        "latency_ms": args.latency,
+        "jitter_ms": args.jitter,
+        "error_rate": args.error_rate,
+        "features": () if args.legacy else OPTIONAL_FEATURES,
+        "include_automation": not args.legacy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--contacts", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=100, help="messages per contact")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--webhook-port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=7)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    dataset = Dataset(args.contacts, args.messages, seed=args.seed)
+    servers = FakeServers(FakeBackend(dataset, **backend_options(args)),
+                          args.host, args.port, args.webhook_port).start()
+    print(f"api_base = \"{servers.api_url}\"")
+    print(f"make_webhook_url = \"{servers.webhook_url}\"")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servers.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Multi-session load test: K browser sessions against one `streamlit run` server.
+
+    python bench/loadtest.py --sessions 1,2,4,8,16 --duration 60 --contacts 300 --messages 200 --latency 40
+
+For each K a fresh server process runs app.py against the fake backend, and
+K client threads each open the Streamlit websocket (/_stcore/stream) the way
+a browser tab does: they send rerun requests carrying widget values and read
+the protobuf ForwardMsgs until the run finishes. Each session loops through
+agent actions (timer tick of a run_every fragment, open a contact, search
+the chat, page back, send, toggle the chatbot) with a think time between
+them. Clicks on widgets inside a fragment rerun just that fragment, as in
+the browser. Per K the report gives:
+
+- reruns per second and rerun latency p50/p95/p99 (request sent to
+  script_finished received),
+- server process CPU (100% = one core busy) and resident memory, read from
+  /proc for the server's pid only (so Linux only); the fake backend runs in
+  this process and is not counted,
+- backend request rate.
+
+The K where latency climbs while reruns per second stops growing is where
+the server saturates. Needs the `websockets` package (a Streamlit
+dependency since the server moved to Starlette; `pip install websockets`
+on older versions).
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+from benchmark import APP, percentile
+from fake_backend import add_backend_arguments, backend_options, serve
+
+ACTIONS = (
+    ("timer rerun", 5),
+    ("open contact", 2),
+    ("search chat", 2),
+    ("older page", 1),
+    ("send", 1),
+    ("toggle chatbot", 1),
+)
+
+
+@dataclass
+class Widget:
+    id: str
+    kind: str
+    label: str
+    fragment_id: str
+    disabled: bool
+    value: object
+
+    @property
+    def key(self) -> str:
+        # Widget ids look like "$$ID-<hash>-<user key>"
+        return self.id.split("-", 2)[2] if self.id.startswith("$$ID-") else ""
+
+
+class BrowserSession:
+    """One browser tab: a websocket to the server plus the widgets it was last sent."""
+
+    def __init__(self, ws, timeout: float):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        self.BackMsg, self.ForwardMsg = BackMsg, ForwardMsg
+        self.ws = ws
+        self.timeout = timeout
+        self.widgets = {}      # id -> Widget
+        self.values = {}       # id -> (WidgetState field, value) sent with every rerun, as a browser does
+        self.fragments = {}    # fragment id -> run_every interval
+
+    def find(self, prefix: str) -> list:
+        return [w for w in self.widgets.values() if w.key.startswith(prefix)]
+
+    def run(self, fragment_id: str = "", triggers=(), auto: bool = False) -> list:
+        """Send one rerun request and read until it finishes; returns the exception messages it rendered."""
+        msg = self.BackMsg()
+        state = msg.rerun_script
+        state.fragment_id = fragment_id
+        state.is_auto_rerun = auto
+        for widget_id, (field, value) in self.values.items():
+            widget = state.widget_states.widgets.add()
+            widget.id = widget_id
+            setattr(widget, field, value)
+        for widget_id in triggers:
+            widget = state.widget_states.widgets.add()
+            widget.id = widget_id
+            widget.trigger_value = True
+        self.ws.send(msg.SerializeToString())
+
+        # A click in a fragment can end in a full rerun (st.rerun()), so what the
+        # run sent replaces or extends the known elements depending on how it finished
+        widgets, fragments, errors = {}, {}, []
+        deadline = time.monotonic() + self.timeout
+        while True:
+            fwd = self.ForwardMsg()
+            fwd.ParseFromString(self.ws.recv(timeout=max(deadline - time.monotonic(), 0.1)))
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                self._element(fwd.delta.new_element, fwd.delta.fragment_id, widgets, errors)
+            elif kind == "auto_rerun":
+                fragments[fwd.auto_rerun.fragment_id] = fwd.auto_rerun.interval
+            elif kind == "script_finished":
+                if fwd.script_finished == self.ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    widgets, fragments, errors = {}, {}, []
+                    continue
+                if fwd.script_finished == self.ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY:
+                    kept = {k: w for k, w in self.widgets.items() if w.fragment_id != fragment_id}
+                    self.widgets = {**kept, **widgets}
+                    self.fragments.update(fragments)
+                else:
+                    self.widgets, self.fragments = widgets, fragments
+                # Like the browser, only report values of widgets still on the page
+                self.values = {k: v for k, v in self.values.items() if k in self.widgets}
+                return errors
+
+    @staticmethod
+    def _element(element, fragment_id: str, widgets: dict, errors: list):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            errors.append(f"{element.exception.type}: {element.exception.message}")
+            return
+        proto = getattr(element, kind)
+        widget_id = getattr(proto, "id", "")
+        if not widget_id or not isinstance(widget_id, str):
+            return
+        value = None
+        if hasattr(proto, "set_value") and hasattr(proto, "value"):
+            value = proto.value if proto.set_value else proto.default
+        widgets[widget_id] = Widget(widget_id, kind, getattr(proto, "label", ""), fragment_id,
+                                    bool(getattr(proto, "disabled", False)), value)
+
+    def set(self, widget: Widget, field: str, value) -> str:
+        self.values[widget.id] = (field, value)
+        return widget.fragment_id
+
+    def login(self, password: str):
+        self.run()
+        field = self.find("password")
+        if field:
+            self.set(field[0], "string_value", password)
+            self.run()
+            self.values.pop(field[0].id, None)
+
+
+def act(session: BrowserSession, action: str, phone: str, rng: random.Random) -> tuple:
+    """Perform one agent action; returns (phone now open, exception messages)."""
+    if action == "timer rerun" and session.fragments:
+        return phone, session.run(fragment_id=rng.choice(list(session.fragments)), auto=True)
+    if action == "open contact":
+        buttons = session.find("contact_")
+        if buttons:
+            button = rng.choice(buttons)
+            return button.key[len("contact_"):], session.run(button.fragment_id, triggers=[button.id])
+    elif action == "search chat":
+        for field in session.find("search_conv"):
+            return phone, session.run(session.set(field, "string_value", rng.choice(("sip", "kyc", "nav", ""))))
+    elif action == "older page":
+        older = [w for w in session.widgets.values() if w.kind == "button" and w.label.startswith("Next")]
+        if older and not older[0].disabled:
+            return phone, session.run(older[0].fragment_id, triggers=[older[0].id])
+    elif action == "send":
+        drafts, buttons = session.find(f"new_msg_{phone}"), session.find(f"send_{phone}")
+        if drafts and buttons:
+            session.set(drafts[0], "string_value", f"load test {rng.random():.6f}")
+            return phone, session.run(buttons[0].fragment_id, triggers=[buttons[0].id])
+    elif action == "toggle chatbot":
+        for toggle in session.find(f"auto_toggle_{phone}"):
+            current = session.values.get(toggle.id, (None, toggle.value))[1]
+            return phone, session.run(session.set(toggle, "bool_value", not current))
+    return phone, session.run()
+
+
+def session_loop(index: int, port: int, args, stop: threading.Event, latencies: list, errors: list,
+                 lock: threading.Lock):
+    rng = random.Random(index)
+    names = [name for name, _ in ACTIONS]
+    weights = [weight for _, weight in ACTIONS]
+    from websockets.sync.client import connect
+
+    try:
+        ws = connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"], max_size=None)
+    except Exception as e:
+        with lock:
+            errors.append(f"connect: {type(e).__name__}: {e}")
+        return
+    with ws:
+        session = BrowserSession(ws, args.timeout)
+        session.login("bench")
+        phone = ""
+        while not stop.is_set():
+            action = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                phone, failed = act(session, action, phone, rng)
+            except Exception as e:   # a rerun timing out under load is a result, not a crash
+                failed = [f"{type(e).__name__}: {e}"]
+            seconds = time.perf_counter() - started
+            with lock:
+                latencies.append(seconds)
+                errors.extend(f"{action}: {message}" for message in failed)
+            stop.wait(rng.uniform(0.5, 1.5) * args.think)
+
+
+def process_usage(pid: int) -> tuple:
+    """(CPU seconds, resident MB) of one process, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    with open(f"/proc/{pid}/statm") as f:
+        pages = int(f.read().split()[1])
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")   # utime + stime
+    return cpu, pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(servers, tmp: str) -> tuple:
+    """Run app.py under `streamlit run` pointed at the fake backend; returns (process, port)."""
+    secrets = os.path.join(tmp, "secrets.toml")
+    with open(secrets, "w") as f:
+        f.write(f'api_base = "{servers.api_url}"\n'
+                f'make_webhook_url = "{servers.webhook_url}"\n'
+                f'dashboard_password = "bench"\n'
+                f'outbox_path = "{os.path.join(tmp, "outbox.sqlite3")}"\n')
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP), "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false", "--secrets.files", secrets],
+        cwd=APP.parent,   # Logo.png is resolved from the app's directory
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, port
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("streamlit server did not start")
+
+
+def run_level(sessions: int, args) -> dict:
+    with serve(args.contacts, args.messages, **backend_options(args)) as servers, \
+            tempfile.TemporaryDirectory() as tmp:
+        proc, port = start_server(servers, tmp)
+        try:
+            stop = threading.Event()
+            latencies, errors, lock = [], [], threading.Lock()
+            threads = [
+                threading.Thread(target=session_loop, daemon=True,
+                                 args=(i, port, args, stop, latencies, errors, lock))
+                for i in range(sessions)
+            ]
+            for thread in threads:
+                thread.start()
+
+            # Let every session get past its cold load before measuring
+            time.sleep(args.warmup)
+            with lock:
+                latencies.clear()
+            requests_before = servers.backend.stats()["total"]
+            cpu_before, _ = process_usage(proc.pid)
+            wall_before = time.perf_counter()
+            rss_samples = []
+            while time.perf_counter() - wall_before < args.duration:
+                time.sleep(1)
+                rss_samples.append(process_usage(proc.pid)[1])
+            wall = time.perf_counter() - wall_before
+            cpu = process_usage(proc.pid)[0] - cpu_before
+            requests = servers.backend.stats()["total"] - requests_before
+            with lock:
+                measured = list(latencies)
+            stop.set()
+            for thread in threads:
+                thread.join(args.timeout)
+        finally:
+            proc.terminate()
+            proc.wait(10)
+
+    return {
+        "sessions": sessions,
+        "reruns_per_s": round(len(measured) / wall, 2),
+        "p50_ms": round(percentile(measured, 0.5) * 1000) if measured else None,
+        "p95_ms": round(percentile(measured, 0.95) * 1000) if measured else None,
+        "p99_ms": round(percentile(measured, 0.99) * 1000) if measured else None,
+        "cpu_pct": round(cpu / wall * 100),
+        "rss_mb": round(max(rss_samples), 1),
+        "backend_rps": round(requests / wall, 1),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+    }
+
+
+def print_report(results: list):
+    print(f"{'sessions':>8} {'reruns/s':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'CPU %':>6} {'RSS MB':>7} {'backend/s':>9} {'errors':>6}")
+    for r in results:
+        print(f"{r['sessions']:>8} {r['reruns_per_s']:>9} {r['p50_ms']!s:>7} {r['p95_ms']!s:>7} "
+              f"{r['p99_ms']!s:>7} {r['cpu_pct']:>6} {r['rss_mb']:>7} {r['backend_rps']:>9} {r['errors']:>6}")
+        for line in r["first_errors"]:
+            print(f"{r['sessions']:>8} ! {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test app.py with K concurrent browser sessions.")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="comma-separated session counts")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=10, help="seconds before measuring starts")
+    parser.add_argument("--think", type=float, default=2, help="mean seconds between an agent's actions")
+    parser.add_argument("--contacts", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=200, help="messages per contact")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per rerun")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    results = [run_level(int(k), args) for k in args.sessions.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
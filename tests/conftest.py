@@ -0,0 +1,59 @@
+"""
+app.py is a Streamlit script: importing it would render the whole dashboard.
+The `app` fixture instead runs only its definitions (imports, functions,
+classes, UPPER_CASE settings and the logger) into a namespace, so tests can call them
+directly. Streamlit runs in bare mode; caches and session state are cleared
+between tests.
+"""
+
+import ast
+import logging
+import sys
+import types
+from pathlib import Path
+
+import pytest
+import streamlit as st
+
+# Every st.* call outside a script run warns that it is in bare mode
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+
+
+def _is_definition(node) -> bool:
+    if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)):
+        return True
+    if isinstance(node, (ast.Assign, ast.AnnAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        return all(isinstance(t, ast.Name) and (t.id.isupper() or t.id == "logger") for t in targets)
+    return False
+
+
+@pytest.fixture(scope="session")
+def app_namespace(tmp_path_factory):
+    # The settings read st.secrets, which needs a secrets.toml in the working directory
+    workdir = tmp_path_factory.mktemp("app")
+    (workdir / ".streamlit").mkdir()
+    (workdir / ".streamlit" / "secrets.toml").write_text('dashboard_password = "test"\n')
+    mp = pytest.MonkeyPatch()
+    mp.chdir(workdir)
+
+    tree = ast.parse((ROOT / "app.py").read_text(encoding="utf-8"))
+    module = types.ModuleType("app")
+    module.__file__ = str(ROOT / "app.py")
+    body = ast.Module([node for node in tree.body if _is_definition(node)], type_ignores=[])
+    exec(compile(body, module.__file__, "exec"), module.__dict__)
+    yield module
+    mp.undo()
+
+
+@pytest.fixture
+def app(app_namespace, monkeypatch):
+    """The app's definitions, with settings patchable through monkeypatch.setattr(app, ...)."""
+    st.cache_resource.clear()
+    st.session_state.clear()
+    yield app_namespace
+    st.cache_resource.clear()
+    st.session_state.clear()
@@ -0,0 +1,45 @@
+from fake_backend import serve
+
+PHONE = "919000000000"
+
+
+def test_remembered_choice_is_dropped_after_repeated_errors(app):
+    shape = app.ApiShape()
+    shape.remember("conversation", "query")
+    for _ in range(app.API_SHAPE_RECHECK_ERRORS - 1):
+        shape.record_error("conversation")
+    shape.remember("conversation", "query")   # a success resets the count
+    for _ in range(app.API_SHAPE_RECHECK_ERRORS - 1):
+        shape.record_error("conversation")
+    assert shape.get("conversation") == "query"
+
+    shape.record_error("conversation")
+    assert shape.get("conversation") is None
+
+
+def test_missing_endpoint_is_tried_again_later(app, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(app.time_module, "time", lambda: clock[0])
+    shape = app.ApiShape()
+    shape.remember("contacts_summary", False)
+    assert shape.get("contacts_summary") is False
+
+    clock[0] += app.API_SHAPE_RECHECK_UNSUPPORTED + 1
+    assert shape.get("contacts_summary") is None
+
+
+def test_conversation_endpoint_is_probed_once_per_process(app, monkeypatch):
+    with serve(contacts=1, messages=5) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        assert len(app._load_conversation(PHONE, 2, 0)) == 2
+        assert app.get_api_shape().get("conversation") == "path"
+        assert servers.backend.stats()["requests"] == {"GET /conversation/{phone}": 1}
+
+
+def test_remembered_conversation_shape_is_used_without_probing(app, monkeypatch):
+    with serve(contacts=1, messages=5) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        app.get_api_shape().remember("conversation", "query")
+        for offset in range(3):
+            assert len(app._load_conversation(PHONE, 2, offset)) == 2
+        assert servers.backend.stats()["requests"] == {"GET /conversation": 3}
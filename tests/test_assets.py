@@ -0,0 +1,36 @@
+import base64
+import io
+import re
+from pathlib import Path
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_minified_css_only_drops_comments_and_whitespace(app):
+    raw = app.get_css()
+    css = app.minify_css(raw)
+
+    assert "<style>" not in css and "/*" not in css and "\n" not in css
+    assert len(css) < len(raw)
+    without_comments = re.sub(r"/\*.*?\*/", "", re.sub(r"</?style>", "", raw), flags=re.DOTALL)
+    assert re.sub(r"\s", "", without_comments) == re.sub(r"\s", "", css)
+    assert "border-bottom:1px solid var(--ami-border)" in css   # spaces inside values stay
+    assert app.minify_css(css) == css
+
+
+def test_assets_are_built_once_with_a_content_version(app):
+    assets = app.load_static_assets()
+    assert app.load_static_assets() is assets
+    assert assets["css"] == app.minify_css(app.get_css())
+    assert re.fullmatch(r"[0-9a-f]{12}", assets["version"])
+    assert assets["sizes"]["css"] < assets["sizes"]["css_raw"]
+
+
+def test_logo_is_shrunk_to_a_square_for_the_header(app):
+    original = (ROOT / "Logo.png").read_bytes()
+    small = app._resize_logo(original)
+    with Image.open(io.BytesIO(small)) as img:
+        assert img.size == (app.LOGO_DISPLAY_SIZE, app.LOGO_DISPLAY_SIZE)
+    assert len(base64.b64encode(small)) < len(base64.b64encode(original))
@@ -0,0 +1,32 @@
+import pytest
+
+from fake_backend import OPTIONAL_FEATURES, serve
+
+
+@pytest.mark.parametrize("features", [OPTIONAL_FEATURES, ()], ids=["bulk", "per-phone"])
+def test_flags_match_the_backend(app, monkeypatch, features):
+    with serve(contacts=10, messages=5, features=features, include_automation=False) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        phones = [c["phone"] for c in servers.backend.data.contacts]
+
+        assert app.fetch_automation_flags(phones) == {p: servers.backend.data.automation[p] for p in phones}
+
+
+def test_bulk_flags_cost_one_request_and_stay_fresh(app, monkeypatch):
+    with serve(contacts=10, messages=5, include_automation=False) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        phones = [c["phone"] for c in servers.backend.data.contacts]
+
+        app.fetch_automation_flags(phones)
+        app.fetch_automation_flags(phones)
+        assert servers.backend.stats()["requests"] == {"GET /automation": 1}
+
+
+def test_a_refused_update_puts_the_old_flag_back(app, monkeypatch):
+    with serve(contacts=1, messages=5, error_rate=1.0) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        phone = servers.backend.data.contacts[0]["phone"]
+        app.get_automation_flags().put(phone, True)
+
+        assert app.set_automation_status(phone, False) is False
+        assert app.fetch_automation_status(phone) is True
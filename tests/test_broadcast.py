@@ -0,0 +1,59 @@
+import time
+
+from fake_backend import serve
+
+
+def test_broadcast_queues_one_row_per_distinct_phone(app, tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.db"))
+    run_id = outbox.start_broadcast(["911", "912", "911", "", "913"], "Hi {{name}}", "template", "promo", "All")
+
+    [run] = outbox.broadcasts()
+    assert run["id"] == run_id and run["total"] == 3
+    assert run["counts"] == {"queued": 3}
+    assert [r["phone"] for r in outbox.broadcast_recipients(run_id)] == ["911", "912", "913"]
+    assert app._broadcast_active(run)
+
+
+def test_agent_replies_are_sent_before_broadcast_rows(app, tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.db"))
+    outbox.start_broadcast(["911", "912"], "promo", "template", "promo", "All")
+    key = outbox.enqueue("913", "reply to a client")
+
+    assert outbox.claim_send()["idempotency_key"] == key
+    assert outbox.claim_send()["broadcast_id"] is not None
+
+
+def test_paused_run_holds_back_unclaimed_rows(app, tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.db"))
+    run_id = outbox.start_broadcast(["911", "912", "913"], "promo", "template", "promo", "All")
+    outbox.claim_send()
+
+    assert outbox.set_broadcast_paused(run_id, True) == 2
+    assert outbox.claim_send() is None
+    assert outbox.broadcasts()[0]["counts"] == {"sending": 1, "paused": 2}
+
+    assert outbox.set_broadcast_paused(run_id, False) == 2
+    assert outbox.claim_send() is not None
+
+
+def test_worker_delivers_and_logs_a_run_once_per_recipient(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "BROADCAST_RATE", 100.0)
+    monkeypatch.setattr(app, "BROADCAST_BURST", 100)
+    monkeypatch.setattr(app, "OUTBOX_POLL_INTERVAL", 0.05)
+    with serve(contacts=20, messages=1) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        monkeypatch.setattr(app, "MAKE_WEBHOOK_URL", servers.webhook_url)
+        phones = [c["phone"] for c in servers.backend.data.contacts]
+        outbox = app.Outbox(str(tmp_path / "outbox.db"))
+        run_id = outbox.start_broadcast(phones, "promo", "template", "promo", "All")
+
+        app.OutboxWorker(outbox).start()
+        deadline = time.monotonic() + 20
+        while app._broadcast_active(outbox.broadcasts()[0]) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        assert outbox.broadcasts()[0]["counts"] == {"logged": len(phones)}
+        stats = servers.backend.stats()
+        assert stats["requests"]["POST make-webhook"] == len(phones)
+        assert stats["webhook_duplicates"] == 0
+        assert {r["phone"] for r in outbox.broadcast_recipients(run_id)} == set(phones)
@@ -0,0 +1,266 @@
+import json
+import threading
+import time
+
+import pytest
+
+from fake_backend import Dataset, serve
+
+PHONE = "919000000000"
+
+
+class FakeRedis:
+    """In-memory stand-in for a Redis server, speaking the redis-py calls RedisCacheBackend uses."""
+
+    def __init__(self):
+        self.values = {}    # key -> (bytes, expires_at or None)
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def mget(self, keys):
+        with self.lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.values[key] = (str(value).encode(), time.time() + ex if ex else None)
+        return True
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self._get(key) or 0) + 1
+            self.values[key] = (str(value).encode(), None)
+            return value
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value, ex))
+
+    def execute(self):
+        return [self.client.set(*command) for command in self.commands]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def worker_backends(request, app, tmp_path):
+    """Two cache backends as two worker processes would open them (one shared store)."""
+    if request.param == "memory":
+        backend = app.MemoryCacheBackend()
+        return backend, backend
+    if request.param == "sqlite":
+        path = str(tmp_path / "cache.sqlite3")
+        return app.SqliteCacheBackend(path), app.SqliteCacheBackend(path)
+    server = FakeRedis()
+    return app.make_cache_backend("redis", client=server), app.make_cache_backend("redis", client=server)
+
+
+def test_backend_values_expire_and_counters_count(app, worker_backends):
+    first, second = worker_backends
+    first.set("a", "1", 60)
+    first.set_many({"b": "2", "c": "3"}, 60)
+    first.set("gone", "x", 0.01)
+    time.sleep(1.1)   # Redis expiry is in whole seconds
+    assert second.get_many(["a", "b", "c", "gone", "missing"]) == ["1", "2", "3", None, None]
+    assert [first.incr("n"), second.incr("n"), first.incr("n")] == [1, 2, 3]
+
+
+def test_invalidation_in_one_worker_reaches_the_other(app, worker_backends):
+    first, second = (app.TTLCache({"conversation": 60}, backend) for backend in worker_backends)
+    loads = []
+
+    def loader(value):
+        return lambda: loads.append(value) or value
+
+    first.get_or_load("conversation", {"phone": "1"}, loader("a"), codec=app.JSON_CODEC)
+    first.get_or_load("conversation", {"phone": "2"}, loader("b"), codec=app.JSON_CODEC)
+    second.get_or_load("conversation", {"phone": "1"}, loader("c"), codec=app.JSON_CODEC)
+
+    second.invalidate("conversation", phone="1")
+    assert first.get_or_load("conversation", {"phone": "1"}, loader("d"), codec=app.JSON_CODEC) == "d"
+    assert first.get_or_load("conversation", {"phone": "2"}, loader("e"), codec=app.JSON_CODEC) == "b"
+
+    second.invalidate("conversation")
+    assert first.get_or_load("conversation", {"phone": "2"}, loader("f"), codec=app.JSON_CODEC) == "f"
+
+    if worker_backends[0].shared:
+        # The second worker took the first one's value from the shared store
+        assert loads == ["a", "b", "d", "f"]
+    else:
+        assert loads == ["a", "b", "c", "d", "f"]
+
+
+def test_expired_entries_are_swept(app, monkeypatch):
+    monkeypatch.setattr(app, "CACHE_SWEEP_INTERVAL", 0)
+    monkeypatch.setattr(app, "CACHE_MAX_ENTRIES", 50)
+    cache = app.TTLCache({"conversation_poll": 0.05, "contacts": 60, "conversation": 60}, app.MemoryCacheBackend())
+    cache.get_or_load("contacts", {}, lambda: "kept")
+    for since_id in range(20):
+        cache.get_or_load("conversation_poll", {"phone": "1", "since_id": since_id}, lambda: [])
+    time.sleep(0.1)
+    cache.get_or_load("conversation_poll", {"phone": "1", "since_id": 20}, lambda: [])
+    assert len(cache.entries) == 2
+
+    for since_id in range(100):
+        cache.get_or_load("conversation", {"phone": "1", "query": since_id}, lambda: [])
+    assert len(cache.entries) == 50
+
+
+def test_stopped_leader_does_not_abort_waiting_sessions(app):
+    class StopRun(BaseException):
+        """Stands in for the StopException raised when a session's script run is stopped."""
+
+    cache = app.TTLCache({"contacts": 60}, app.MemoryCacheBackend())
+    release = threading.Event()
+
+    def stopped_load():
+        release.wait(5)
+        raise StopRun()
+
+    def leader():
+        with pytest.raises(StopRun):
+            cache.get_or_load("contacts", {}, stopped_load)
+
+    results = []
+    threads = [threading.Thread(target=leader),
+               threading.Thread(target=lambda: results.append(cache.get_or_load("contacts", {}, lambda: "own")))]
+    threads[0].start()
+    while not cache.inflight:
+        time.sleep(0.01)
+    threads[1].start()
+    while not cache.coalesced:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["own"]
+    assert cache.get_or_load("contacts", {}, lambda: "reloaded") == "own"
+
+
+def test_loader_errors_reach_waiting_sessions(app):
+    cache = app.TTLCache({"contacts": 60}, app.MemoryCacheBackend())
+    release = threading.Event()
+
+    def failing_load():
+        release.wait(5)
+        raise ValueError("backend down")
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_load("contacts", {}, failing_load)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    threads[0].start()
+    while not cache.inflight:
+        time.sleep(0.01)
+    threads[1].start()
+    while not cache.coalesced:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["backend down", "backend down"]
+
+
+def test_codecs_round_trip_through_json(app):
+    raw = Dataset(contacts=1, messages=30, follow_up_rate=0.5).conversations[PHONE][::-1]
+    messages = app.to_messages(raw)
+    encode, decode = app.MESSAGES_CODEC
+    assert decode(json.loads(json.dumps(encode(messages)))) == messages
+
+
+def test_contacts_and_flags_are_shared_between_workers(app, tmp_path, monkeypatch):
+    server = FakeRedis()
+    with serve(contacts=5, messages=10) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        monkeypatch.setattr(app, "get_cache_backend", lambda: app.make_cache_backend("redis", client=server))
+        first = app.fetch_contacts(False)
+        assert app.set_automation_status(PHONE, False)
+
+        # A second worker process: fresh process-wide caches, same Redis server
+        app.st.cache_resource.clear()
+        before = servers.backend.stats()["total"]
+        second = app.fetch_contacts(False)
+        assert second.contacts == first.contacts
+        assert app.fetch_automation_status(PHONE) is False
+        assert servers.backend.stats()["total"] == before
+
+
+def test_token_bucket_rate_is_shared_by_workers(app, tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    buckets = [app.TokenBucket(path, "webhook", rate=20, capacity=1) for _ in range(2)]
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda b=b: [b.acquire() for _ in range(5)]) for b in buckets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One token up front, nine more at 20 per second between both workers
+    assert time.monotonic() - started >= 0.4
+
+
+class UnreachableRedis:
+    """Redis-protocol client whose server is down."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            self.calls += 1
+            raise ConnectionError("Connection refused")
+        return fail
+
+
+@pytest.fixture
+def unreachable(app, monkeypatch):
+    client = UnreachableRedis()
+    backend = app.make_cache_backend("redis", client=client)
+    monkeypatch.setattr(app, "get_cache_backend", lambda: backend)
+    return client
+
+
+def test_unreachable_shared_cache_degrades_to_memory(app, monkeypatch, unreachable):
+    with serve(contacts=3, messages=20) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        contacts = app.fetch_contacts(False)
+        assert {c["phone"] for c in contacts.contacts} == set(servers.backend.data.automation)
+
+        flags = app.fetch_automation_flags(list(servers.backend.data.automation))
+        assert flags == servers.backend.data.automation
+
+        msg_id = servers.backend.data.conversations[PHONE][-1]["id"]
+        assert app.update_follow_up(PHONE, msg_id, True, "call back", "agent")
+        assert app.delete_conversation(PHONE)
+
+        # Flags written while the shared cache is down are read back from memory
+        assert app.set_automation_status(PHONE, False)
+        assert app.fetch_automation_status(PHONE) is False
+
+    # The server is tried once, then bypassed until CACHE_RETRY_INTERVAL has passed
+    assert unreachable.calls == 1
+
+
+def test_automation_flags_are_written_in_one_batch(app, monkeypatch):
+    backend = app.MemoryCacheBackend()
+    batches = []
+    monkeypatch.setattr(backend, "set_many", lambda values, ttl: batches.append(len(values)))
+    app.AutomationFlags(backend).put_many({f"91{i}": True for i in range(300)})
+    assert batches == [300]
@@ -0,0 +1,46 @@
+import pytest
+
+from fake_backend import Dataset
+
+
+def brute_force(contacts, query="", phone_query="", name_query=""):
+    def has(value, q):
+        return q.strip().lower() in str(value or "").lower()
+
+    return [
+        c for c in contacts
+        if has(c.get("phone"), phone_query) and has(c.get("client_name"), name_query)
+        and (has(c.get("client_name"), query) or has(c.get("phone"), query))
+    ]
+
+
+@pytest.fixture
+def contacts():
+    rows = Dataset(contacts=200, messages=0).contacts
+    rows += [
+        {"phone": "911234512345", "client_name": "Abc Bcd"},   # shares every trigram of "abcd"
+        {"phone": "919999999999", "client_name": None},
+        {"phone": "", "client_name": "No Phone"},
+    ]
+    return rows
+
+
+@pytest.mark.parametrize("kwargs", [
+    {}, {"query": "a"}, {"query": "ar"}, {"query": "SHARMA"}, {"query": "  rao "},
+    {"query": "abcd"}, {"query": "bc b"}, {"query": "90000001"}, {"query": "12345"},
+    {"phone_query": "9000"}, {"name_query": "iyer"}, {"name_query": "meera", "phone_query": "1"},
+    {"query": "a", "name_query": "khan"}, {"query": "zzz"},
+], ids=repr)
+def test_search_matches_a_plain_substring_scan(app, contacts, kwargs):
+    store = app.ContactStore(contacts)
+    expected = brute_force(store.contacts, **kwargs)
+    assert store.search(**kwargs) == expected
+
+
+def test_contacts_are_sorted_by_name_and_looked_up_by_phone(app, contacts):
+    store = app.ContactStore(contacts)
+    keys = [(str(c.get("client_name") or "").lower(), c["phone"]) for c in store.contacts]
+    assert keys == sorted(keys)
+    assert len(store) == len(contacts)
+    assert store.get("911234512345")["client_name"] == "Abc Bcd"
+    assert store.get("910000000000") is None
@@ -0,0 +1,35 @@
+import time
+
+
+def test_deadline_is_counted_from_each_call(app, monkeypatch):
+    monkeypatch.setattr(app, "FANOUT_DEADLINE", 0.5)
+    assert app.run_concurrently(lambda x: x * 2, [1, 2, 3]) == [2, 4, 6]
+    time.sleep(0.6)   # a later fragment rerun, past the first call's deadline
+    assert app.run_concurrently(lambda x: x * 2, [1, 2, 3]) == [2, 4, 6]
+
+
+def test_calls_past_the_deadline_get_the_default(app, monkeypatch):
+    monkeypatch.setattr(app, "FANOUT_DEADLINE", 0.2)
+
+    def slow(x):
+        if x == 2:
+            time.sleep(1)
+        return x
+
+    assert app.run_concurrently(slow, [1, 2, 3], default="late") == [1, "late", 3]
+
+
+def test_results_keep_item_order_and_failures_get_the_default(app):
+    def load(x):
+        if x == 3:
+            raise ValueError("backend said no")
+        time.sleep(0.05 * (5 - x))   # finish in reverse order
+        return x * 10
+
+    assert app.run_concurrently(load, [1, 2, 3, 4], default=None) == [10, 20, None, 40]
+
+
+def test_calls_run_in_parallel(app):
+    started = time.monotonic()
+    app.run_concurrently(lambda x: time.sleep(0.3), range(app.FANOUT_WORKERS))
+    assert time.monotonic() - started < 0.3 * 2
@@ -0,0 +1,65 @@
+from datetime import datetime, time
+
+import pytest
+
+from fake_backend import OPTIONAL_FEATURES, serve
+
+PHONE = "919000000000"
+
+
+def expected_ids(app, servers, query):
+    """Ids of the matching messages, newest first, from the fake backend's raw data."""
+    ids = []
+    for m in reversed(servers.backend.data.conversations[PHONE]):
+        dt = datetime.fromisoformat(m["timestamp"]).astimezone(app.IST)
+        if query.day and dt.date() != query.day:
+            continue
+        if query.time_from and not (query.time_from <= dt.time() <= query.time_to):
+            continue
+        ids.append(m["id"])
+    return ids
+
+
+def day_of_message(app, servers, newest_index: int):
+    conv = servers.backend.data.conversations[PHONE]
+    return datetime.fromisoformat(conv[-1 - newest_index]["timestamp"]).astimezone(app.IST).date()
+
+
+@pytest.mark.parametrize("features", [OPTIONAL_FEATURES, ()], ids=["pushdown", "scan"])
+@pytest.mark.parametrize("window", [None, (time(9, 0), time(18, 0))], ids=["day", "day+time"])
+def test_filter_returns_every_matching_message(app, monkeypatch, features, window):
+    with serve(contacts=1, messages=500, features=features) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        query = app.ConversationQuery(day_of_message(app, servers, 120), *(window or (None, None)))
+
+        results = app.query_conversation(PHONE, query)
+
+        assert [m.id for m in results] == expected_ids(app, servers, query)
+        assert results
+
+
+def test_filter_pushdown_takes_one_request(app, monkeypatch):
+    with serve(contacts=1, messages=500) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        app.query_conversation(PHONE, app.ConversationQuery(day_of_message(app, servers, 300)))
+
+        assert servers.backend.stats()["total"] == 1
+        assert app.get_api_shape().get("conversation_filters") is True
+
+
+def test_scan_stops_once_past_the_requested_day(app, monkeypatch):
+    with serve(contacts=1, messages=500, features=()) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        app.query_conversation(PHONE, app.ConversationQuery(day_of_message(app, servers, 120)))
+
+        # 500 messages are 5 pages; the day ends within the second or third
+        assert servers.backend.stats()["total"] <= 3
+        assert app.get_api_shape().get("conversation_filters") is False
+
+
+def test_time_window_without_a_day_is_capped(app, monkeypatch):
+    monkeypatch.setattr(app, "FILTER_MAX_RESULTS", 50)
+    with serve(contacts=1, messages=500) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        query = app.ConversationQuery(None, time(0, 0), time(23, 59, 59))
+        assert [m.id for m in app.query_conversation(PHONE, query)] == expected_ids(app, servers, query)[:50]
@@ -0,0 +1,25 @@
+import pytest
+
+from fake_backend import OPTIONAL_FEATURES, serve
+
+
+@pytest.mark.parametrize("features", [OPTIONAL_FEATURES, ()], ids=["counts", "legacy"])
+def test_overview_counts_clients_needing_follow_up(app, monkeypatch, features):
+    with serve(contacts=12, messages=10, features=features) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        backend = servers.backend
+        open_counts = {c["phone"]: backend._follow_up_count(c["phone"]) for c in backend.data.contacts}
+
+        clients, messages = app.follow_up_overview(app.fetch_contacts(False))
+
+        assert clients == sum(1 for n in open_counts.values() if n > 0)
+        assert messages == (sum(open_counts.values()) if features else None)
+
+
+def test_missing_counts_endpoint_is_only_asked_for_once(app, monkeypatch):
+    with serve(contacts=3, messages=10, features=()) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+
+        assert app.fetch_follow_up_counts() is None
+        assert app.fetch_follow_up_counts() is None
+        assert servers.backend.stats()["requests"] == {"GET /follow_up/counts": 1}
@@ -0,0 +1,61 @@
+import pytest
+import requests
+
+from fake_backend import serve
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once(app, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(app.time_module, "monotonic", lambda: clock[0])
+    breaker = app.CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow()                 # the single probe
+    assert breaker.state == "half-open" and not breaker.allow()
+    breaker.record_failure()               # failed probe: open for another reset_timeout
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_retryable_statuses_are_retried_up_to_max_attempts(app):
+    policy = app.RetryPolicy(max_attempts=3, backoff_base=0)
+    with serve(contacts=1, messages=1, error_rate=1.0) as servers:
+        with pytest.raises(requests.exceptions.HTTPError):
+            app.make_request_with_retry(f"{servers.api_url}/contacts", policy=policy)
+        assert servers.backend.stats()["requests"] == {"GET /contacts": 3}
+
+
+def test_other_client_errors_are_not_retried(app):
+    policy = app.RetryPolicy(max_attempts=3, backoff_base=0)
+    with serve(contacts=1, messages=1) as servers:
+        with pytest.raises(requests.exceptions.HTTPError):
+            app.make_request_with_retry(f"{servers.api_url}/no_such_endpoint", policy=policy)
+        assert servers.backend.stats()["requests"] == {"GET /no_such_endpoint": 1}
+
+
+def test_open_circuit_fails_fast_without_sending(app):
+    policy = app.RetryPolicy(max_attempts=1, backoff_base=0)
+    with serve(contacts=1, messages=1, error_rate=1.0) as servers:
+        url = f"{servers.api_url}/contacts"
+        for _ in range(app.BREAKER_FAILURE_THRESHOLD):
+            with pytest.raises(requests.exceptions.HTTPError):
+                app.make_request_with_retry(url, policy=policy)
+
+        with pytest.raises(app.CircuitOpenError):
+            app.make_request_with_retry(url, policy=policy)
+        assert servers.backend.stats()["requests"] == {"GET /contacts": app.BREAKER_FAILURE_THRESHOLD}
+        assert app.breaker_for(url).state == "open"
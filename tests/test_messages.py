@@ -0,0 +1,41 @@
+from datetime import date
+
+PHONE = "919000000000"
+
+
+def raw(**fields):
+    return {"id": 1, "phone": PHONE, "message": "hello", "direction": "incoming",
+            "timestamp": "2026-03-01T20:00:00Z", **fields}
+
+
+def test_timestamps_are_parsed_once_into_ist(app):
+    msg = app.to_message(raw(timestamp="2026-03-01T20:00:00Z"))
+    assert msg.dt.utcoffset().total_seconds() == 5.5 * 3600
+    assert (msg.dt.hour, msg.dt.minute) == (1, 30)
+    assert msg.day == date(2026, 3, 2)            # the IST day, past midnight
+    assert msg.timestamp == "2026-03-01T20:00:00Z"   # kept verbatim for since= polls
+
+    naive = app.to_message(raw(timestamp="2026-03-01T20:00:00"))
+    assert naive.dt == msg.dt                     # naive timestamps are UTC
+    offset = app.to_message(raw(timestamp="2026-03-02T01:30:00+05:30"))
+    assert offset.dt == msg.dt
+
+
+def test_fields_are_normalised(app):
+    msg = app.to_message({"id": 7, "phone": 919000000000, "direction": "outgoing",
+                          "timestamp": "2026-03-01T20:00:00Z", "message": None, "notes": None})
+    assert msg.phone == PHONE and msg.text == "" and msg.notes == "" and msg.handled_by == ""
+    assert msg.direction == app.Direction.BOT and not msg.follow_up_needed
+    assert app.to_message(raw(direction="user")).direction == app.Direction.USER
+
+
+def test_records_round_trip_through_the_backend_json(app):
+    msg = app.to_message(raw(follow_up_needed=True, notes="call back", handled_by="Agent 1"))
+    assert app.to_message(app.message_to_raw(msg)) == msg
+
+
+def test_sort_key_orders_by_time_then_id(app):
+    same_time = [app.to_message(raw(id=i)) for i in (3, 1, 2)]
+    later = app.to_message(raw(id=0, timestamp="2026-03-01T20:00:01Z"))
+    ordered = sorted(same_time + [later], key=lambda m: m.sort_key)
+    assert [m.id for m in ordered] == [1, 2, 3, 0]
@@ -0,0 +1,92 @@
+import pytest
+
+from fake_backend import serve
+
+PHONE = "919000000000"
+
+
+def due(outbox):
+    """Make every backed-off row claimable right away."""
+    outbox._update("UPDATE outbox SET next_attempt_at = 0")
+
+
+def row(outbox, key):
+    return outbox._query("SELECT * FROM outbox WHERE idempotency_key = ?", (key,))[0]
+
+
+def test_log_retries_do_not_use_up_send_attempts(app, tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.db"))
+    key = outbox.enqueue(PHONE, "hello")
+
+    # Delivered on the last webhook attempt
+    for _ in range(app.OUTBOX_MAX_ATTEMPTS - 1):
+        outbox.retry_later(outbox.claim_send(), "webhook down", "failed")
+        due(outbox)
+    outbox.claim_send()
+    outbox.mark(key, "sent")
+
+    # Logging still gets its own full set of attempts
+    for _ in range(app.OUTBOX_MAX_ATTEMPTS - 1):
+        [job] = outbox.claim_logs(10)
+        outbox.retry_later(job, "backend down", "log_failed")
+        assert row(outbox, key)["status"] == "sent"
+        due(outbox)
+    [job] = outbox.claim_logs(10)
+    outbox.retry_later(job, "backend down", "log_failed")
+
+    final = row(outbox, key)
+    assert final["status"] == "log_failed"
+    assert final["attempts"] == app.OUTBOX_MAX_ATTEMPTS - 1
+    assert final["log_attempts"] == app.OUTBOX_MAX_ATTEMPTS
+
+
+def test_existing_outbox_gains_log_attempts(app, tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = app.Outbox(path)
+    with outbox._connect() as db:
+        db.execute("ALTER TABLE outbox DROP COLUMN log_attempts")
+    key = outbox.enqueue(PHONE, "hello")
+
+    reopened = app.Outbox(path)
+    assert row(reopened, key)["log_attempts"] == 0
+
+
+def test_webhook_post_is_sent_once_per_outbox_attempt(app, monkeypatch):
+    with serve(contacts=1, messages=1, error_rate=1.0) as servers:
+        monkeypatch.setattr(app, "MAKE_WEBHOOK_URL", servers.webhook_url)
+        with pytest.raises(Exception):
+            app.post_to_webhook(PHONE, "hello", "text", None, "key-1")
+        assert servers.backend.stats()["requests"] == {"POST make-webhook": 1}
+
+
+def test_expired_claim_is_reclaimed_by_one_process_only(app, tmp_path, monkeypatch):
+    path = str(tmp_path / "outbox.db")
+    first, second = app.Outbox(path), app.Outbox(path)
+    key = first.enqueue(PHONE, "hello")
+    first.claim_send()
+    first._update("UPDATE outbox SET claimed_at = claimed_at - ?", (app.OUTBOX_LEASE + 1,))
+
+    # Both processes read the expired row before either updates it
+    seen = second._query("SELECT * FROM outbox")
+    assert first.claim_send()["idempotency_key"] == key
+    monkeypatch.setattr(second, "_query", lambda sql, params=(): seen)
+    assert second.claim_send() is None
+
+
+def test_sent_but_unlogged_messages_stay_in_the_chat(app, tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.db"))
+    key = outbox.enqueue(PHONE, "hello")
+    outbox.claim_send()
+    outbox.mark(key, "sent")
+    for _ in range(app.OUTBOX_MAX_ATTEMPTS):
+        [job] = outbox.claim_logs(10)
+        outbox.retry_later(job, "backend down", "log_failed")
+        due(outbox)
+
+    assert [r["status"] for r in outbox.pending_for(PHONE)] == ["log_failed"]
+
+    assert outbox.requeue_log_failed(PHONE) == 1
+    [job] = outbox.claim_logs(10)
+    assert job["log_attempts"] == 0
+    outbox.mark(key, "logged")
+    assert outbox.pending_for(PHONE) == []
@@ -0,0 +1,63 @@
+from concurrent.futures import wait
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_backend import OPTIONAL_FEATURES, serve
+
+PHONE = "919000000000"
+
+
+def messages(app, ids, ts_of=lambda i: datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i // 3)):
+    """Newest-first Message records; every three ids share a timestamp."""
+    raw = [{"id": i, "phone": PHONE, "message": f"m{i}", "direction": "incoming",
+            "timestamp": ts_of(i).isoformat()} for i in ids]
+    return sorted(app.to_messages(raw), key=lambda m: m.sort_key, reverse=True)
+
+
+def walk(app, conv, n):
+    pages, cursor = [], None
+    while True:
+        page, newer, has_older = app.keyset_page(conv, cursor, n)
+        assert newer == sum(len(p) for p in pages)
+        pages.append(page)
+        if not has_older:
+            return pages
+        cursor = page[-1].sort_key
+
+
+def test_pages_cover_every_message_once_despite_equal_timestamps(app):
+    conv = messages(app, range(1, 101))
+    pages = walk(app, conv, 7)
+    assert [m.id for page in pages for m in page] == [m.id for m in conv]
+    assert all(len(page) == 7 for page in pages[:-1])
+
+
+def test_new_messages_do_not_shift_older_pages(app):
+    conv = messages(app, range(1, 101))
+    first, _, _ = app.keyset_page(conv, None, 20)
+
+    conv = messages(app, range(1, 111))   # ten newer messages arrive between page loads
+    second, newer, _ = app.keyset_page(conv, first[-1].sort_key, 20)
+
+    assert [m.id for m in second] == list(range(80, 60, -1))
+    assert newer == 30
+
+
+@pytest.mark.parametrize("features", [OPTIONAL_FEATURES, ()], ids=["keyset", "offset"])
+def test_finished_prefetch_is_used_without_another_request(app, monkeypatch, features):
+    with serve(contacts=1, messages=200, features=features) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        store = app.sync_conversation(PHONE, 50)
+        page, _, _ = app.keyset_page(store.latest(), None, 50)
+
+        app.prefetch_older(store, PHONE, page[-1].sort_key, 50)
+        wait([store.prefetch[1]])
+        before = servers.backend.stats()["total"]
+
+        app.ensure_older(store, PHONE, page[-1].sort_key, 50)
+        older, newer, _ = app.keyset_page(store.latest(), page[-1].sort_key, 50)
+
+        assert servers.backend.stats()["total"] == before
+        assert newer == 50
+        assert [m.id for m in older] == list(range(150, 100, -1))
@@ -0,0 +1,44 @@
+def test_phases_record_time_and_the_requests_made_inside_them(app):
+    app.start_rerun_profile()
+    with app.phase("contacts"):
+        app.st.session_state.http_rerun["requests"] += 2
+        app.st.session_state.http_rerun["bytes"] += 512
+    with app.phase("chat"):
+        pass
+
+    phases = app.st.session_state.phase_run["phases"]
+    assert list(phases) == ["contacts", "chat"]
+    assert (phases["contacts"]["requests"], phases["contacts"]["bytes"]) == (2, 512)
+    assert phases["chat"]["requests"] == 0 and phases["chat"]["seconds"] >= 0
+
+
+def test_a_repeated_phase_is_a_fragment_rerun(app):
+    app.start_rerun_profile()
+    with app.phase("chat"):
+        pass
+    with app.phase("chat"):   # the chat fragment rerunning on its own
+        pass
+
+    state = app.st.session_state
+    assert [run["fragment"] for run in state.phase_runs] == [False]
+    assert state.phase_run["fragment"] is True and list(state.phase_run["phases"]) == ["chat"]
+
+
+def test_phases_outside_a_profiled_rerun_are_not_recorded(app):
+    with app.phase("contacts"):
+        pass
+    assert "phase_run" not in app.st.session_state
+
+
+def test_cprofile_capture_is_opt_in_and_one_rerun_long(app, monkeypatch):
+    monkeypatch.setattr(app, "DEBUG_PANEL", True)
+    app.start_rerun_profile()
+    app.finish_cprofile()
+    assert "cprofile_report" not in app.st.session_state
+
+    app.st.session_state.cprofile_next = True
+    app.start_rerun_profile()
+    sorted(range(1000))
+    app.finish_cprofile()
+    assert "function calls" in app.st.session_state.cprofile_report
+    assert "cprofile_active" not in app.st.session_state and "cprofile_next" not in app.st.session_state
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+PHONE = "919000000000"
+
+
+def message(app, i, text, ts, **fields):
+    return app.to_message({"id": i, "phone": PHONE, "message": text, "direction": "incoming",
+                           "timestamp": ts.isoformat(), **fields})
+
+
+def test_conversation_is_one_payload_with_a_separator_per_day(app):
+    now = datetime.now(app.IST).replace(hour=12)
+    conv = [
+        message(app, 1, "first", now - timedelta(days=3)),
+        message(app, 2, "second", now - timedelta(days=1)),
+        message(app, 3, "third", now - timedelta(days=1, minutes=-5)),
+        message(app, 4, "fourth", now),
+    ]
+    html = app.render_conversation_html(conv, "")
+    assert html.count('class="message-bubble') == 4
+    assert html.count("text-align: center") == 3
+    assert "Yesterday" in html and "Today" in html
+    assert (now - timedelta(days=3)).strftime("%B %d, %Y") in html
+    assert html.index("first") < html.index("second") < html.index("fourth")
+
+
+def test_message_content_is_escaped_and_search_is_highlighted(app):
+    now = datetime.now(app.IST)
+    conv = [message(app, 1, "<script>alert(1)</script> Tom & Jerry", now,
+                    notes="<b>vip</b>", handled_by="Agent <1>")]
+    html = app.render_conversation_html(conv, "jerry")
+    assert "<script>" not in html and "&lt;script&gt;" in html
+    assert "&lt;b&gt;vip&lt;/b&gt;" in html and "Agent &lt;1&gt;" in html
+    assert ">Jerry</span>" in html
+    assert "Tom &amp; " in html
+
+
+def test_outbox_bubbles_carry_their_status_icon(app):
+    pending = app.replace(message(app, None, "on its way", datetime.now(app.IST)), status="failed")
+    html = app.render_conversation_html([pending], "")
+    icon, title = app.OUTBOX_STATUS_ICONS["failed"]
+    assert icon in html and title in html
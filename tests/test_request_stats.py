@@ -0,0 +1,40 @@
+import pytest
+import requests
+
+from fake_backend import serve
+
+
+def trace(status=200, attempts=1, size=100, error=None):
+    return {"status": status, "attempts": attempts, "bytes": size, "error": error}
+
+
+def test_urls_group_under_their_endpoint(app, monkeypatch):
+    monkeypatch.setattr(app, "API_BASE", "http://api.test")
+    assert app.endpoint_template("http://api.test/conversation/+919876543210?limit=50") == "/conversation/{phone}"
+    assert app.endpoint_template("http://api.test/message/42") == "/message/{id}"
+    assert app.endpoint_template("https://other.test/automation/919876543210") == "other.test/automation/{phone}"
+
+
+def test_snapshot_aggregates_outcomes_and_latency(app):
+    stats = app.RequestStats()
+    for seconds in (0.01, 0.02, 0.03, 0.2):
+        stats.record("GET", "/contacts", trace(), seconds)
+    stats.record("GET", "/contacts", trace(status=503, attempts=3), 4.0)
+
+    [row] = stats.snapshot()
+    assert row["endpoint"] == "GET /contacts"
+    assert (row["calls"], row["errors"], row["retries"]) == (5, 1, 2)
+    assert row["p50 ms"] == "≤50" and row["p95 ms"] == "≤5000"
+    assert row["statuses"] == "200×4, 503×1"
+    assert sum(stats.histogram("GET /contacts")["calls"]) == 5
+
+
+def test_real_requests_are_recorded_with_their_retries(app):
+    policy = app.RetryPolicy(max_attempts=2, backoff_base=0)
+    with serve(contacts=2, messages=1, error_rate=1.0) as servers:
+        with pytest.raises(requests.exceptions.HTTPError):
+            app.make_request_with_retry(f"{servers.api_url}/contacts", policy=policy)
+
+    [row] = [r for r in app.get_request_stats().snapshot() if r["endpoint"].endswith("/contacts")]
+    assert (row["calls"], row["errors"], row["retries"]) == (1, 1, 1)
+    assert row["statuses"] == "503×1"
@@ -0,0 +1,24 @@
+from urllib3.connectionpool import HTTPConnectionPool
+
+from fake_backend import serve
+
+
+def test_backend_and_webhook_use_their_own_shared_sessions(app, monkeypatch):
+    monkeypatch.setattr(app, "MAKE_WEBHOOK_URL", "https://hook.make.test/abc")
+    backend = app.session_for("https://api.test/contacts")
+
+    assert app.session_for("https://api.test/conversation/1") is backend
+    assert app.session_for("https://hook.make.test/abc") is not backend
+    assert backend.get_adapter("https://api.test").poolmanager.connection_pool_kw["maxsize"] == app.HTTP_POOL_SIZE
+
+
+def test_sequential_requests_reuse_one_connection(app, monkeypatch):
+    opened = []
+    new_conn = HTTPConnectionPool._new_conn
+    monkeypatch.setattr(HTTPConnectionPool, "_new_conn", lambda pool: opened.append(pool) or new_conn(pool))
+
+    with serve(contacts=2, messages=1) as servers:
+        for path in ("/contacts", "/contacts", "/conversation/1", "/contacts"):
+            assert app.make_request_with_retry(f"{servers.api_url}{path}").status_code == 200
+
+    assert len(opened) == 1
@@ -0,0 +1,36 @@
+import pytest
+
+from fake_backend import OPTIONAL_FEATURES, serve
+
+
+def last_messages(servers, phones):
+    return {p: servers.backend.data.conversations[p][-1]["message"] for p in phones}
+
+
+@pytest.mark.parametrize("features", [OPTIONAL_FEATURES, ()], ids=["batch", "legacy"])
+def test_summaries_show_each_contacts_last_message(app, monkeypatch, features):
+    with serve(contacts=3, messages=20, features=features) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        phones = [c["phone"] for c in servers.backend.data.contacts]
+
+        summaries = app.fetch_contact_summaries(phones)
+
+        assert {p: s["last_message"] for p, s in summaries.items()} == last_messages(servers, phones)
+        expected = {p: servers.backend._follow_up_count(p) for p in phones}
+        assert {p: s["follow_up_count"] for p, s in summaries.items()} == expected
+        assert all(s["follow_up_exact"] for s in summaries.values())
+
+
+def test_failed_conversation_loads_are_not_cached_as_empty(app, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(app.st, "warning", warnings.append)
+    with serve(contacts=3, messages=20, features=(), error_rate=1.0) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        phones = [c["phone"] for c in servers.backend.data.contacts]
+        # Found missing on an earlier rerun, so the per-contact fallback runs
+        app.get_api_shape().remember("contacts_summary", False)
+
+        assert app.fetch_contact_summaries(phones) == {}
+        assert app.get_summary_cache() == {}
+        assert app.get_read_cache().stats().get("conversation", {}).get("entries", 0) == 0
+        assert warnings == []
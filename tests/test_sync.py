@@ -0,0 +1,99 @@
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_backend import OPTIONAL_FEATURES, serve
+
+PHONE = "919000000000"
+
+
+@pytest.fixture(autouse=True)
+def uncached_polls(app, monkeypatch):
+    # Polls are cached for a couple of seconds; the tests poll back to back
+    monkeypatch.setitem(app.CACHE_TTLS, "conversation_poll", 0)
+
+
+def add_messages(servers, n: int):
+    data = servers.backend.data
+    conv = data.conversations[PHONE]
+    start = datetime.fromisoformat(conv[-1]["timestamp"])
+    with servers.backend.lock:
+        for i in range(n):
+            conv.append(data._message(PHONE, f"new {i}", "incoming", start + timedelta(minutes=i + 1)))
+
+
+def page_everything(app, store):
+    """Page back the way the chat view does until the store holds the whole history."""
+    for _ in range(100):
+        if store.complete:
+            return
+        app.ensure_older(store, PHONE, store.oldest().sort_key, app.OLDER_PAGE_SIZE)
+    pytest.fail("paging never reached the start of the conversation")
+
+
+@pytest.mark.parametrize("features", [OPTIONAL_FEATURES, ()], ids=["keyset", "legacy"])
+@pytest.mark.parametrize("resync", [False, True], ids=["poll", "resync"])
+def test_backlog_larger_than_a_page_leaves_no_gap(app, monkeypatch, features, resync):
+    with serve(contacts=1, messages=100, features=features) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        store = app.sync_conversation(PHONE, 50)
+        assert sorted(store.messages) == list(range(51, 101))
+
+        # Second poll, so the backend's handling of since_id is known
+        store.synced_at = 0
+        app.sync_conversation(PHONE, 50)
+
+        add_messages(servers, 120)
+        store.synced_at = 0
+        if resync:
+            store.full_synced_at -= app.SYNC_FULL_RESYNC + 1
+        app.sync_conversation(PHONE, 50)
+
+        ids = sorted(store.messages)
+        assert ids == list(range(ids[0], 221))
+
+        page_everything(app, store)
+        assert sorted(store.messages) == list(range(1, 221))
+
+
+def test_gap_that_cannot_be_joined_truncates_the_store(app, monkeypatch):
+    with serve(contacts=1, messages=100) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        store = app.sync_conversation(PHONE, 50)
+        store.complete = True
+
+        monkeypatch.setattr(app, "SYNC_GAP_MAX_PAGES", 1)
+        add_messages(servers, 300)
+        store.synced_at = 0
+        app.sync_conversation(PHONE, 50)
+
+        ids = sorted(store.messages)
+        assert ids == list(range(ids[0], 401))
+        assert ids[0] > 100 and not store.complete
+
+        page_everything(app, store)
+        assert sorted(store.messages) == list(range(1, 401))
+
+
+def test_hung_prefetch_does_not_block_paging(app, monkeypatch):
+    monkeypatch.setattr(app, "FANOUT_DEADLINE", 0.2)
+    with serve(contacts=1, messages=100) as servers:
+        monkeypatch.setattr(app, "API_BASE", servers.api_url)
+        store = app.sync_conversation(PHONE, 50)
+        oldest = store.oldest()
+        hung = Future()
+        store.prefetch = (oldest.sort_key, hung)
+
+        started = time.monotonic()
+        app.ensure_older(store, PHONE, oldest.sort_key, 50)
+        assert time.monotonic() - started < 1
+        assert sorted(store.messages) == list(range(51, 101))
+        assert store.prefetch == (oldest.sort_key, hung)
+
+        # Collected on a later rerun once it finishes
+        hung.set_result(app._fetch_older(PHONE, oldest, len(store.messages)))
+        app.ensure_older(store, PHONE, oldest.sort_key, 50)
+        assert sorted(store.messages) == list(range(1, 101))
+        assert store.prefetch is None
@@ -0,0 +1,31 @@
+import re
+from types import SimpleNamespace
+
+
+def test_both_themes_define_every_variable_the_stylesheet_uses(app):
+    dark, light = app.THEME_VARIABLES["dark"], app.THEME_VARIABLES["light"]
+    assert dark.keys() == light.keys()
+
+    used = set(re.findall(r"var\(--ami-([\w-]+)\)", app.get_css()))
+    assert used and used <= dark.keys()
+    assert ':root, :root[data-ami-theme="dark"]' in app.get_theme_variables_css()
+
+
+def test_session_is_marked_only_after_the_writer_reports_back(app, monkeypatch):
+    version = app.load_static_assets()["version"]
+    reported = [None, version]
+    mounts = []
+
+    def component(data, key, on_injected_change):
+        mounts.append(data)
+        return SimpleNamespace(injected=reported.pop(0))
+
+    monkeypatch.setattr(app, "get_stylesheet_component", lambda: component)
+
+    app.inject_stylesheet("light")          # sent, not yet run in the page
+    assert "css_injected" not in app.st.session_state
+    app.inject_stylesheet("light")          # the ack rerun
+    assert app.st.session_state.css_injected == version
+    app.inject_stylesheet("light")          # later reruns send nothing
+    assert len(mounts) == 2
+    assert mounts[0] == {"css": app.load_static_assets()["css"], "version": version, "theme": "light"}